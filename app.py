@@ -1,8 +1,12 @@
-from flaskr import create_app
+from flaskr import create_app, start_replay_scheduler
 
-app = create_app()
+if __name__ != "__mp_main__":
+    # Parse pool children re-import this file as __mp_main__ and need
+    # neither the app nor its scheduler.
+    app = create_app()
 
-app.secret_key = 'anything'
+    app.secret_key = 'anything'
 
 if __name__ == "__main__":
+    start_replay_scheduler(app)
     app.run(host="0.0.0.0", debug = False)
\ No newline at end of file
@@ -8,6 +8,7 @@ from flask_login import LoginManager
 from prometheus_flask_exporter import PrometheusMetrics
 import logging
 from .logger import init_logging
+from .scripts.parser import set_keep_packed_fields
 
 migrate = Migrate()
 login_manager = LoginManager()
@@ -22,6 +23,7 @@ log.addFilter(NoPrometheus())
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
+    set_keep_packed_fields(app.config.get("PARSER_KEEP_PACKED_FIELDS", True))
     
     init_logging(app) 
 
@@ -61,3 +63,14 @@ def create_app():
         return get_user_by_id(int(user_id))
 
     return app
+
+def start_replay_scheduler(app):
+    # Runs replay jobs (and the Loki spool drainer) inside the serving
+    # process in "thread" mode. Call it from the entry point only: parse
+    # pool children and worker.py also build the app and must not claim
+    # jobs. In "external" mode the web process only queues jobs and
+    # worker.py runs them.
+    if app.config.get("REPLAY_SCHEDULER_MODE", "thread") != "thread" or app.config.get("REPLAY_WORKERS", 0) <= 0:
+        return None
+    from .scripts.job_scheduler import init_scheduler
+    return init_scheduler(app)
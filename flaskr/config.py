@@ -27,4 +27,60 @@ class Config:
     #LOKi
     REPLAY_BATCH_SIZE = "1000"
     LOKI_REQUESTS_PER_SECOND = 10
-    REPLAY_DELAY=0.001
+    LOKI_RATE_ADAPTIVE = True
+    LOKI_RATE_MIN = 1
+    LOKI_RATE_MAX = 200
+    LOKI_RATE_INCREASE = 1
+    LOKI_LATENCY_TARGET_MS = 2000
+    LOKI_PUSH_WORKERS = 4
+    LOKI_PUSH_QUEUE_SIZE = 16
+    LOKI_CONNECTION_POOL_SIZE = 16
+    LOKI_PUSH_MAX_BYTES = 1024 * 1024
+    LOKI_PUSH_MAX_AGE_MS = 2000
+    LOKI_PUSH_GZIP = True
+    LOKI_SPOOL_ENABLED = True
+    LOKI_SPOOL_DIR = "loki_spool"
+    LOKI_SPOOL_SEGMENT_BYTES = 64 * 1024 * 1024
+    LOKI_SPOOL_MAX_BYTES = 2 * 1024 * 1024 * 1024
+    LOKI_SPOOL_FSYNC = False
+    LOKI_SPOOL_MAX_RETRY_SECONDS = 30
+    LOKI_SHARDS = []
+    LOKI_SHARD_FAILURE_THRESHOLD = 3
+    LOKI_SHARD_COOLDOWN_SECONDS = 5
+    LOKI_SHARD_MAX_COOLDOWN_SECONDS = 300
+    LOKI_SHARD_RETRIES = 1
+    REPLAY_DELAY=0
+    REPLAY_PACING_MODE = "fast"
+    REPLAY_PACING_RATE = 1
+    REPLAY_PACING_SLICE_MS = 100
+    REPLAY_READER = "mmap"
+    REPLAY_PARSE_WORKERS = 1
+    REPLAY_PARSE_CHUNK_BYTES = 64 * 1024 * 1024
+    REPLAY_PARSE_MODE = "line"
+    PARSER_KEEP_PACKED_FIELDS = True
+    REPLAY_PARSE_BLOCK_LINES = 65536
+    METRICS_FLUSH_LINES = 10000
+    METRICS_FLUSH_INTERVAL_MS = 1000
+    METRICS_MODE = "per_file"
+    METRICS_RUN_RETENTION_SECONDS = 3600
+    REPLAY_STAGE_SAMPLE_EVERY = 16
+    REPLAY_TIMESTAMP_MODE = "synthetic"
+    REPLAY_CACHE_ENABLED = True
+    REPLAY_CACHE_DIR = "replay_cache"
+    REPLAY_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+    FOLLOW_POLL_INTERVAL = 0.5
+    FOLLOW_FROM_START = True
+    REPLAY_CHECKPOINT_ENABLED = True
+    REPLAY_CHECKPOINT_DIR = "replay_checkpoints"
+    REPLAY_CHECKPOINT_INTERVAL = 30
+    REPLAY_SCHEDULER_MODE = "thread"
+    REPLAY_WORKERS = 2
+    REPLAY_WORKER_PROCESSES = 2
+    REPLAY_WORKER_METRICS_PORT = 9101
+    REPLAY_JOBS_PER_USER = 1
+    REPLAY_SCHEDULER_POLL_INTERVAL = 2
+    REPLAY_JOB_HEARTBEAT_SECONDS = 2
+    REPLAY_JOB_STALE_SECONDS = 120
+    REPLAY_JOB_AGING_SECONDS = 300
+    REPLAY_DEDUPE_ENABLED = True
+    REPLAY_DEDUPE_MAX_AGE_SECONDS = 86400
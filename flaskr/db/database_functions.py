@@ -1,5 +1,7 @@
 import logging
-from .models import db, Logs, User, Metadata
+import json
+import os
+from .models import db, Logs, User, Metadata, RunSummary, ReplayJob
 from sqlalchemy.exc import IntegrityError, OperationalError
 import datetime
 
@@ -26,6 +28,16 @@ def register_logs(username , filename , file_path , time) :
         logger.error(f"Unexpected DB error on log create : {e}")
         return None
 
+def set_log_content_hash(sno, content_hash):
+    try :
+        Logs.query.filter_by(sno=sno).update({"content_hash": content_hash})
+        db.session.commit()
+        return True
+    except Exception as e :
+        db.session.rollback()
+        logger.error(f"Unexpected DB error on log hash update : {e}")
+        return False
+
 def delete_logs(sno, username):
     log_file = Logs.query.filter_by(sno=sno, username=username).first()
     if log_file is None:
@@ -107,3 +119,223 @@ def save_metadata_to_db(username, filename , metadata_dict):
         logger.info("leaving")
         db.session.rollback()
         return False
+
+
+def save_run_summary(run_id, username, filename, scenario, summary, started_at=None):
+    run_summary = RunSummary(
+        run_id = run_id,
+        username = username,
+        filename = filename,
+        scenario = scenario,
+        lines_processed = summary.get("lines_processed", 0),
+        crc_fails = summary.get("crc_fails", 0),
+        tag_counts = json.dumps(summary.get("counts", {})),
+        started_at = started_at,
+        finished_at = datetime.datetime.now()
+    )
+    try :
+        db.session.add(run_summary)
+        db.session.commit()
+        return run_summary
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Unexpected DB error on run summary save : {e}")
+        return None
+
+def get_run_summaries_by_username(username):
+    return RunSummary.query.filter_by(username=username).order_by(RunSummary.finished_at.desc()).all()
+
+
+def create_replay_job(run_id, username, log_sno, filename, file_path, scenario, follow=False, resume=False, replay_delay=None,
+                      pacing_mode=None, pacing_rate=None, content_hash=None):
+    try :
+        file_size = 0 if follow else os.path.getsize(file_path)
+    except OSError :
+        file_size = 0
+    job = ReplayJob(
+        run_id = run_id,
+        username = username,
+        log_sno = log_sno,
+        filename = filename,
+        file_path = file_path,
+        file_size = file_size,
+        scenario = scenario,
+        follow = follow,
+        resume = resume,
+        replay_delay = replay_delay,
+        pacing_mode = pacing_mode,
+        pacing_rate = pacing_rate,
+        content_hash = content_hash,
+        status = "queued",
+        created_at = datetime.datetime.now()
+    )
+    try :
+        db.session.add(job)
+        db.session.commit()
+        return job
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Unexpected DB error on replay job create : {e}")
+        return None
+
+def find_reusable_replay_job(content_hash, scenario, max_age_seconds):
+    # The newest replay of the same content and scenario that is queued,
+    # running or finished successfully within max_age_seconds. Follow runs,
+    # paced runs and rows that are themselves attachments are never reused.
+    finished_after = datetime.datetime.now() - datetime.timedelta(seconds=max_age_seconds)
+    return ReplayJob.query.filter(
+        ReplayJob.content_hash == content_hash,
+        ReplayJob.scenario == scenario,
+        ReplayJob.follow == False,
+        ReplayJob.attached_to.is_(None),
+        db.or_(ReplayJob.pacing_mode.is_(None), ReplayJob.pacing_mode == "fast"),
+        db.or_(ReplayJob.replay_delay.is_(None), ReplayJob.replay_delay <= 0),
+        db.or_(ReplayJob.status.in_(("queued", "running")),
+               db.and_(ReplayJob.status == "done", ReplayJob.finished_at >= finished_after))
+    ).order_by(ReplayJob.sno.desc()).first()
+
+def attach_replay_job(source, username, log_sno, filename, file_path):
+    # Records a viewer that was pointed at source's run instead of starting
+    # a replay of its own; attached rows are never claimed by a scheduler.
+    # Opening the same file again reuses the viewer's existing row.
+    now = datetime.datetime.now()
+    job = ReplayJob.query.filter_by(attached_to=source.sno, username=username, log_sno=log_sno).first()
+    if job is not None :
+        job.created_at = now
+        db.session.commit()
+        return job
+    job = ReplayJob(
+        run_id = source.run_id,
+        username = username,
+        log_sno = log_sno,
+        filename = filename,
+        file_path = file_path,
+        file_size = source.file_size,
+        scenario = source.scenario,
+        content_hash = source.content_hash,
+        attached_to = source.sno,
+        status = "attached",
+        created_at = now,
+        started_at = now,
+        finished_at = now
+    )
+    try :
+        db.session.add(job)
+        db.session.commit()
+        return job
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Unexpected DB error on replay job attach : {e}")
+        return None
+
+def get_replay_jobs_by_sno(snos):
+    if not snos :
+        return {}
+    return {job.sno : job for job in ReplayJob.query.filter(ReplayJob.sno.in_(list(snos))).all()}
+
+def get_attached_viewers(snos):
+    # {source sno: [usernames attached to it]}
+    if not snos :
+        return {}
+    viewers = {}
+    for job in ReplayJob.query.filter(ReplayJob.attached_to.in_(list(snos))).order_by(ReplayJob.sno).all():
+        names = viewers.setdefault(job.attached_to, [])
+        if job.username not in names :
+            names.append(job.username)
+    return viewers
+
+def claim_next_replay_job(worker, follow, per_user_limit, aging_seconds):
+    # Smallest files first; a job's size is scaled down the longer it has
+    # waited so large files are not starved. The claim is a single UPDATE
+    # that re-checks the user's running count, so concurrent schedulers
+    # (threads or processes) cannot take the same job or exceed the limit.
+    queued = ReplayJob.query.filter_by(status="queued", follow=follow).all()
+    now = datetime.datetime.now()
+    def rank(job):
+        waited = max((now - job.created_at).total_seconds(), 0) if job.created_at else 0
+        return (job.file_size / (1 + waited / aging_seconds), job.sno)
+    for job in sorted(queued, key=rank):
+        sno = job.sno
+        try :
+            claimed = db.session.execute(db.text(
+                "UPDATE replay_job SET status = 'running', worker = :worker, started_at = :now, updated_at = :now "
+                "WHERE sno = :sno AND status = 'queued' AND (:follow OR (SELECT COUNT(*) FROM replay_job "
+                "WHERE username = :username AND status = 'running' AND follow = 0) < :limit)"),
+                {"worker": worker, "now": now, "sno": sno, "follow": bool(follow), "username": job.username, "limit": per_user_limit}).rowcount
+            db.session.commit()
+        except OperationalError as e:
+            db.session.rollback()
+            logger.warning(f"Could not claim replay job {sno}: {e}")
+            return None
+        if claimed :
+            db.session.expire_all()
+            return db.session.get(ReplayJob, sno)
+    return None
+
+def update_replay_job(sno, **fields):
+    try :
+        ReplayJob.query.filter_by(sno=sno).update(fields)
+        db.session.commit()
+        return True
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Unexpected DB error on replay job update : {e}")
+        return False
+
+def replay_job_cancel_requested(sno):
+    job = db.session.get(ReplayJob, sno)
+    return job is not None and job.cancel_requested
+
+def request_replay_job_cancel(sno, username):
+    job = ReplayJob.query.filter_by(sno=sno, username=username).first()
+    if job is None or job.status not in ("queued", "running"):
+        return False
+    try :
+        cancelled = ReplayJob.query.filter_by(sno=sno, status="queued").update(
+            {"status": "cancelled", "finished_at": datetime.datetime.now()})
+        if not cancelled :
+            # Already picked up by a scheduler, its heartbeat relays this.
+            ReplayJob.query.filter_by(sno=sno).update({"cancel_requested": True})
+        db.session.commit()
+        return True
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Unexpected DB error on replay job cancel : {e}")
+        return False
+
+def requeue_stale_replay_jobs(stale_before):
+    # Running jobs whose worker stopped sending heartbeats (killed, server
+    # restarted) go back to the queue and resume from their checkpoint;
+    # a follow job cannot be picked up again and is marked failed.
+    stale = ReplayJob.query.filter(ReplayJob.status == "running", ReplayJob.updated_at < stale_before).all()
+    for job in stale:
+        if job.follow :
+            job.status = "failed"
+            job.error = "Worker lost"
+            job.finished_at = datetime.datetime.now()
+        else :
+            job.status = "queued"
+            job.resume = True
+            job.worker = None
+            logger.warning(f"Requeued replay job {job.sno} (run {job.run_id}) after its worker stopped responding")
+    try :
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Unexpected DB error on replay job requeue : {e}")
+    return len(stale)
+
+def replay_job_active(run_id):
+    return ReplayJob.query.filter(ReplayJob.run_id == run_id, ReplayJob.status.in_(("queued", "running"))).first() is not None
+
+def get_active_replay_job(run_id, username):
+    return ReplayJob.query.filter(ReplayJob.run_id == run_id, ReplayJob.username == username,
+                                  ReplayJob.status.in_(("queued", "running"))).first()
+
+def get_active_follow_jobs(username):
+    jobs = ReplayJob.query.filter(ReplayJob.username == username, ReplayJob.follow == True,
+                                  ReplayJob.status.in_(("queued", "running"))).all()
+    return {job.filename : job.run_id for job in jobs}
+
+def get_replay_jobs_by_username(username, limit=20):
+    return ReplayJob.query.filter_by(username=username).order_by(ReplayJob.sno.desc()).limit(limit).all()
@@ -16,6 +16,7 @@ class Logs(db.Model):
     filename = db.Column(db.String(50), nullable = False, server_default = 'default_value', index = True)
     time = db.Column(db.String(100), nullable=True)
     filelocation = db.Column(db.String(500), nullable = False)
+    content_hash = db.Column(db.String(64), nullable=True, index = True)
     __table_args__ = (db.UniqueConstraint('username', 'filename', name='_user_filename_uc'),)
 
 class Metadata(db.Model):
@@ -26,4 +27,44 @@ class Metadata(db.Model):
     sector = db.Column(db.Integer)
     ue_id = db.Column(db.Integer)
     malperforming = db.Column(db.Boolean)
-    created_at = db.Column(db.DateTime, default=datetime.datetime.now())
\ No newline at end of file
+    created_at = db.Column(db.DateTime, default=datetime.datetime.now())
+
+class RunSummary(db.Model):
+    sno = db.Column(db.Integer, nullable = False, primary_key = True, autoincrement=True)
+    run_id = db.Column(db.String(100), nullable=True, index = True)
+    username = db.Column(db.String(250), nullable=False, index= True)
+    filename = db.Column(db.String(50), nullable = False, server_default = 'default_value', index = True)
+    scenario = db.Column(db.String(50), nullable=True)
+    lines_processed = db.Column(db.Integer, nullable = False, default = 0)
+    crc_fails = db.Column(db.Integer, nullable = False, default = 0)
+    tag_counts = db.Column(db.Text, nullable = True)
+    started_at = db.Column(db.DateTime, nullable = True)
+    finished_at = db.Column(db.DateTime, default=datetime.datetime.now)
+
+class ReplayJob(db.Model):
+    sno = db.Column(db.Integer, nullable = False, primary_key = True, autoincrement=True)
+    run_id = db.Column(db.Integer, nullable=False, index = True)
+    username = db.Column(db.String(250), nullable=False, index= True)
+    log_sno = db.Column(db.Integer, nullable = True)
+    filename = db.Column(db.String(50), nullable = False, server_default = 'default_value')
+    file_path = db.Column(db.String(500), nullable = False)
+    file_size = db.Column(db.BigInteger, nullable = False, default = 0)
+    scenario = db.Column(db.String(50), nullable=True)
+    follow = db.Column(db.Boolean, nullable = False, default = False)
+    resume = db.Column(db.Boolean, nullable = False, default = False)
+    replay_delay = db.Column(db.Float, nullable = True)
+    pacing_mode = db.Column(db.String(20), nullable = True)
+    pacing_rate = db.Column(db.Float, nullable = True)
+    content_hash = db.Column(db.String(64), nullable = True, index = True)
+    attached_to = db.Column(db.Integer, nullable = True, index = True)
+    status = db.Column(db.String(20), nullable = False, default = 'queued', index = True)
+    cancel_requested = db.Column(db.Boolean, nullable = False, default = False)
+    worker = db.Column(db.String(100), nullable = True)
+    progress = db.Column(db.Float, nullable = True)
+    lines_processed = db.Column(db.Integer, nullable = False, default = 0)
+    lines_per_second = db.Column(db.Float, nullable = True)
+    error = db.Column(db.Text, nullable = True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.now)
+    started_at = db.Column(db.DateTime, nullable = True)
+    updated_at = db.Column(db.DateTime, nullable = True)
+    finished_at = db.Column(db.DateTime, nullable = True)
@@ -1,5 +1,6 @@
 from flask import render_template, request, redirect, url_for, Blueprint , flash
-from flaskr.db.database_functions import register_logs,delete_logs
+from flaskr.db.database_functions import register_logs,delete_logs,set_log_content_hash
+from flaskr.scripts.parse_cache import save_with_digest
 import os
 from flask_login import login_required, current_user
 from datetime import datetime
@@ -30,7 +31,11 @@ def analyze():
                     file_path = os.path.join(UPLOAD_FOLDER,fname)
                     logFile = register_logs(username = username, filename = fname, file_path = file_path, time = formatted_time)
                     try:
-                        file.save(file_path)
+                        # Hashed while saved, so Analyze can find an
+                        # existing replay of the same content without
+                        # reading the file.
+                        content_hash = save_with_digest(file.stream, file_path)
+                        set_log_content_hash(logFile.sno, content_hash)
                     except Exception as e:
                         delete_logs(sno = logFile.sno, username= logFile.username)
                         logger.error(f"Error saving file {fname} for user : {username}")
@@ -2,17 +2,43 @@ import random
 from flask import Blueprint, render_template,request,flash, redirect , url_for,current_app
 from flask_login import login_required, current_user
 import os
-from flaskr.scripts.replay_worker import start_replay_thread
+from flaskr.scripts.replay_worker import active_follow_jobs, stop_follow_job, is_replay_running
+from flaskr.scripts.job_scheduler import submit_replay_job, cancel_replay_job, attach_to_existing_replay
+from flaskr.scripts.checkpoint import list_checkpoints
+from flaskr.scripts.pacing import PACING_MODES
+from flaskr.scripts.log_reader import header_time_range
 from flaskr.routes.grafana_sso import make_signed_token
 import time
 from flaskr.scripts.grafana_session_management import create_grafana_user_if_not_exists,make_grafana_url
-from flaskr.db.database_functions import get_logs_by_sno_username, delete_logs, get_logs_by_username
+from flaskr.db.database_functions import get_logs_by_sno_username, delete_logs, get_logs_by_username, get_replay_jobs_by_username, request_replay_job_cancel, replay_job_active, get_active_replay_job, get_active_follow_jobs, get_replay_jobs_by_sno, get_attached_viewers
 import logging
 
 UPLOAD_FOLDER = 'uploads'
 jobs_bp = Blueprint('jobs', __name__, template_folder='../templates')
 logger = logging.getLogger(__name__)
 
+def grafana_time_range(file_path):
+    # With absolute log timestamps the capture is usually outside the
+    # dashboard's default window, so open it on the capture's own range.
+    if current_app.config.get("REPLAY_TIMESTAMP_MODE", "synthetic") != "log":
+        return None
+    try:
+        first, last = header_time_range(file_path)
+    except OSError as e:
+        logger.warning(f"Could not read the time range of {file_path}: {e}")
+        return None
+    if first is None:
+        return None
+    return (first // 1_000_000 - 60_000, last // 1_000_000 + 60_000 if last is not None else "now")
+
+def reused_run_time_range(source, file_path):
+    time_range = grafana_time_range(file_path)
+    if time_range is None and source.status == "done" and source.started_at is not None:
+        # A finished run is no longer inside "the last few minutes"; its
+        # timeline started 20 minutes before the run did.
+        time_range = (int(source.started_at.timestamp() * 1000) - 25 * 60_000, "now")
+    return time_range
+
 @jobs_bp.route('/jobs',methods=['POST','GET'])
 @login_required
 def jobs():
@@ -32,7 +58,24 @@ def jobs():
             else :
                 flash("Error. Record not found", "error")
             return redirect(url_for("jobs.jobs"))    
-        elif 'analyze' in request.form:
+        elif 'stop_follow' in request.form:
+            run_id = request.form.get('run_id', type=int)
+            # The follow job may be running in this process or in worker.py.
+            job = get_active_replay_job(run_id, current_user.username)
+            if stop_follow_job(run_id, current_user.username) or (job is not None and request_replay_job_cancel(job.sno, current_user.username)):
+                flash("Follow job stopping", "success")
+            else:
+                flash("Error. Follow job not found", "error")
+            return redirect(url_for("jobs.jobs"))
+        elif 'cancel_job' in request.form:
+            job_sno = request.form.get('job_sno', type=int)
+            if request_replay_job_cancel(job_sno, current_user.username):
+                cancel_replay_job(job_sno)
+                flash("Replay job cancelling", "success")
+            else:
+                flash("Error. Job not found or already finished", "error")
+            return redirect(url_for("jobs.jobs"))
+        elif 'analyze' in request.form or 'follow' in request.form or 'resume' in request.form:
             log_file_id = request.form.get('SNo')
             log_file_owner = request.form.get('username')
             scenario = request.form.get('scenario')
@@ -44,37 +87,74 @@ def jobs():
             if not os.path.exists(file_path):
                 flash("Error. File not found on disk", "error")
                 return redirect(url_for("jobs.jobs"))
-            app_obj = current_app._get_current_object()
-            loki_url = app_obj.config.get("LOKI_PUSH_URL", "http://127.0.0.1:3100")
-            batch_size = int(app_obj.config.get("REPLAY_BATCH_SIZE", 2000))
-            replay_delay = float(request.form.get("replay_delay", app_obj.config.get("REPLAY_DELAY", 0)))
-            requests_per_second = app_obj.config.get("LOKI_REQUESTS_PER_SECOND", 5)
+            replay_delay = float(request.form.get("replay_delay", current_app.config.get("REPLAY_DELAY", 0)))
+            pacing_mode = request.form.get("pacing") or current_app.config.get("REPLAY_PACING_MODE", "fast")
+            pacing_rate = request.form.get("pacing_rate", type=float) or current_app.config.get("REPLAY_PACING_RATE", 1)
+            if pacing_mode not in PACING_MODES or (pacing_mode != "fast" and (pacing_rate is None or pacing_rate <= 0)):
+                flash("Error. Invalid playback speed", "error")
+                return redirect(url_for("jobs.jobs"))
        
             create_grafana_user_if_not_exists(current_user.username)   
                   
+            resume = 'resume' in request.form
+            follow = 'follow' in request.form
+            scenario = scenario if scenario else "4G_BASIC"
             try:
-                run_id = random.randint(10000,99999)
-                start_replay_thread(
-                    app=app_obj,
-                    log_sno=log_file.sno,
+                # Only plain replays are shared: follow runs never finish and
+                # a paced run is asked for to watch it play back. The hash
+                # is stored at upload (or by the first replay of older
+                # uploads); the request never reads the file itself.
+                dedupe = (current_app.config.get("REPLAY_DEDUPE_ENABLED", True) and not resume and not follow
+                          and pacing_mode == "fast")
+                content_hash = log_file.content_hash if dedupe else None
+                attached, source = (None, None)
+                if dedupe:
+                    attached, source = attach_to_existing_replay(current_user.username, log_file.sno, log_file.filename, file_path, scenario,
+                                                                 content_hash, current_app.config.get("REPLAY_DEDUPE_MAX_AGE_SECONDS", 86400))
+                if source is not None:
+                    token = make_signed_token(current_user.username)
+                    grafana_url = make_grafana_url(source.filename, token, scenario, source.run_id, reused_run_time_range(source, file_path))
+                    return render_template("grafana_open.html", url=grafana_url, return_url=url_for("jobs.jobs"))
+                if resume:
+                    run_id = request.form.get('run_id', type=int)
+                    if run_id is None or is_replay_running(run_id) or replay_job_active(run_id):
+                        flash("Error. Replay is already running", "error")
+                        return redirect(url_for("jobs.jobs"))
+                else:
+                    run_id = random.randint(10000,99999)
+                job = submit_replay_job(
+                    run_id = run_id,
                     username=current_user.username,
-                    file_path=file_path,
+                    log_sno=log_file.sno,
                     filename=log_file.filename,
-                    loki_url=loki_url,
-                    batch_size=batch_size,
+                    file_path=file_path,
+                    scenario = scenario,
+                    follow=follow,
+                    resume=resume,
                     replay_delay=replay_delay,
-                    scenario = scenario if scenario else "4G_BASIC",
-                    run_id = run_id,
-                    tenant=None,
-                    requests_per_second=requests_per_second
+                    pacing_mode=pacing_mode,
+                    pacing_rate=pacing_rate,
+                    content_hash=content_hash
                 )
+                if job is None:
+                    raise RuntimeError("could not queue the replay job")
                 token = make_signed_token(current_user.username)         
                 
-                grafana_url = make_grafana_url(log_file.filename,token,scenario,run_id)
+                time_range = None if follow else grafana_time_range(file_path)
+                grafana_url = make_grafana_url(log_file.filename,token,scenario,run_id,time_range)
                 return render_template("grafana_open.html", url=grafana_url, return_url=url_for("jobs.jobs"))
             except Exception as e:
                 flash(f"Failed to start replay/ Open Graph: {e}", "error")
             return redirect(url_for("jobs.jobs"))
     all_files = get_logs_by_username(current_user.username)
     all_files.reverse()
-    return render_template("jobs.html", all_jobs = all_files)
+    checkpoint_dir = current_app.config.get("REPLAY_CHECKPOINT_DIR", "replay_checkpoints")
+    interrupted = {name : checkpoint for name, checkpoint in list_checkpoints(checkpoint_dir, current_user.username).items()
+                   if not is_replay_running(checkpoint["run_id"]) and not replay_job_active(checkpoint["run_id"])}
+    replay_jobs = get_replay_jobs_by_username(current_user.username)
+    shared_from = get_replay_jobs_by_sno({job.attached_to for job in replay_jobs if job.attached_to is not None})
+    viewers = get_attached_viewers([job.sno for job in replay_jobs if job.attached_to is None])
+    following = get_active_follow_jobs(current_user.username)
+    following.update(active_follow_jobs(current_user.username))
+    return render_template("jobs.html", all_jobs = all_files, following = following, interrupted = interrupted,
+                           replay_jobs = replay_jobs, shared_from = shared_from, viewers = viewers)
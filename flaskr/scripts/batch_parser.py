@@ -0,0 +1,272 @@
+# flaskr/scripts/batch_parser.py
+import math
+from itertools import repeat
+import numpy as np
+from flaskr.scripts.metrics import process_label, TOTAL_CRC_FAILS
+from flaskr.scripts.parser import (LOG_LINE_RE, SCENARIO_TAG_HANDLERS, SCENARIO_TAG_PREFILTERS, convert_fields,
+                                   parse_timestamp_str, safe_log10, PackedPart, mod_1000_or_zero, div_1000_or_zero,
+                                   never_malperforming, dpp_crc_failed, umrc_crc_failed, cell_state_regressed,
+                                   match_tagged_log_line, process_schema_log)
+
+INT64_MIN = int(np.iinfo(np.int64).min)
+INT64_MAX = int(np.iinfo(np.int64).max)
+
+class LogColumnBatch:
+    # Columnar view of every line of one tag in a block: columns[name] is a
+    # NumPy array and valid[name] is False where the per-line parser would
+    # have produced None. exact is False when some field did not fit in
+    # int64, the per-line parser keeps those as Python ints.
+    def __init__(self, schema, line_numbers, columns, valid, exact=True):
+        self.schema = schema
+        self.tag = schema.tag
+        self.line_numbers = line_numbers
+        self.columns = columns
+        self.valid = valid
+        self.exact = exact
+
+    def __len__(self):
+        return len(self.line_numbers)
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+def vectorized_log10(values, valid):
+    # math.log10 per value: np.log10 can differ from safe_log10 in the last
+    # bit, and the records have to match the per-line parser exactly.
+    positive = valid & (values > 0)
+    out = np.full(values.shape, np.nan)
+    out[positive] = np.fromiter((10 * math.log10(float(v)) for v in values[positive].tolist()), dtype=np.float64, count=int(positive.sum()))
+    return out, positive
+
+def vectorized_mod_1000_or_zero(values, valid):
+    return np.where(valid, values % 1000, 0), np.ones(values.shape, dtype=bool)
+
+def vectorized_div_1000_or_zero(values, valid):
+    # Object array so missing values stay the int 0 div_1000_or_zero gives.
+    out = (values / 1000).astype(object)
+    out[~valid] = 0
+    return out, np.ones(values.shape, dtype=bool)
+
+def vectorized_packed_part(part, values, valid):
+    # Floor division and modulo on int64 match PackedPart on Python ints.
+    out = values // part.divisor
+    if part.modulus is not None:
+        out = out % part.modulus
+    return out, valid
+
+VECTORIZED_TRANSFORMS = {
+    safe_log10 : vectorized_log10,
+    mod_1000_or_zero : vectorized_mod_1000_or_zero,
+    div_1000_or_zero : vectorized_div_1000_or_zero,
+}
+
+def vectorized_never_malperforming(batch):
+    return np.zeros(len(batch), dtype=bool)
+
+def vectorized_dpp_crc_failed(batch):
+    return batch.valid["crc"] & (batch["crc"] == 1)
+
+def vectorized_umrc_crc_failed(batch):
+    return batch.valid["crc"] & (batch["crc"] == 0)
+
+def vectorized_cell_state_regressed(batch):
+    prev_state, u_state = batch["prev_state"], batch["u_state"]
+    both_valid = batch.valid["prev_state"] & batch.valid["u_state"]
+    return both_valid & ((prev_state > u_state) | (u_state == 8))
+
+VECTORIZED_MALPERFORMING = {
+    never_malperforming : vectorized_never_malperforming,
+    dpp_crc_failed : vectorized_dpp_crc_failed,
+    umrc_crc_failed : vectorized_umrc_crc_failed,
+    cell_state_regressed : vectorized_cell_state_regressed,
+}
+
+def parse_int_block(payloads, field_count):
+    # int() on every field, as convert_fields does; a blank, non-integer or
+    # out-of-range field anywhere sends the group down the row-wise path.
+    fields = ",".join(payloads).split(",")
+    try:
+        block = np.fromiter(map(int, fields), dtype=np.int64, count=len(fields))
+    except (ValueError, OverflowError):
+        return None
+    return block.reshape(len(payloads), field_count)
+
+def fill_rows_slow(payloads, rows, width, data, valid):
+    exact = True
+    for i in rows:
+        values = convert_fields(payloads[i].split(","), width)
+        for j, v in enumerate(values):
+            if v is None:
+                valid[i, j] = False
+            elif v < INT64_MIN or v > INT64_MAX:
+                valid[i, j] = False
+                exact = False
+            else:
+                data[i, j] = v
+    return exact
+
+def build_column_batch(schema, payloads, indexes, timestamps, line_numbers):
+    width = schema.width
+    n = len(payloads)
+    data = np.zeros((n, width), dtype=np.int64)
+    valid = np.ones((n, width), dtype=bool)
+    exact = True
+    # Rows with the same field count are converted together into one
+    # array; anything irregular falls back to convert_fields.
+    rows_by_field_count = {}
+    for i, payload in enumerate(payloads):
+        rows_by_field_count.setdefault(payload.count(",") + 1, []).append(i)
+    for field_count, rows in rows_by_field_count.items():
+        block = parse_int_block([payloads[i] for i in rows], field_count)
+        if block is None:
+            exact = fill_rows_slow(payloads, rows, width, data, valid) and exact
+            continue
+        take = min(field_count, width)
+        rows = np.array(rows, dtype=np.intp)
+        data[rows, :take] = block[:, :take]
+        valid[rows, take:] = False
+
+    n = len(payloads)
+    columns = {}
+    column_valid = {}
+    for spec in schema.columns:
+        if spec.kind == "index":
+            values, ok = np.array(indexes, dtype=np.int64), np.ones(n, dtype=bool)
+        elif spec.kind == "timestamp":
+            values, ok = np.array(timestamps, dtype=object), np.ones(n, dtype=bool)
+        elif spec.kind == "const":
+            if spec.value is None:
+                values, ok = np.zeros(n, dtype=np.int64), np.zeros(n, dtype=bool)
+            else:
+                values, ok = np.full(n, spec.value), np.ones(n, dtype=bool)
+        else:
+            values, ok = data[:, spec.value - 1], valid[:, spec.value - 1]
+            if isinstance(spec.transform, PackedPart):
+                values, ok = vectorized_packed_part(spec.transform, values, ok)
+            elif spec.transform is not None:
+                vectorized = VECTORIZED_TRANSFORMS.get(spec.transform)
+                if vectorized is not None:
+                    values, ok = vectorized(values, ok)
+                else:
+                    transformed = [spec.transform(v if k else None) for v, k in zip(values.tolist(), ok.tolist())]
+                    values = np.array(transformed, dtype=object)
+                    ok = np.array([v is not None for v in transformed], dtype=bool)
+        columns[spec.name] = values
+        column_valid[spec.name] = ok
+    return LogColumnBatch(schema, np.array(line_numbers, dtype=np.int64), columns, column_valid, exact)
+
+def parse_log_block(lines, scenario, line_index=None):
+    handlers = SCENARIO_TAG_HANDLERS.get(scenario)
+    if handlers is None:
+        return {}
+    markers = SCENARIO_TAG_PREFILTERS[scenario]
+    if line_index is None:
+        line_index = [0] * (max(column_index for _, column_index in handlers.values()) + 1)
+    match = LOG_LINE_RE.match
+    pending = {}
+    for line_number, raw_line in enumerate(lines):
+        for marker in markers:
+            if marker in raw_line:
+                break
+        else:
+            continue
+        log_match = match(raw_line)
+        if log_match is None:
+            continue
+        tag = log_match.group("tag")
+        handler = handlers.get(tag)
+        if handler is None:
+            continue
+        column_index = handler[1]
+        rows = pending.get(tag)
+        if rows is None:
+            rows = pending[tag] = ([], [], [], [])
+        rows[0].append(log_match.group("csv_payload"))
+        rows[1].append(line_index[column_index])
+        rows[2].append(parse_timestamp_str(log_match.group("date"), log_match.group("time")))
+        rows[3].append(line_number)
+        line_index[column_index] += 1
+    return {tag : build_column_batch(handlers[tag][0], *rows) for tag, rows in pending.items()}
+
+def malperforming_mask(batch):
+    return VECTORIZED_MALPERFORMING[batch.schema.malperforming](batch)
+
+def nullable_list(batch, name):
+    return [v if ok else None for v, ok in zip(batch[name].tolist(), batch.valid[name].tolist())]
+
+def update_metadata_dict(batches, metadata_dict):
+    # Tags can share a metadata key (all PCELL_STATE_* map to
+    # PCELL_STATE_TAG), so replay the updates in original line order.
+    line_numbers, keys, flags = [], [], []
+    for batch in batches.values():
+        line_numbers.append(batch.line_numbers)
+        keys.extend(zip(repeat(str(batch["tag"][0])), nullable_list(batch, "sector_id"), nullable_list(batch, batch.schema.ue_field)))
+        flags.extend(malperforming_mask(batch).tolist())
+    if not keys:
+        return metadata_dict
+    order = np.argsort(np.concatenate(line_numbers), kind="stable")
+    metadata_dict.update((keys[i], flags[i]) for i in order.tolist())
+    return metadata_dict
+
+def sector_counts(batch, mask=None):
+    # Rows per raw sector_id (None where it was missing), for mask rows only.
+    if mask is None:
+        mask = np.ones(len(batch), dtype=bool)
+    sector_valid = batch.valid["sector_id"]
+    counts = {}
+    sectors, n = np.unique(batch["sector_id"][mask & sector_valid], return_counts=True)
+    counts.update(zip(sectors.tolist(), n.tolist()))
+    unknown = int(np.count_nonzero(mask & ~sector_valid))
+    if unknown:
+        counts[None] = unknown
+    return counts
+
+def crc_fail_counts(batch):
+    if not batch.schema.counts_crc_fails or not len(batch):
+        return {}
+    counts = {}
+    for sector, n in sector_counts(batch, malperforming_mask(batch)).items():
+        label = process_label(sector)
+        counts[label] = counts.get(label, 0) + n
+    return counts
+
+def batch_records(batch):
+    # The per-line LogRecords of a batch, in the batch's row order.
+    columns = [nullable_list(batch, name) for name in batch.schema.record_type.fields]
+    return [batch.schema.record_type(list(values)) for values in zip(*columns)]
+
+def count_batch(batch, username, filename, metrics=None):
+    counts = [(batch.schema.counter, sector_counts(batch))]
+    if batch.schema.counts_crc_fails:
+        counts.append((TOTAL_CRC_FAILS, sector_counts(batch, malperforming_mask(batch))))
+    for counter, per_sector in counts:
+        for sector, n in per_sector.items():
+            if metrics is not None:
+                metrics.count(counter, sector, n)
+            else:
+                counter.labels(user = username, filename= filename, sector_id=process_label(sector)).inc(n)
+
+def parse_block_records(username, filename, lines, scenario, line_index, metadata_dict, metrics=None):
+    # Yields the same records, and leaves the same line_index, metadata_dict
+    # and tag/CRC counts, as parse_scenario over each line (lines themselves
+    # are counted by the caller). line_index moves as records are yielded,
+    # like the per-line path, since synthetic timestamps are read off it.
+    # A block holding a field beyond int64 is parsed line by line.
+    batches = parse_log_block(lines, scenario, list(line_index))
+    if not all(batch.exact for batch in batches.values()):
+        for raw_line in lines:
+            matched = match_tagged_log_line(raw_line, scenario)
+            if matched is not None:
+                schema, column_index, log_match = matched
+                yield process_schema_log(schema, username, filename, log_match, line_index, column_index, metadata_dict, metrics)
+        return
+    update_metadata_dict(batches, metadata_dict)
+    handlers = SCENARIO_TAG_HANDLERS[scenario]
+    numbered = []
+    for tag, batch in batches.items():
+        count_batch(batch, username, filename, metrics)
+        numbered.extend(zip(batch.line_numbers.tolist(), repeat(handlers[tag][1]), batch_records(batch)))
+    numbered.sort(key=lambda item: item[0])
+    for _, column_index, record in numbered:
+        line_index[column_index] += 1
+        yield record
@@ -0,0 +1,235 @@
+# flaskr/scripts/checkpoint.py
+import os
+import json
+import time
+import threading
+import hashlib
+import logging
+from flaskr.scripts.parser import LogRecord
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_VERSION = 2
+
+def checkpoint_base(checkpoint_dir, username, filename, scenario, run_id):
+    # One sidecar per run: runs of the same file must not share one.
+    name = hashlib.sha1(f"{username}\0{filename}\0{scenario}\0{run_id}".encode()).hexdigest()
+    return os.path.join(checkpoint_dir, name)
+
+def stream_key(stream_labels):
+    return f'{stream_labels["tag"]}|{stream_labels["sector_id"]}'
+
+def plain_record(record):
+    return record.to_dict() if isinstance(record, LogRecord) else record
+
+def file_signature(file_path):
+    st = os.stat(file_path)
+    return [st.st_size, st.st_mtime_ns]
+
+def read_acks(acks_path):
+    # Each line is [stream key, entries sent on that stream so far]; a torn
+    # last line from a crash mid-write is ignored.
+    acked = {}
+    try:
+        with open(acks_path) as fh:
+            for line in fh:
+                try:
+                    key, count = json.loads(line)
+                except ValueError:
+                    continue
+                acked[key] = max(acked.get(key, 0), count)
+    except FileNotFoundError:
+        pass
+    return acked
+
+def load_checkpoint(checkpoint_dir, username, filename, scenario, file_path, run_id):
+    base = checkpoint_base(checkpoint_dir, username, filename, scenario, run_id)
+    try:
+        with open(base + ".json") as fh:
+            state = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    if state.get("version") != CHECKPOINT_VERSION:
+        return None
+    try:
+        if state["file_signature"] != file_signature(file_path):
+            logger.warning(f"Discarding checkpoint for {username}/{filename}: file changed since it was written")
+            return None
+    except OSError:
+        return None
+    state["acked"] = read_acks(base + ".acks")
+    return state
+
+def list_checkpoints(checkpoint_dir, username):
+    # {filename: {"run_id", "scenario", "progress"}} of interrupted replays.
+    found = {}
+    if not os.path.isdir(checkpoint_dir):
+        return found
+    for name in os.listdir(checkpoint_dir):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(checkpoint_dir, name)) as fh:
+                state = json.load(fh)
+        except (OSError, ValueError):
+            continue
+        if state.get("version") != CHECKPOINT_VERSION or state.get("username") != username:
+            continue
+        # Offsets of compressed uploads count decompressed bytes, hence the cap.
+        size = state["file_signature"][0] or 1
+        found[state["filename"]] = {
+            "run_id": state["run_id"],
+            "scenario": state["scenario"],
+            "progress": min(100, int(state["offset"] * 100 / size)),
+        }
+    return found
+
+class ReplayCheckpointer:
+    # Takes a snapshot of the worker's state every `interval` seconds: the
+    # byte offset after the last consumed line, line_index, the PB pending
+    # queue, metadata_dict, the entry clock and every batch not yet handed
+    # to the pipeline. Batches submitted before a snapshot may still be in
+    # the pushers, so it is written to a sidecar JSON file by flush() once
+    # they are all acknowledged, without holding the parser up. Pushes
+    # acknowledged after that checkpoint are appended to a small .acks file,
+    # so a resumed run can drop entries Loki already accepted.
+    def __init__(self, checkpoint_dir, username, filename, scenario, file_path, run_id, start_ns, interval=30, state=None):
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        self.base = checkpoint_base(checkpoint_dir, username, filename, scenario, run_id)
+        self.username = username
+        self.filename = filename
+        self.scenario = scenario
+        self.file_path = file_path
+        self.run_id = run_id
+        self.start_ns = start_ns
+        self.interval = float(interval)
+        # A fresh run checkpoints on its first record, so the .acks file
+        # always has a checkpoint to be read against.
+        self.last_saved = time.monotonic() if state else float("-inf")
+        self.sent = dict(state["sent"]) if state else {}
+        # Entries per stream handed to the pipeline or dropped as acknowledged;
+        # a snapshot's "sent" once its batches are acknowledged.
+        self.queued = dict(self.sent)
+        self.next_batch = 0
+        self.unacked = set()
+        # (state JSON, its "sent", first batch after it) of the snapshot
+        # waiting to be written.
+        self.pending = None
+        self.skip = {}
+        if state:
+            for key, count in state["acked"].items():
+                if count > self.sent.get(key, 0):
+                    self.skip[key] = count - self.sent.get(key, 0)
+        self.acks = open(self.base + ".acks", "a")
+        # acknowledge() runs in the pusher threads.
+        self.lock = threading.Lock()
+
+    def drop_acked(self, stream_labels, entries):
+        key = stream_key(stream_labels)
+        with self.lock:
+            skip = self.skip.get(key, 0)
+            if not skip:
+                return entries
+            dropped = min(skip, len(entries))
+            self.skip[key] = skip - dropped
+            self.sent[key] = self.sent.get(key, 0) + dropped
+            self.queued[key] = self.queued.get(key, 0) + dropped
+        return entries[dropped:]
+
+    def submitted(self, stream_labels, count):
+        # Returns the batch number to acknowledge the batch with.
+        key = stream_key(stream_labels)
+        with self.lock:
+            batch = self.next_batch
+            self.next_batch += 1
+            self.unacked.add(batch)
+            self.queued[key] = self.queued.get(key, 0) + count
+        return batch
+
+    def acknowledge(self, stream_labels, count, batch):
+        key = stream_key(stream_labels)
+        with self.lock:
+            self.unacked.discard(batch)
+            self.sent[key] = self.sent.get(key, 0) + count
+            self.acks.write(json.dumps([key, self.sent[key]]) + "\n")
+            self.acks.flush()
+
+    def due(self):
+        return self.pending is None and time.monotonic() - self.last_saved >= self.interval
+
+    def save(self, offset, line_index, pb_pending_queue, metadata_dict, label_batches, total_sent, clock=None, cached=False):
+        # cached marks the snapshot a replay from the parse cache takes before
+        # its first push; a resumed run streams the cache again.
+        with self.lock:
+            sent = dict(self.queued)
+            first_after = self.next_batch
+        state = {
+            "version": CHECKPOINT_VERSION,
+            "run_id": self.run_id,
+            "username": self.username,
+            "filename": self.filename,
+            "scenario": self.scenario,
+            "file_signature": file_signature(self.file_path),
+            "start_ns": self.start_ns,
+            "offset": offset,
+            "line_index": list(line_index),
+            "pb_pending_queue": [[list(key), plain_record(entry)] for key, entry in pb_pending_queue.items()],
+            "metadata": [[tag, sector, ue_id, flag] for (tag, sector, ue_id), flag in metadata_dict.items()],
+            "label_batches": [[batch_info["labels"], [[ts, plain_record(entry)] for ts, entry in batch_info["values"]]]
+                              for batch_info in label_batches.values()],
+            "sent": sent,
+            "total_sent": total_sent,
+            "timestamp_mode": clock.mode if clock is not None else "synthetic",
+            "clock": clock.state() if clock is not None else None,
+            "cached": cached,
+        }
+        # Serialized now, the worker keeps changing the records.
+        data = json.dumps(state)
+        with self.lock:
+            self.pending = (data, sent, first_after)
+            self.last_saved = time.monotonic()
+        self.flush()
+
+    def flush(self):
+        # Writes the pending snapshot once no batch submitted before it is
+        # waiting for Loki.
+        with self.lock:
+            if self.pending is None:
+                return
+            data, sent, first_after = self.pending
+            if self.unacked and min(self.unacked) < first_after:
+                return
+            self.pending = None
+            tmp_path = self.base + ".json.tmp"
+            with open(tmp_path, "w") as fh:
+                fh.write(data)
+                fh.flush()
+                os.fsync(fh.fileno())
+            os.replace(tmp_path, self.base + ".json")
+            # Only acknowledgements of batches after the snapshot are news to it.
+            self.acks.close()
+            self.acks = open(self.base + ".acks", "w")
+            for key, count in self.sent.items():
+                if count > sent.get(key, 0):
+                    self.acks.write(json.dumps([key, count]) + "\n")
+            self.acks.flush()
+
+    def close(self):
+        self.acks.close()
+
+    def complete(self):
+        self.acks.close()
+        for suffix in (".json", ".acks"):
+            try:
+                os.remove(self.base + suffix)
+            except FileNotFoundError:
+                pass
+
+def restore_worker_state(state):
+    # Inverse of ReplayCheckpointer.save for the worker's in-memory state.
+    pb_pending_queue = {tuple(key) : entry for key, entry in state["pb_pending_queue"]}
+    metadata_dict = {(tag, sector, ue_id) : flag for tag, sector, ue_id, flag in state["metadata"]}
+    label_batches = {}
+    for labels, values in state["label_batches"]:
+        label_batches[tuple(sorted(labels.items()))] = {"labels": labels, "values": values}
+    return list(state["line_index"]), pb_pending_queue, metadata_dict, label_batches
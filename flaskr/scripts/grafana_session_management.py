@@ -113,7 +113,8 @@ def silent_login(username):
         logger.error(f"Login error for {username}: {e}")
         return False
     
-def make_grafana_url(filename, token, scenario,run_id):
+def make_grafana_url(filename, token, scenario,run_id, time_range=None):
+    # time_range is an optional (from, to) in epoch milliseconds.
     app_obj = current_app._get_current_object()
     grafana_host = app_obj.config.get("GRAFANA_HOST", "http://107.99.46.66:8080")
     ts = int(time.time() * 1000)
@@ -138,4 +139,6 @@ def make_grafana_url(filename, token, scenario,run_id):
         f"&kiosk=tv"                
         f"&__session={session_id}"
     )
+    if time_range is not None:
+        grafana_url += f"&from={time_range[0]}&to={time_range[1]}"
     return grafana_url
\ No newline at end of file
@@ -0,0 +1,250 @@
+# flaskr/scripts/job_scheduler.py
+import os
+import socket
+import logging
+import datetime
+import threading
+from flaskr.scripts.replay_worker import replay_file_worker, register_replay, open_loki_spool
+from flaskr.scripts.parse_cache import content_digest
+from flaskr.db.database_functions import (create_replay_job, claim_next_replay_job, update_replay_job, replay_job_cancel_requested,
+                                          requeue_stale_replay_jobs, find_reusable_replay_job, attach_replay_job, set_log_content_hash)
+
+logger = logging.getLogger(__name__)
+
+class JobHandle:
+    # Shared between a running replay and the scheduler's heartbeat: the
+    # worker fills in lines/position, the heartbeat writes them to the job
+    # row and relays a cancel request from the jobs page to cancel_event.
+    def __init__(self, sno, run_id, size, cancel_event):
+        self.sno = sno
+        self.run_id = run_id
+        self.size = size
+        self.cancel_event = cancel_event
+        self.lines = 0
+        self.position = None
+        self.error = None
+        self.requeue = False
+        self.started = datetime.datetime.now()
+
+    def progress(self):
+        if self.position is None or not self.size:
+            return None
+        # Compressed uploads count decompressed bytes, hence the cap.
+        return min(100.0, self.position * 100.0 / self.size)
+
+class ReplayScheduler:
+    # Runs queued replay jobs from the ReplayJob table on a fixed number of
+    # worker threads, at most per_user_limit at a time for any one user and
+    # smallest files first. Follow jobs never finish on their own, so each
+    # gets its own thread instead of a worker slot. A monitor thread writes
+    # heartbeats and progress for the running jobs, relays cancel requests
+    # and requeues jobs whose worker stopped sending heartbeats.
+    def __init__(self, app, workers=2, per_user_limit=1, poll_interval=2.0, heartbeat_interval=2.0, stale_seconds=120, aging_seconds=300):
+        self.app = app
+        self.workers = max(int(workers), 1)
+        self.per_user_limit = max(int(per_user_limit), 1)
+        self.poll_interval = float(poll_interval)
+        self.heartbeat_interval = float(heartbeat_interval)
+        self.stale_seconds = float(stale_seconds)
+        self.aging_seconds = float(aging_seconds)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.wakeup = threading.Condition()
+        self.running = {}
+        self.running_lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.threads = []
+        self.follow_threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            t = threading.Thread(target=self.work, name=f"replay-worker-{i}", daemon=True)
+            t.start()
+            self.threads.append(t)
+        t = threading.Thread(target=self.monitor, name="replay-monitor", daemon=True)
+        t.start()
+        self.threads.append(t)
+        logger.info(f"Replay scheduler started with {self.workers} workers, {self.per_user_limit} job(s) per user")
+
+    def stop(self):
+        self.stopping.set()
+        with self.wakeup:
+            self.wakeup.notify_all()
+
+    def shutdown(self, timeout=60):
+        # Stops claiming and aborts the running replays; they go back to
+        # the queue and resume from their checkpoint on the next worker.
+        self.stop()
+        with self.running_lock:
+            handles = list(self.running.values())
+        for handle in handles:
+            handle.requeue = True
+            handle.cancel_event.set()
+        for t in self.threads + self.follow_threads:
+            t.join(timeout)
+
+    def notify(self):
+        with self.wakeup:
+            self.wakeup.notify_all()
+
+    def claim(self, follow):
+        with self.app.app_context():
+            return claim_next_replay_job(self.worker_id, follow, self.per_user_limit, self.aging_seconds)
+
+    def work(self):
+        while not self.stopping.is_set():
+            try:
+                job = self.claim(follow=False)
+            except Exception as e:
+                logger.error(f"Replay scheduler could not claim a job: {e}")
+                job = None
+            if job is None:
+                with self.wakeup:
+                    self.wakeup.wait(self.poll_interval)
+                continue
+            self.run(job)
+
+    def run(self, job):
+        stop_event = register_replay(job.run_id, job.username, job.filename, job.follow)
+        handle = JobHandle(job.sno, job.run_id, job.file_size, stop_event or threading.Event())
+        with self.running_lock:
+            self.running[job.sno] = handle
+        logger.info(f"Replay job {job.sno} (run {job.run_id}) started for {job.username}/{job.filename}")
+        outcome = "failed"
+        try:
+            if job.content_hash is None and not job.follow:
+                self.backfill_content_hash(job)
+            outcome = replay_file_worker(self.app, job.log_sno, job.username, job.file_path, job.filename,
+                                         replay_delay=job.replay_delay, scenario=job.scenario, run_id=job.run_id,
+                                         stop_event=stop_event, resume=job.resume, job=handle,
+                                         pacing_mode=job.pacing_mode, pacing_rate=job.pacing_rate)
+        except Exception as e:
+            handle.error = str(e)
+            logger.error(f"Replay job {job.sno} crashed: {e}")
+        finally:
+            with self.running_lock:
+                self.running.pop(job.sno, None)
+            fields = self.progress_fields(handle)
+            fields.update({"status": outcome, "error": handle.error, "finished_at": datetime.datetime.now()})
+            if outcome == "done" and not job.follow:
+                fields["progress"] = 100.0
+            if handle.requeue:
+                if job.follow:
+                    fields.update({"status": "cancelled", "error": "Worker shut down"})
+                elif outcome != "done":
+                    fields.update({"status": "queued", "resume": True, "worker": None, "error": None, "finished_at": None})
+            with self.app.app_context():
+                update_replay_job(job.sno, **fields)
+            self.notify()
+
+    def backfill_content_hash(self, job):
+        # Uploads from before hashes were stored at upload time: hash here,
+        # off the request path (the replay's cache key reuses the digest),
+        # so later Analyze requests for the same content can attach.
+        content_hash = replay_content_hash(job.file_path)
+        if content_hash is None:
+            return
+        with self.app.app_context():
+            update_replay_job(job.sno, content_hash=content_hash)
+            if job.log_sno is not None:
+                set_log_content_hash(job.log_sno, content_hash)
+
+    def progress_fields(self, handle):
+        now = datetime.datetime.now()
+        elapsed = (now - handle.started).total_seconds()
+        return {
+            "progress": handle.progress(),
+            "lines_processed": handle.lines,
+            "lines_per_second": handle.lines / elapsed if elapsed > 0 else None,
+            "updated_at": now,
+        }
+
+    def monitor(self):
+        while not self.stopping.wait(self.heartbeat_interval):
+            try:
+                with self.app.app_context():
+                    self.heartbeat()
+                    stale_before = datetime.datetime.now() - datetime.timedelta(seconds=self.stale_seconds)
+                    if requeue_stale_replay_jobs(stale_before):
+                        self.notify()
+                    follow_job = claim_next_replay_job(self.worker_id, True, self.per_user_limit, self.aging_seconds)
+                if follow_job is not None:
+                    t = threading.Thread(target=self.run, args=(follow_job,), name=f"replay-follow-{follow_job.sno}", daemon=True)
+                    t.start()
+                    self.follow_threads = [f for f in self.follow_threads if f.is_alive()] + [t]
+            except Exception as e:
+                logger.error(f"Replay scheduler monitor error: {e}")
+
+    def heartbeat(self):
+        with self.running_lock:
+            handles = list(self.running.values())
+        for handle in handles:
+            update_replay_job(handle.sno, **self.progress_fields(handle))
+            if replay_job_cancel_requested(handle.sno):
+                handle.cancel_event.set()
+
+    def cancel(self, sno):
+        # Immediate cancel for a job running in this process; the database
+        # flag set by the route covers jobs running elsewhere.
+        with self.running_lock:
+            handle = self.running.get(sno)
+        if handle is not None:
+            handle.cancel_event.set()
+
+SCHEDULER = None
+
+def init_scheduler(app):
+    global SCHEDULER
+    if SCHEDULER is None:
+        SCHEDULER = ReplayScheduler(app,
+                                    workers=app.config.get("REPLAY_WORKERS", 2),
+                                    per_user_limit=app.config.get("REPLAY_JOBS_PER_USER", 1),
+                                    poll_interval=app.config.get("REPLAY_SCHEDULER_POLL_INTERVAL", 2),
+                                    heartbeat_interval=app.config.get("REPLAY_JOB_HEARTBEAT_SECONDS", 2),
+                                    stale_seconds=app.config.get("REPLAY_JOB_STALE_SECONDS", 120),
+                                    aging_seconds=app.config.get("REPLAY_JOB_AGING_SECONDS", 300))
+        SCHEDULER.start()
+        try:
+            # Payloads spooled before a restart are sent without waiting
+            # for the next replay.
+            open_loki_spool(app)
+        except OSError as e:
+            logger.error(f"Could not open the Loki spool: {e}")
+    return SCHEDULER
+
+def replay_content_hash(file_path):
+    try :
+        return content_digest(file_path)
+    except OSError as e :
+        logger.warning(f"Could not hash {file_path}: {e}")
+        return None
+
+def attach_to_existing_replay(username, log_sno, filename, file_path, scenario, content_hash, max_age_seconds):
+    # When the same content is already being replayed (or was, recently)
+    # under the same scenario, the new viewer gets that run instead of a
+    # second parse and a second copy of the data in Loki. Returns
+    # (attached job, source job), or (None, None) to start a new replay.
+    # Must be called inside an app context.
+    if content_hash is None :
+        return None, None
+    source = find_reusable_replay_job(content_hash, scenario, max_age_seconds)
+    if source is None :
+        return None, None
+    attached = attach_replay_job(source, username, log_sno, filename, file_path)
+    if attached is None :
+        return None, None
+    logger.info(f"{username}/{filename} attached to replay run {source.run_id} of {source.username}/{source.filename}")
+    return attached, source
+
+def submit_replay_job(run_id, username, log_sno, filename, file_path, scenario, follow=False, resume=False, replay_delay=None,
+                      pacing_mode=None, pacing_rate=None, content_hash=None):
+    # Must be called inside an app context.
+    job = create_replay_job(run_id, username, log_sno, filename, file_path, scenario,
+                            follow=follow, resume=resume, replay_delay=replay_delay,
+                            pacing_mode=pacing_mode, pacing_rate=pacing_rate, content_hash=content_hash)
+    if job is not None and SCHEDULER is not None:
+        SCHEDULER.notify()
+    return job
+
+def cancel_replay_job(sno):
+    if SCHEDULER is not None:
+        SCHEDULER.cancel(sno)
@@ -0,0 +1,273 @@
+# flaskr/scripts/log_reader.py
+import mmap
+import os
+import bz2
+import gzip
+import lzma
+from flaskr.scripts.parser import LOG_LINE_RE, parse_timestamp_str, timestamp_str_to_ns
+
+# Uploads are recognised by content rather than extension. The openers read
+# multi-member gzip, multi-stream bzip2 and concatenated xz files to the end.
+COMPRESSED_MAGIC = (
+    (b"\x1f\x8b", gzip.open),
+    (b"\xfd7zXZ\x00", lzma.open),
+    (b"BZh", bz2.open),
+)
+
+def compressed_opener(file_path):
+    with open(file_path, "rb") as fh:
+        head = fh.read(6)
+    for magic, opener in COMPRESSED_MAGIC:
+        if head.startswith(magic):
+            if opener is bz2.open and not head[3:4].isdigit():
+                continue
+            return opener
+    return None
+
+def open_marked_reader(file_path, markers, start=0):
+    opener = compressed_opener(file_path)
+    if opener is None:
+        return MappedLogReader(file_path, markers, start=start)
+    return CompressedLogReader(file_path, markers, opener, start=start)
+
+def split_line_ranges(file_path, chunk_bytes):
+    # Cut the file into (start, end) byte ranges of roughly chunk_bytes,
+    # each ending just after a newline so no line spans two ranges.
+    size = os.path.getsize(file_path)
+    ranges = []
+    start = 0
+    with open(file_path, "rb") as fh:
+        while start < size:
+            end = start + max(int(chunk_bytes), 1)
+            if end >= size:
+                end = size
+            else:
+                fh.seek(end)
+                fh.readline()
+                end = min(fh.tell(), size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+def header_times(data):
+    times = []
+    for raw_line in data.decode("utf-8", errors="replace").splitlines():
+        log_match = LOG_LINE_RE.match(raw_line)
+        if log_match:
+            ns = timestamp_str_to_ns(parse_timestamp_str(log_match.group("date"), log_match.group("time")))
+            if ns is not None:
+                times.append(ns)
+    return times
+
+def header_time_range(file_path, probe_bytes=1024 * 1024):
+    # (first, last) header time in ns from the first and last probe_bytes of
+    # the upload, for the dashboard time range. Compressed uploads are only
+    # probed at the front, so last is None for them, as is anything not found.
+    opener = compressed_opener(file_path)
+    with (opener or open)(file_path, "rb") as fh:
+        head = header_times(fh.read(probe_bytes))
+        tail = []
+        if opener is None:
+            size = os.fstat(fh.fileno()).st_size
+            if size > probe_bytes:
+                fh.seek(size - probe_bytes)
+                tail = header_times(fh.read(probe_bytes))
+    first = min(head) if head else None
+    last = max(tail or head) if (tail or head) else None
+    if opener is not None:
+        last = None
+    return first, last
+
+class TextLogReader:
+    # Plain line-by-line reader, every line is decoded and handed to the parser.
+    # opener decompresses on the fly (gzip.open, lzma.open, bz2.open).
+    def __init__(self, file_path, opener=None):
+        self.file_path = file_path
+        self.opener = opener
+        self.lines_skipped = 0
+
+    def __iter__(self):
+        opener = self.opener or open
+        with opener(self.file_path, "rt", errors="replace") as fh:
+            for raw_line in fh:
+                yield None, raw_line.rstrip("\n")
+
+class MappedLogReader:
+    # Memory-maps the upload and searches it for the scenario's tag markers
+    # at the bytes level. Only lines containing a marker are decoded and
+    # yielded as (byte offset of the line, line); every other line is just
+    # counted in lines_skipped. start/end restrict the scan to a
+    # newline-aligned byte range of the file. position is the byte offset
+    # just past the last line handed out, where a later scan can resume.
+    def __init__(self, file_path, markers, encoding="utf-8", start=0, end=None):
+        self.file_path = file_path
+        self.markers = [m.encode(encoding) for m in markers]
+        self.encoding = encoding
+        self.start = start
+        self.end = end
+        self.lines_skipped = 0
+        self.position = start
+
+    def __iter__(self):
+        with open(self.file_path, "rb") as fh:
+            if os.fstat(fh.fileno()).st_size == 0:
+                return
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if hasattr(mmap, "MADV_SEQUENTIAL"):
+                    mm.madvise(mmap.MADV_SEQUENTIAL)
+                yield from self.scan(mm, self.start, self.end)
+
+    def scan(self, mm, start, end, base=0):
+        # mm is any bytes-like buffer; base is its offset in the whole input.
+        size = len(mm) if end is None else min(end, len(mm))
+        markers = self.markers
+        pos = start
+        next_hits = [mm.find(marker, pos, size) for marker in markers]
+        while True:
+            hit = min((h for h in next_hits if h >= 0), default=-1)
+            if hit < 0:
+                break
+            newline = mm.rfind(b"\n", pos, hit)
+            line_start = newline + 1 if newline >= 0 else pos
+            line_end = mm.find(b"\n", hit, size)
+            next_pos = size if line_end < 0 else line_end + 1
+            if line_end < 0:
+                line_end = size
+            if line_start > pos:
+                self.lines_skipped += mm[pos:line_start].count(b"\n")
+            raw_line = mm[line_start:line_end]
+            if raw_line.endswith(b"\r"):
+                raw_line = raw_line[:-1]
+            pos = next_pos
+            self.position = base + pos
+            yield base + line_start, raw_line.decode(self.encoding, errors="replace")
+            for i, h in enumerate(next_hits):
+                if 0 <= h < pos:
+                    next_hits[i] = mm.find(markers[i], pos, size)
+        if pos < size:
+            tail = mm[pos:size]
+            self.lines_skipped += tail.count(b"\n") + (0 if tail.endswith(b"\n") else 1)
+        self.position = base + size
+
+class CompressedLogReader(MappedLogReader):
+    # Streams a compressed upload through its decompressor without a temp
+    # file, in blocks cut at the last newline, and runs the same marker scan
+    # on each block. Offsets and position count decompressed bytes, so a
+    # resume from start has to decompress and discard everything before it.
+    def __init__(self, file_path, markers, opener, encoding="utf-8", start=0, block_bytes=4 * 1024 * 1024):
+        super().__init__(file_path, markers, encoding=encoding, start=start)
+        self.opener = opener
+        self.block_bytes = block_bytes
+
+    def __iter__(self):
+        with self.opener(self.file_path, "rb") as stream:
+            base = 0
+            while base < self.start:
+                skipped = stream.read(min(self.block_bytes, self.start - base))
+                if not skipped:
+                    return
+                base += len(skipped)
+            carry = b""
+            while True:
+                chunk = stream.read(self.block_bytes)
+                if not chunk:
+                    break
+                buf = carry + chunk if carry else chunk
+                cut = buf.rfind(b"\n") + 1
+                if cut == 0:
+                    carry = buf
+                    continue
+                block, carry = buf[:cut], buf[cut:]
+                yield from self.scan(block, 0, None, base)
+                base += len(block)
+            if carry:
+                yield from self.scan(carry, 0, None, base)
+
+class FollowLogReader:
+    # Tails a growing log like `tail -F`. path may be a file or a directory,
+    # in which case the newest file in it is followed and the reader moves on
+    # when a newer one appears. Rotation (the path now points at a different
+    # inode) and truncation are detected at EOF. Yields (None, line) for each
+    # complete line and (None, None) whenever it has caught up and is about
+    # to wait, so the caller can flush. Stops once stop_event is set.
+    def __init__(self, path, stop_event, poll_interval=0.5, from_start=True, encoding="utf-8", read_bytes=1024 * 1024):
+        self.path = path
+        self.stop_event = stop_event
+        self.poll_interval = poll_interval
+        self.from_start = from_start
+        self.encoding = encoding
+        self.read_bytes = read_bytes
+        self.lines_skipped = 0
+        self.current_path = None
+
+    def resolve(self):
+        if not os.path.isdir(self.path):
+            return self.path if os.path.isfile(self.path) else None
+        newest = None
+        for entry in os.scandir(self.path):
+            if entry.name.startswith(".") or not entry.is_file():
+                continue
+            mtime = entry.stat().st_mtime
+            if newest is None or mtime > newest[0]:
+                newest = (mtime, entry.path)
+        return newest[1] if newest else None
+
+    def decode(self, raw_line):
+        if raw_line.endswith(b"\r"):
+            raw_line = raw_line[:-1]
+        return raw_line.decode(self.encoding, errors="replace")
+
+    def switched(self, fh):
+        # True when the followed file was rotated away or replaced.
+        latest = self.resolve()
+        if latest is None:
+            return False
+        if latest != self.current_path:
+            return True
+        try:
+            return os.stat(latest).st_ino != os.fstat(fh.fileno()).st_ino
+        except FileNotFoundError:
+            return False
+
+    def __iter__(self):
+        fh = None
+        pending = b""
+        seek_end = not self.from_start
+        try:
+            while not self.stop_event.is_set():
+                if fh is None:
+                    self.current_path = self.resolve()
+                    if self.current_path is None:
+                        yield None, None
+                        self.stop_event.wait(self.poll_interval)
+                        continue
+                    fh = open(self.current_path, "rb")
+                    if seek_end:
+                        fh.seek(0, os.SEEK_END)
+                        seek_end = False
+                chunk = fh.read(self.read_bytes)
+                if chunk:
+                    lines = (pending + chunk).split(b"\n")
+                    pending = lines.pop()
+                    for raw_line in lines:
+                        yield None, self.decode(raw_line)
+                    continue
+                if self.switched(fh):
+                    # The old file is complete, a trailing partial line is final.
+                    if pending:
+                        yield None, self.decode(pending)
+                        pending = b""
+                    fh.close()
+                    fh = None
+                    continue
+                if os.fstat(fh.fileno()).st_size < fh.tell():
+                    # Truncated in place (copytruncate rotation).
+                    fh.seek(0)
+                    pending = b""
+                    continue
+                yield None, None
+                self.stop_event.wait(self.poll_interval)
+        finally:
+            if fh is not None:
+                fh.close()
+
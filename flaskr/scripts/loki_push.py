@@ -0,0 +1,219 @@
+# flaskr/scripts/loki_push.py
+import time
+import queue
+import logging
+import threading
+from collections import OrderedDict
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+LOKI_SESSIONS = {}
+LOKI_SESSIONS_LOCK = threading.Lock()
+
+def loki_session(loki_url, pool_size=16):
+    # One keep-alive Session per Loki endpoint, shared by every replay, so
+    # pushes reuse pooled connections instead of paying TCP setup each time.
+    base = loki_url.rstrip("/")
+    with LOKI_SESSIONS_LOCK:
+        session = LOKI_SESSIONS.get(base)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=int(pool_size))
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            LOKI_SESSIONS[base] = session
+        return session
+
+class AdaptiveRateLimiter:
+    # Token bucket shared by every replay pushing to one Loki endpoint.
+    # Tokens are handed out round-robin between the runs that are waiting,
+    # so concurrent runs get an equal share however many pushers each has.
+    # The rate adapts AIMD-style: it is halved on a 429 and cut by 10% when
+    # responses are slower than latency_target, at most once per cooldown,
+    # and otherwise grows by `increase` requests/s every second.
+    def __init__(self, rate, min_rate=1, max_rate=200, latency_target=2.0, increase=1.0, cooldown=1.0, adaptive=True):
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max_rate)
+        self.rate = min(max(float(rate), self.min_rate), self.max_rate)
+        self.latency_target = float(latency_target)
+        self.increase = float(increase)
+        self.cooldown = float(cooldown)
+        self.adaptive = adaptive
+        self.cond = threading.Condition()
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.last_decrease = float("-inf")
+        self.waiting = OrderedDict()
+
+    def refill(self, now):
+        # Burst is capped at one token so a backlog cannot exceed the rate.
+        self.tokens = min(1.0, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, client):
+        with self.cond:
+            self.waiting[client] = self.waiting.get(client, 0) + 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self.refill(now)
+                    if self.tokens >= 1.0 and next(iter(self.waiting)) == client:
+                        self.tokens -= 1.0
+                        return
+                    self.cond.wait(max((1.0 - self.tokens) / self.rate, 0.001))
+            finally:
+                self.waiting[client] -= 1
+                if self.waiting[client]:
+                    self.waiting.move_to_end(client)
+                else:
+                    del self.waiting[client]
+                self.cond.notify_all()
+
+    def record(self, latency, throttled=False):
+        if not self.adaptive:
+            return
+        with self.cond:
+            now = time.monotonic()
+            if throttled or latency > self.latency_target:
+                if now - self.last_decrease >= self.cooldown:
+                    self.refill(now)
+                    self.rate = max(self.min_rate, self.rate * (0.5 if throttled else 0.9))
+                    self.last_decrease = now
+                    logger.info(f"Loki push rate lowered to {self.rate:.1f}/s ({'429' if throttled else f'latency {latency:.2f}s'})")
+            elif self.rate < self.max_rate:
+                self.refill(now)
+                self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+class RateLimitClient:
+    # One run's handle on its endpoint's shared limiter.
+    def __init__(self, limiter, client):
+        self.limiter = limiter
+        self.client = client
+
+    def wait_if_needed(self):
+        self.limiter.acquire(self.client)
+
+    def record(self, latency, throttled=False):
+        self.limiter.record(latency, throttled)
+
+LOKI_RATE_LIMITERS = {}
+
+def loki_rate_limiter(loki_url, rate, **options):
+    # The first run to push to an endpoint seeds its limiter; later runs
+    # share it and its learned rate.
+    base = loki_url.rstrip("/")
+    with LOKI_SESSIONS_LOCK:
+        limiter = LOKI_RATE_LIMITERS.get(base)
+        if limiter is None:
+            limiter = LOKI_RATE_LIMITERS[base] = AdaptiveRateLimiter(rate, **options)
+        return limiter
+
+class PushPipeline:
+    # Decouples parsing from pushing. Batches are handed to a pool of pusher
+    # threads through bounded queues; a full queue blocks submit(), so a slow
+    # Loki slows the parser down instead of piling batches up in memory.
+    # Every stream is pinned to one pusher, which keeps its entries in order
+    # as Loki requires. Batches bound for the same pusher are packed into one
+    # multi-stream payload until it holds max_bytes of entries or its oldest
+    # batch is max_age seconds old. send(streams) pushes a list of
+    # (stream_labels, values); each on_sent given to submit() runs in the
+    # pusher once its payload was accepted. The first push error stops the
+    # pipeline and is raised to the producer.
+    def __init__(self, send, workers=4, queue_size=16, max_bytes=1024 * 1024, max_age=2.0):
+        self.send = send
+        self.queues = [queue.Queue(maxsize=max(int(queue_size), 1)) for _ in range(max(int(workers), 1))]
+        self.max_bytes = int(max_bytes)
+        self.max_age = float(max_age)
+        self.streams = {}
+        self.pending = [None] * len(self.queues)
+        self.error = None
+        self.cancelled = False
+        self.threads = []
+        for q in self.queues:
+            t = threading.Thread(target=self.run, args=(q,), daemon=True)
+            t.start()
+            self.threads.append(t)
+
+    def run(self, q):
+        while True:
+            item = q.get()
+            try:
+                if item is None:
+                    return
+                if self.error is not None or self.cancelled:
+                    continue
+                self.send([(stream_labels, values) for stream_labels, values, _ in item.values()])
+                for _, _, callbacks in item.values():
+                    for on_sent in callbacks:
+                        on_sent()
+            except Exception as e:
+                if self.error is None:
+                    self.error = e
+            finally:
+                q.task_done()
+
+    def check(self):
+        if self.error is not None:
+            raise self.error
+
+    def submit(self, stream_labels, values, on_sent=None):
+        self.check()
+        key = tuple(sorted(stream_labels.items()))
+        index = self.streams.get(key)
+        if index is None:
+            index = self.streams[key] = len(self.streams) % len(self.queues)
+        payload = self.pending[index]
+        if payload is None:
+            # [streams by key, approximate body size, time of first batch]
+            payload = self.pending[index] = [{}, 0, time.monotonic()]
+        stream = payload[0].get(key)
+        if stream is None:
+            stream = payload[0][key] = (stream_labels, [], [])
+            payload[1] += 64 + sum(len(k) + len(v) for k, v in key)
+        stream[1].extend(values)
+        if on_sent is not None:
+            stream[2].append(on_sent)
+        payload[1] += sum(len(ts) + len(line) + 8 for ts, line in values)
+        if payload[1] >= self.max_bytes:
+            self.dispatch(index)
+
+    def dispatch(self, index):
+        payload = self.pending[index]
+        if payload is not None:
+            self.pending[index] = None
+            self.queues[index].put(payload[0])
+
+    def flush(self, max_age=None):
+        # Queues every pending payload, or only those older than max_age.
+        now = time.monotonic()
+        for index, payload in enumerate(self.pending):
+            if payload is not None and (max_age is None or now - payload[2] >= max_age):
+                self.dispatch(index)
+        self.check()
+
+    def backlog(self):
+        # Payloads waiting for a pusher, not counting the ones being packed.
+        return sum(q.qsize() for q in self.queues)
+
+    def drain(self):
+        # Waits until every submitted batch has been pushed.
+        self.flush()
+        for q in self.queues:
+            q.join()
+        self.check()
+
+    def close(self, cancel=False):
+        # cancel drops whatever is still queued, for runs that already failed.
+        self.cancelled = self.cancelled or cancel
+        if not self.cancelled:
+            self.flush()
+        if self.threads:
+            for q in self.queues:
+                q.put(None)
+            for t in self.threads:
+                t.join()
+            self.threads = []
+        if not cancel:
+            self.check()
@@ -0,0 +1,139 @@
+# flaskr/scripts/loki_shards.py
+import time
+import bisect
+import hashlib
+import logging
+import threading
+from flaskr.scripts.loki_spool import retryable
+from flaskr.scripts.metrics import LOKI_SHARD_HEALTHY, LOKI_SHARD_FAILOVERS
+
+logger = logging.getLogger(__name__)
+
+def hash_key(key):
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+def shard_key(stream_labels):
+    # Streams are placed by run, tag and sector: a run's streams spread
+    # over every shard while each stream stays on one.
+    return f"{stream_labels.get('run_id')}|{stream_labels.get('tag')}|{stream_labels.get('sector_id')}"
+
+class LokiShard:
+    # One Loki endpoint/tenant pair and its health. After failure_threshold
+    # consecutive failed pushes it is skipped for cooldown seconds, doubled
+    # on every further failure up to max_cooldown; once the cooldown is
+    # over the next push tries it again and a success makes it healthy.
+    def __init__(self, url, tenant=None, failure_threshold=3, cooldown=5.0, max_cooldown=300.0):
+        self.url = url
+        self.tenant = tenant
+        self.name = url.rstrip("/") + (f"/{tenant}" if tenant else "")
+        self.failure_threshold = max(int(failure_threshold), 1)
+        self.cooldown = float(cooldown)
+        self.max_cooldown = float(max_cooldown)
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.down_until = 0.0
+        LOKI_SHARD_HEALTHY.labels(shard=self.name).set(1)
+
+    def healthy(self):
+        return time.monotonic() >= self.down_until
+
+    def record_success(self):
+        with self.lock:
+            if self.failures >= self.failure_threshold:
+                logger.info(f"Loki shard {self.name} is healthy again")
+            self.failures = 0
+            self.down_until = 0.0
+        LOKI_SHARD_HEALTHY.labels(shard=self.name).set(1)
+
+    def record_failure(self, error):
+        with self.lock:
+            self.failures += 1
+            if self.failures < self.failure_threshold:
+                return
+            wait = min(self.cooldown * 2 ** (self.failures - self.failure_threshold), self.max_cooldown)
+            self.down_until = time.monotonic() + wait
+        logger.warning(f"Loki shard {self.name} marked down for {wait:.0f}s: {error}")
+        LOKI_SHARD_HEALTHY.labels(shard=self.name).set(0)
+
+def healthy_first(shards):
+    return [shard for shard in shards if shard.healthy()] + [shard for shard in shards if not shard.healthy()]
+
+class LokiShardSet:
+    # Consistent-hash ring over the shards with `replicas` points each, so
+    # adding or removing a shard only moves the streams on its arcs.
+    # route(key) lists the shards in ring order from the key's point: the
+    # first is the stream's home shard and the rest its failover order.
+    # Shards that are down go to the back, so traffic moves to the next
+    # healthy shard and returns home once it recovers.
+    def __init__(self, shards, replicas=128):
+        self.shards = list(shards)
+        ring = sorted((hash_key(f"{shard.name}#{i}"), index) for index, shard in enumerate(self.shards) for i in range(replicas))
+        self.hashes = [h for h, _ in ring]
+        self.points = [index for _, index in ring]
+        self.orders = {}
+
+    def order(self, point):
+        # Orders only depend on where on the ring the key falls, so there
+        # are at most len(points) of them.
+        start = bisect.bisect(self.hashes, point) % len(self.points)
+        order = self.orders.get(start)
+        if order is None:
+            order = []
+            for i in range(len(self.points)):
+                index = self.points[(start + i) % len(self.points)]
+                if index not in order:
+                    order.append(index)
+                    if len(order) == len(self.shards):
+                        break
+            self.orders[start] = order
+        return order
+
+    def route(self, key):
+        return healthy_first([self.shards[index] for index in self.order(hash_key(key))])
+
+    def route_from(self, url, tenant):
+        # Failover order for a payload spooled for url/tenant: that shard,
+        # then the others in ring order.
+        for shard in self.shards:
+            if shard.url == url and shard.tenant == tenant:
+                return healthy_first([shard] + [other for other in self.route(shard.name) if other is not shard])
+        return self.route(f"{url}|{tenant}")
+
+    def post(self, route, attempt):
+        # attempt(shard, last) pushes to one shard, last is True for the
+        # final candidate. Retryable failures fail over to the next shard;
+        # returns the shard that took the payload.
+        error = None
+        for i, shard in enumerate(route):
+            try:
+                attempt(shard, i == len(route) - 1)
+            except Exception as e:
+                if not retryable(e):
+                    raise
+                shard.record_failure(e)
+                error = e
+                if i < len(route) - 1:
+                    LOKI_SHARD_FAILOVERS.labels(shard=shard.name).inc()
+                continue
+            shard.record_success()
+            return shard
+        raise error
+
+LOKI_SHARD_SETS = {}
+LOKI_SHARD_SETS_LOCK = threading.Lock()
+
+def loki_shard_set(specs, default_url, default_tenant=None, **options):
+    # specs: LOKI_SHARDS entries, each a URL or a {"url", "tenant"} dict;
+    # a missing url or tenant falls back to the defaults. The set and its
+    # health are shared by every run in the process.
+    shards = []
+    for spec in specs:
+        if isinstance(spec, str):
+            spec = {"url": spec}
+        shards.append((spec.get("url") or default_url, spec.get("tenant", default_tenant)))
+    key = tuple(shards)
+    with LOKI_SHARD_SETS_LOCK:
+        shard_set = LOKI_SHARD_SETS.get(key)
+        if shard_set is None:
+            shard_set = LOKI_SHARD_SETS[key] = LokiShardSet([LokiShard(url, tenant, **options) for url, tenant in shards])
+        return shard_set
@@ -0,0 +1,335 @@
+# flaskr/scripts/loki_spool.py
+import os
+import json
+import fcntl
+import logging
+import threading
+from collections import deque
+import requests
+from flaskr.scripts.metrics import LOKI_SPOOL_BYTES, LOKI_SPOOL_BACKLOG, LOKI_SPOOL_DEFERRED
+
+logger = logging.getLogger(__name__)
+
+class LokiSpoolFull(Exception):
+    pass
+
+def retryable(e):
+    # Connection errors, timeouts, 429 and 5xx are worth sending again
+    # later; any other rejection (a malformed or too old payload) never is.
+    if not isinstance(e, requests.exceptions.RequestException):
+        return False
+    status = getattr(getattr(e, "response", None), "status_code", None)
+    return status is None or status == 429 or status >= 500
+
+def read_segment(path):
+    # [(header, body offset)] of every complete record; a record cut short
+    # by a crash is truncated away.
+    records = []
+    with open(path, "r+b") as fh:
+        size = os.fstat(fh.fileno()).st_size
+        while True:
+            start = fh.tell()
+            line = fh.readline()
+            if not line:
+                break
+            try:
+                header = json.loads(line)
+                end = fh.tell() + header["size"]
+            except (ValueError, KeyError, TypeError):
+                end = size + 1
+            if end > size:
+                logger.warning(f"Truncating torn record at byte {start} of {path}")
+                fh.truncate(start)
+                break
+            records.append((header, end - header["size"]))
+            fh.seek(end)
+    return records
+
+def read_acks(path):
+    try:
+        with open(path) as fh:
+            return {int(line) for line in fh if line.strip().isdigit()}
+    except FileNotFoundError:
+        return set()
+
+def segment_names(directory):
+    return sorted(name[:-4] for name in os.listdir(directory) if name.endswith(".seg"))
+
+class LokiSpool:
+    # Write-ahead spool of Loki payloads in one directory. push() appends a
+    # payload to the active segment file before posting it and acknowledges
+    # it once Loki accepted it. When a post fails with a retryable error the
+    # payload stays in the spool and a drainer thread sends it again, in
+    # spool order, once Loki is back. Until the drainer has caught up new
+    # payloads are only appended, so no stream's entries overtake the ones
+    # still spooled and parsing is not held up by the outage. A segment is
+    # deleted once every payload in it is acknowledged; payloads left behind
+    # by an earlier process are drained first. resend(url, tenant, body,
+    # compressed) posts a spooled payload.
+    def __init__(self, directory, resend, segment_bytes=64 * 1024 * 1024, max_bytes=2 * 1024 ** 3, fsync=False,
+                 retry_interval=1.0, max_retry_interval=30.0):
+        self.directory = directory
+        self.resend = resend
+        self.segment_bytes = int(segment_bytes)
+        self.max_bytes = int(max_bytes)
+        self.fsync = fsync
+        self.retry_interval = float(retry_interval)
+        self.max_retry_interval = float(max_retry_interval)
+        self.cond = threading.Condition()
+        # name -> {"unacked": count, "size": bytes, "acks": open ack file or None}
+        self.segments = {}
+        # seq -> (segment name, body offset, header) of unacknowledged payloads
+        self.records = {}
+        self.backlog = deque()
+        self.degraded = False
+        self.active = None
+        self.active_fh = None
+        self.next_seq = 0
+        self.bytes = 0
+        self.stopped = threading.Event()
+        os.makedirs(directory, exist_ok=True)
+        self.recover()
+        self.thread = threading.Thread(target=self.drain, name="loki-spool-drainer", daemon=True)
+        self.thread.start()
+
+    def path(self, name, suffix):
+        return os.path.join(self.directory, name + suffix)
+
+    def recover(self):
+        for name in segment_names(self.directory):
+            acked = read_acks(self.path(name, ".ack"))
+            records = read_segment(self.path(name, ".seg"))
+            self.segments[name] = {"unacked": 0, "size": os.path.getsize(self.path(name, ".seg")), "acks": None}
+            self.bytes += self.segments[name]["size"]
+            for header, offset in records:
+                self.next_seq = max(self.next_seq, header["seq"] + 1)
+                if header["seq"] not in acked:
+                    self.records[header["seq"]] = (name, offset, header)
+                    self.segments[name]["unacked"] += 1
+                    self.backlog.append(header["seq"])
+            self.remove_if_acked(name)
+        if self.backlog:
+            self.degraded = True
+            logger.info(f"Loki spool {self.directory}: {len(self.backlog)} payloads left to send")
+        self.report()
+
+    def adopt(self, directory):
+        # Takes over the unacknowledged payloads of a spool whose process is
+        # gone; they go behind this spool's own backlog, in their order.
+        # Each one is acknowledged in the old spool once it is in this one,
+        # so whatever is left there after a crash or a full spool is only
+        # what was not moved.
+        moved = 0
+        try:
+            for name in segment_names(directory):
+                seg_path = os.path.join(directory, name + ".seg")
+                ack_path = os.path.join(directory, name + ".ack")
+                acked = read_acks(ack_path)
+                with open(seg_path, "rb") as fh, open(ack_path, "a") as acks:
+                    for header, offset in read_segment(seg_path):
+                        if header["seq"] in acked:
+                            continue
+                        fh.seek(offset)
+                        body = fh.read(header["size"])
+                        with self.cond:
+                            self.defer(self.append(header["url"], header["tenant"], body, header["gzip"]))
+                            self.degraded = True
+                        acks.write(f"{header['seq']}\n")
+                        acks.flush()
+                        if self.fsync:
+                            os.fsync(acks.fileno())
+                        moved += 1
+                os.remove(seg_path)
+                os.remove(ack_path)
+        except LokiSpoolFull as e:
+            logger.error(f"Stopped adopting Loki spool {directory}, the rest stays there: {e}")
+        if moved:
+            logger.info(f"Loki spool {self.directory} adopted {moved} payloads from {directory}")
+
+    def append(self, url, tenant, body, compressed):
+        # Called with self.cond held.
+        if self.bytes + len(body) > self.max_bytes:
+            raise LokiSpoolFull(f"Loki spool {self.directory} is full ({self.bytes} bytes)")
+        if self.active is None or self.segments[self.active]["size"] >= self.segment_bytes:
+            self.roll()
+        seq = self.next_seq
+        self.next_seq += 1
+        header = {"seq": seq, "url": url, "tenant": tenant, "gzip": compressed, "size": len(body)}
+        line = (json.dumps(header) + "\n").encode("utf-8")
+        offset = self.segments[self.active]["size"] + len(line)
+        self.active_fh.write(line)
+        self.active_fh.write(body)
+        self.active_fh.flush()
+        if self.fsync:
+            os.fsync(self.active_fh.fileno())
+        segment = self.segments[self.active]
+        segment["unacked"] += 1
+        segment["size"] += len(line) + len(body)
+        self.bytes += len(line) + len(body)
+        self.records[seq] = (self.active, offset, header)
+        return seq
+
+    def roll(self):
+        previous = self.active
+        if self.active_fh is not None:
+            self.active_fh.close()
+        self.active = f"{self.next_seq:012d}"
+        self.active_fh = open(self.path(self.active, ".seg"), "ab")
+        self.segments[self.active] = {"unacked": 0, "size": 0, "acks": None}
+        if previous is not None:
+            self.remove_if_acked(previous)
+
+    def remove_if_acked(self, name):
+        segment = self.segments[name]
+        if segment["unacked"] or name == self.active:
+            return
+        if segment["acks"] is not None:
+            segment["acks"].close()
+        for suffix in (".seg", ".ack"):
+            if os.path.exists(self.path(name, suffix)):
+                os.remove(self.path(name, suffix))
+        self.bytes -= segment["size"]
+        del self.segments[name]
+
+    def acknowledge(self, seq):
+        with self.cond:
+            name, _, _ = self.records.pop(seq)
+            segment = self.segments[name]
+            segment["unacked"] -= 1
+            if segment["unacked"] or name == self.active:
+                if segment["acks"] is None:
+                    segment["acks"] = open(self.path(name, ".ack"), "a")
+                segment["acks"].write(f"{seq}\n")
+                segment["acks"].flush()
+            else:
+                self.remove_if_acked(name)
+            self.report()
+
+    def defer(self, seq):
+        # Called with self.cond held.
+        self.backlog.append(seq)
+        LOKI_SPOOL_DEFERRED.inc()
+        self.report()
+        self.cond.notify_all()
+
+    def report(self):
+        LOKI_SPOOL_BYTES.set(self.bytes)
+        LOKI_SPOOL_BACKLOG.set(len(self.backlog))
+
+    def pending(self):
+        with self.cond:
+            return len(self.backlog)
+
+    def push(self, url, tenant, body, compressed, post):
+        # post() sends body directly. Returns once the payload is accepted by
+        # Loki or safely spooled; errors that a retry cannot fix are raised.
+        with self.cond:
+            seq = self.append(url, tenant, body, compressed)
+            if self.degraded:
+                self.defer(seq)
+                return
+        try:
+            post()
+        except Exception as e:
+            if not retryable(e):
+                self.acknowledge(seq)
+                raise
+            with self.cond:
+                if not self.degraded:
+                    logger.warning(f"Loki push failed, spooling payloads until it recovers: {e}")
+                self.degraded = True
+                self.defer(seq)
+            return
+        self.acknowledge(seq)
+
+    def drain(self):
+        delay = self.retry_interval
+        while True:
+            with self.cond:
+                while not self.backlog and not self.stopped.is_set():
+                    self.cond.wait()
+                if self.stopped.is_set():
+                    return
+                seq = self.backlog[0]
+                name, offset, header = self.records[seq]
+            try:
+                with open(self.path(name, ".seg"), "rb") as fh:
+                    fh.seek(offset)
+                    body = fh.read(header["size"])
+                self.resend(header["url"], header["tenant"], body, header["gzip"])
+            except Exception as e:
+                if retryable(e):
+                    logger.warning(f"Loki spool resend failed, retrying in {delay:.0f}s: {e}")
+                    if self.stopped.wait(delay):
+                        return
+                    delay = min(delay * 2, self.max_retry_interval)
+                    continue
+                logger.error(f"Dropping spooled Loki payload {seq}: {e}")
+            delay = self.retry_interval
+            with self.cond:
+                self.backlog.popleft()
+                self.acknowledge(seq)
+                if not self.backlog and self.degraded:
+                    self.degraded = False
+                    logger.info(f"Loki spool {self.directory} drained, pushing directly again")
+
+    def close(self):
+        self.stopped.set()
+        with self.cond:
+            self.cond.notify_all()
+        self.thread.join()
+        with self.cond:
+            if self.active_fh is not None:
+                self.active_fh.close()
+                self.active_fh = None
+            for segment in self.segments.values():
+                if segment["acks"] is not None:
+                    segment["acks"].close()
+                    segment["acks"] = None
+
+def lock_slot(path):
+    os.makedirs(path, exist_ok=True)
+    lock = open(os.path.join(path, "lock"), "a")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock.close()
+        return None
+    return lock
+
+LOKI_SPOOL = None
+LOKI_SPOOL_LOCK = threading.Lock()
+
+def loki_spool(directory, resend, **options):
+    # One spool per process. Each process (web app, worker.py workers)
+    # holds a slot-N directory of its own under an flock and adopts the
+    # payloads of slots whose process died.
+    global LOKI_SPOOL
+    with LOKI_SPOOL_LOCK:
+        if LOKI_SPOOL is not None:
+            return LOKI_SPOOL
+        os.makedirs(directory, exist_ok=True)
+        slot = 0
+        while True:
+            path = os.path.join(directory, f"slot-{slot}")
+            lock = lock_slot(path)
+            if lock is not None:
+                break
+            slot += 1
+        spool = LokiSpool(path, resend, **options)
+        spool.slot_lock = lock
+        for name in sorted(os.listdir(directory)):
+            other = os.path.join(directory, name)
+            if other == path or not name.startswith("slot-") or not segment_names(other):
+                continue
+            other_lock = lock_slot(other)
+            if other_lock is None:
+                continue
+            try:
+                spool.adopt(other)
+            except (OSError, LokiSpoolFull) as e:
+                logger.error(f"Could not adopt Loki spool {other}: {e}")
+            finally:
+                other_lock.close()
+        LOKI_SPOOL = spool
+        return spool
@@ -1,3 +1,5 @@
+import time
+import threading
 from prometheus_client import Counter, Gauge , Histogram
 
 LOGS_PROCESSED = Counter('dpp_logs_processed_total' , 'Total_logs_processed' , ['user', 'filename'])
@@ -13,6 +15,281 @@ PCELL_STATE_CHANGE_LOGS_PROCESSED = Counter('pcell_state_change_logs_processed_t
 
 TOTAL_CRC_FAILS = Counter('total_crc_fails', 'Total_crc_fails' , ['user', 'filename', 'sector_id'])
 
+# Low-cardinality totals across every run, these never carry user/filename.
+LOGS_PROCESSED_ALL = Counter('logs_processed_all_runs_total', 'Total_logs_processed_all_runs')
+TAG_LOGS_PROCESSED_ALL = Counter('tag_logs_processed_all_runs_total', 'Total_tag_logs_processed_all_runs', ['counter'])
+TOTAL_CRC_FAILS_ALL = Counter('crc_fails_all_runs_total', 'Total_crc_fails_all_runs')
+
+AGGREGATE_COUNTER_NAMES = {
+    DPP_BASIC_LOGS_PROCESSED : "dpp_basic",
+    PB_BASIC_LOGS_PROCESSED : "pb_basic",
+    URAC_RA_LOGS_PROCESSED : "urac_ra",
+    UMRC_DP_LOGS_PROCESSED : "umrc_dp",
+    ULCA_PHR_PWR_AL_LOGS_PROCESSED : "ulca_phr_pwr_al",
+    SCELL_STATE_ULCA_LOGS_PROCESSED : "scell_state_ulca",
+    PCELL_STATE_ULCA_LOGS_PROCESSED : "pcell_state_ulca",
+    PCELL_STATE_ACT_LOGS_PROCESSED : "pcell_state_act",
+    PCELL_STATE_CHANGE_LOGS_PROCESSED : "pcell_state_change",
+    TOTAL_CRC_FAILS : "crc_fails",
+}
+
+COUNTERS_BY_NAME = {name : counter for counter, name in AGGREGATE_COUNTER_NAMES.items()}
+
+# Replay pipeline instrumentation. Series labelled by run_id are handed to
+# RUN_SERIES when the run ends and expire like the per-file ones.
+REPLAY_STAGE_SECONDS = Counter('replay_stage_seconds_total', 'Estimated_seconds_spent_per_replay_stage', ['run_id', 'stage'])
+REPLAY_LINES_PER_SECOND = Gauge('replay_lines_per_second', 'Replay_lines_per_second', ['run_id'])
+REPLAY_PB_PENDING = Gauge('replay_pb_pending_entries', 'PB_BASIC_entries_waiting_for_their_DPP', ['run_id'])
+REPLAY_PUSH_BACKLOG = Gauge('replay_push_backlog_payloads', 'Payloads_queued_for_the_pushers', ['run_id'])
+LOKI_PUSH_RETRIES = Counter('loki_push_retries_total', 'Loki_push_retries', ['run_id', 'reason'])
+LOKI_PUSH_SECONDS = Histogram('loki_push_duration_seconds', 'Loki_push_request_latency',
+                              buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+LOKI_PUSH_BYTES = Histogram('loki_push_payload_bytes', 'Loki_push_body_size',
+                            buckets=(1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216))
+REPLAY_BATCH_ENTRIES = Histogram('replay_batch_entries', 'Entries_per_pushed_batch',
+                                 buckets=(1, 10, 50, 100, 250, 500, 1000, 2000, 5000, 10000))
+LOKI_SPOOL_BYTES = Gauge('loki_spool_bytes', 'Bytes_of_Loki_payloads_in_the_spool')
+LOKI_SPOOL_BACKLOG = Gauge('loki_spool_backlog_payloads', 'Spooled_payloads_waiting_to_be_resent')
+LOKI_SPOOL_DEFERRED = Counter('loki_spool_deferred_total', 'Loki_payloads_deferred_to_the_spool')
+LOKI_SHARD_HEALTHY = Gauge('loki_shard_healthy', 'Loki_shard_accepting_pushes', ['shard'])
+LOKI_SHARD_FAILOVERS = Counter('loki_shard_failovers_total', 'Payloads_moved_off_a_failing_Loki_shard', ['shard'])
+
+def process_label(v):
+    if v is None:
+        return "unknown"
+    s = str(v)
+    return s.replace('"', '\\"').replace("\n", " ")
+
+class RunSeriesRegistry:
+    # Tracks which per-file series (counter, label values) are in use by a
+    # run. Once no run holds a series it is removed from the counter after
+    # the retention period, so the /metrics output does not grow with every
+    # uploaded file. One sweeper thread, started on the first release,
+    # sleeps until the next series is due.
+    def __init__(self):
+        self.cond = threading.Condition()
+        # key -> [runs holding it, monotonic time it expires or None]
+        self.series = {}
+        self.sweeper = None
+
+    def acquire(self, key):
+        with self.cond:
+            entry = self.series.get(key)
+            if entry is None:
+                self.series[key] = [1, None]
+            else:
+                entry[0] += 1
+                entry[1] = None
+
+    def release(self, keys, retention):
+        expires_at = time.monotonic() + retention
+        with self.cond:
+            for key in keys:
+                entry = self.series.get(key)
+                if entry is None:
+                    continue
+                entry[0] -= 1
+                if entry[0] <= 0:
+                    entry[0] = 0
+                    entry[1] = expires_at
+            if self.sweeper is None:
+                self.sweeper = threading.Thread(target=self.sweep, name="run-series-sweeper", daemon=True)
+                self.sweeper.start()
+            self.cond.notify()
+
+    def expire(self):
+        # Called with self.cond held, so a run cannot take a series back
+        # while it is being removed. Returns when the next one is due.
+        now = time.monotonic()
+        next_due = None
+        for key, (active, expires_at) in list(self.series.items()):
+            if active or expires_at is None:
+                continue
+            if expires_at > now:
+                next_due = expires_at if next_due is None else min(next_due, expires_at)
+                continue
+            del self.series[key]
+            counter, labelvalues = key
+            try:
+                counter.remove(*labelvalues)
+            except KeyError:
+                pass
+        return next_due
+
+    def sweep(self):
+        with self.cond:
+            while True:
+                next_due = self.expire()
+                self.cond.wait(None if next_due is None else next_due - time.monotonic())
+
+RUN_SERIES = RunSeriesRegistry()
+
+class MetricsAccumulator:
+    # Per-job local tally for the per-line counters. The parse loop only
+    # bumps plain ints keyed by (counter, raw sector_id); the totals are
+    # pushed to the Prometheus counters every flush_lines lines or
+    # flush_interval seconds, and once more by the worker at job end.
+    # With a registry the per-file series are handed back to it on close()
+    # and expire after retention seconds.
+    def __init__(self, username, filename, flush_lines=10000, flush_interval=1.0, registry=None, retention=3600):
+        self.username = username
+        self.filename = filename
+        self.flush_lines = max(int(flush_lines), 1)
+        self.flush_interval = float(flush_interval)
+        self.check_every = min(self.flush_lines, 1000)
+        self.registry = registry
+        self.retention = float(retention)
+        self.lines = 0
+        self.since_check = 0
+        self.counts = {}
+        self.total_lines = 0
+        self.totals = {}
+        self.series = set()
+        self.last_flush = time.monotonic()
+
+    def count_lines(self, n=1):
+        self.lines += n
+        self.since_check += n
+        if self.since_check >= self.check_every:
+            self.since_check = 0
+            if self.lines >= self.flush_lines or time.monotonic() - self.last_flush >= self.flush_interval:
+                self.flush()
+
+    def count(self, counter, sector_id, n=1):
+        key = (counter, sector_id)
+        self.counts[key] = self.counts.get(key, 0) + n
+
+    def track(self, counter, labelvalues):
+        key = (counter, labelvalues)
+        if key not in self.series:
+            self.series.add(key)
+            if self.registry is not None:
+                self.registry.acquire(key)
+
+    def flush(self):
+        if self.lines:
+            self.track(LOGS_PROCESSED, (self.username, self.filename))
+            LOGS_PROCESSED.labels(user = self.username, filename= self.filename).inc(self.lines)
+            LOGS_PROCESSED_ALL.inc(self.lines)
+            self.total_lines += self.lines
+            self.lines = 0
+        counts, self.counts = self.counts, {}
+        for (counter, sector_id), n in counts.items():
+            sector_label = process_label(sector_id)
+            self.track(counter, (self.username, self.filename, sector_label))
+            counter.labels(user = self.username, filename= self.filename, sector_id=sector_label).inc(n)
+            if counter is TOTAL_CRC_FAILS:
+                TOTAL_CRC_FAILS_ALL.inc(n)
+            else:
+                TAG_LOGS_PROCESSED_ALL.labels(counter=AGGREGATE_COUNTER_NAMES.get(counter, "other")).inc(n)
+            key = (counter, sector_label)
+            self.totals[key] = self.totals.get(key, 0) + n
+        self.since_check = 0
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        if self.registry is not None and self.series:
+            self.registry.release(self.series, self.retention)
+            self.series = set()
+        return self.summary()
+
+    def export_totals(self):
+        # Run totals in a JSON-friendly form, so a cached replay can count
+        # the same lines again without re-parsing them.
+        self.flush()
+        counts = [[AGGREGATE_COUNTER_NAMES[counter], sector_label, n] for (counter, sector_label), n in self.totals.items()
+                  if counter in AGGREGATE_COUNTER_NAMES]
+        return {"lines": self.total_lines, "counts": counts}
+
+    def import_totals(self, totals):
+        for name, sector_label, n in totals.get("counts", []):
+            self.count(COUNTERS_BY_NAME[name], sector_label, n)
+        self.count_lines(totals.get("lines", 0))
+
+    def summary(self):
+        counts = {}
+        crc_fails = 0
+        for (counter, sector_label), n in self.totals.items():
+            if counter is TOTAL_CRC_FAILS:
+                crc_fails += n
+                continue
+            per_sector = counts.setdefault(AGGREGATE_COUNTER_NAMES.get(counter, "other"), {})
+            per_sector[sector_label] = per_sector.get(sector_label, 0) + n
+        return {"lines_processed": self.total_lines, "crc_fails": crc_fails, "counts": counts}
+
+class ReplayStageMetrics:
+    # Per-run stage timers. The per-line stages (read, parse, match) are
+    # timed on one line in sample_every by the caller and added with
+    # add_sampled(), which scales them up; serialize, push_wait, rate_limit
+    # and push are timed on every batch or request, the last two from the
+    # pusher threads. Totals stay local and go to REPLAY_STAGE_SECONDS on
+    # flush(), which also sets the run's gauges.
+    def __init__(self, run_id, sample_every=16, registry=None, retention=3600):
+        self.run_id = process_label(run_id)
+        self.sample_every = max(int(sample_every), 1)
+        self.registry = registry
+        self.retention = float(retention)
+        self.lock = threading.Lock()
+        self.seconds = {}
+        self.retries = {}
+        self.series = set()
+        self.last_lines = 0
+        self.last_flush = time.monotonic()
+
+    def add(self, stage, seconds):
+        with self.lock:
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+
+    def add_sampled(self, stage, seconds):
+        self.add(stage, seconds * self.sample_every)
+
+    def retry(self, reason):
+        with self.lock:
+            self.retries[reason] = self.retries.get(reason, 0) + 1
+
+    def track(self, metric, labelvalues):
+        key = (metric, labelvalues)
+        if key not in self.series:
+            self.series.add(key)
+            if self.registry is not None:
+                self.registry.acquire(key)
+
+    def flush(self, lines=None, pb_pending=None, push_backlog=None):
+        with self.lock:
+            seconds, self.seconds = self.seconds, {}
+            retries, self.retries = self.retries, {}
+        for stage, n in seconds.items():
+            self.track(REPLAY_STAGE_SECONDS, (self.run_id, stage))
+            REPLAY_STAGE_SECONDS.labels(run_id=self.run_id, stage=stage).inc(n)
+        for reason, n in retries.items():
+            self.track(LOKI_PUSH_RETRIES, (self.run_id, reason))
+            LOKI_PUSH_RETRIES.labels(run_id=self.run_id, reason=reason).inc(n)
+        now = time.monotonic()
+        if lines is not None:
+            elapsed = now - self.last_flush
+            if elapsed > 0:
+                self.track(REPLAY_LINES_PER_SECOND, (self.run_id,))
+                REPLAY_LINES_PER_SECOND.labels(run_id=self.run_id).set((lines - self.last_lines) / elapsed)
+            self.last_lines = lines
+        if pb_pending is not None:
+            self.track(REPLAY_PB_PENDING, (self.run_id,))
+            REPLAY_PB_PENDING.labels(run_id=self.run_id).set(pb_pending)
+        if push_backlog is not None:
+            self.track(REPLAY_PUSH_BACKLOG, (self.run_id,))
+            REPLAY_PUSH_BACKLOG.labels(run_id=self.run_id).set(push_backlog)
+        self.last_flush = now
+
+    def close(self):
+        self.flush()
+        # A finished run is idle, not stuck at its last rate.
+        for metric, labelvalues in self.series:
+            if metric in (REPLAY_LINES_PER_SECOND, REPLAY_PB_PENDING, REPLAY_PUSH_BACKLOG):
+                metric.labels(*labelvalues).set(0)
+        if self.registry is not None and self.series:
+            self.registry.release(self.series, self.retention)
+            self.series = set()
+
 #FOR DPP BASIC
 # CRC_GAUGE = Gauge('dpp_crc_value', 'crc value' , ['user', 'filename', 'sector_id' , 'ue_id'])
 # MCS_GAUGE = Gauge('dpp_mcs_value', 'mcs value' , ['user', 'filename', 'sector_id' , 'ue_id'])
@@ -0,0 +1,66 @@
+# flaskr/scripts/pacing.py
+import time
+from flaskr.scripts.parser import timestamp_str_to_ns
+
+PACING_MODES = ("fast", "realtime", "lines")
+
+class ReplayPacer:
+    # Paces a replay against the wall clock. "realtime" plays the log back
+    # at `rate` times the speed of its own date|time header clock, "lines"
+    # hands out `rate` entries per second and "fast" does not wait at all.
+    # tick() is called once per entry but only sleeps once the replay is a
+    # whole slice_seconds ahead of schedule, so there is one sleep per time
+    # slice rather than one per line. If the replay falls behind (parsing or
+    # Loki slower than the target) it simply runs flat out. Long gaps are
+    # slept in steps of at most max_wait, calling on_wait() after each so the
+    # caller can flush partial batches and check for a cancel; wait(seconds)
+    # sleeps, so a cancel event can cut a step short. Time slept goes to the
+    # "pacing" stage of stages.
+    def __init__(self, mode="fast", rate=1.0, slice_seconds=0.1, wait=None, on_wait=None, max_wait=1.0, stages=None):
+        if mode not in PACING_MODES:
+            raise ValueError(f"Unknown pacing mode {mode!r}")
+        self.mode = mode
+        self.rate = float(rate)
+        if self.mode != "fast" and self.rate <= 0:
+            raise ValueError("Pacing rate must be positive")
+        self.slice_seconds = float(slice_seconds)
+        self.wait = wait or time.sleep
+        self.on_wait = on_wait
+        self.max_wait = float(max_wait)
+        self.stages = stages
+        self.started = None
+        self.log_start = None
+        self.count = 0
+        self.slice_lines = max(int(self.rate * self.slice_seconds), 1) if mode == "lines" else 0
+        self.sleeps = 0
+
+    def tick(self, parsed):
+        # Call before the entry is emitted, it may sleep until its time.
+        if self.mode == "lines":
+            self.count += 1
+            if self.started is None:
+                self.started = time.monotonic()
+            if self.count % self.slice_lines == 0:
+                self.sleep_until(self.started + self.count / self.rate)
+        elif self.mode == "realtime":
+            log_ns = timestamp_str_to_ns(parsed.get("timestamp_str"))
+            if log_ns is None:
+                return
+            if self.log_start is None:
+                self.started, self.log_start = time.monotonic(), log_ns
+                return
+            self.sleep_until(self.started + (log_ns - self.log_start) / 1e9 / self.rate)
+
+    def sleep_until(self, target):
+        now = time.monotonic()
+        if target - now < self.slice_seconds:
+            return
+        self.sleeps += 1
+        started = now
+        while now < target:
+            self.wait(min(target - now, self.max_wait))
+            if self.on_wait is not None:
+                self.on_wait()
+            now = time.monotonic()
+        if self.stages is not None:
+            self.stages.add("pacing", now - started)
@@ -0,0 +1,55 @@
+# flaskr/scripts/parallel_parse.py
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from flaskr.scripts.log_reader import MappedLogReader, split_line_ranges
+from flaskr.scripts import parser
+from flaskr.scripts.parser import SCENARIO_TAG_HANDLERS, SCENARIO_TAG_PREFILTERS, match_tagged_log_line, decode_schema_log, account_schema_log, set_keep_packed_fields
+from flaskr.scripts.metrics import LOGS_PROCESSED
+
+def parse_line_range(file_path, scenario, start, end, keep_packed):
+    # Runs in a pool process: decode every record in [start, end) without
+    # touching line_index, metadata or metrics, those are applied in order
+    # by the parent. keep_packed is the parent's KEEP_PACKED_FIELDS, spawned
+    # processes start from the module default.
+    set_keep_packed_fields(keep_packed)
+    reader = MappedLogReader(file_path, SCENARIO_TAG_PREFILTERS[scenario], start=start, end=end)
+    records = []
+    candidate_lines = 0
+    for byte_offset, raw_line in reader:
+        candidate_lines += 1
+        matched = match_tagged_log_line(raw_line, scenario)
+        if matched is None:
+            continue
+        schema, column_index, log_match = matched
+        records.append(decode_schema_log(schema, log_match, None))
+    return records, candidate_lines + reader.lines_skipped
+
+def iter_parallel_records(username, filename, file_path, scenario, line_index, metadata_dict, workers, chunk_bytes, metrics=None):
+    handlers = SCENARIO_TAG_HANDLERS[scenario]
+    keep_packed = parser.KEEP_PACKED_FIELDS
+    ranges = iter(split_line_ranges(file_path, chunk_bytes))
+    # spawn, not fork: the parent is a multi-threaded Flask process.
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        in_flight = deque()
+        for start, end in ranges:
+            in_flight.append(pool.submit(parse_line_range, file_path, scenario, start, end, keep_packed))
+            if len(in_flight) >= workers * 2:
+                break
+        while in_flight:
+            records, lines_seen = in_flight.popleft().result()
+            next_range = next(ranges, None)
+            if next_range is not None:
+                in_flight.append(pool.submit(parse_line_range, file_path, scenario, *next_range, keep_packed))
+            if metrics is not None:
+                metrics.count_lines(lines_seen)
+            else:
+                LOGS_PROCESSED.labels(user = username, filename= filename).inc(lines_seen)
+            for record in records:
+                schema, column_index = handlers[record.schema_tag]
+                record["index"] = line_index[column_index]
+                account_schema_log(schema, username, filename, record, line_index, column_index, metadata_dict, metrics)
+                yield record
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,207 @@
+# flaskr/scripts/parse_cache.py
+import os
+import gzip
+import json
+import time
+import shutil
+import threading
+import hashlib
+import logging
+from array import array
+import numpy as np
+from flaskr.scripts.parser import schema_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# Bump when replay_worker changes what it pushes for the same parsed lines
+# (matching, stubs, timestamps); parser changes are covered by
+# schema_fingerprint().
+CACHE_FORMAT_VERSION = 1
+TMP_PREFIX = ".tmp-"
+STALE_TMP_SECONDS = 24 * 3600
+
+def file_digest(file_path, chunk_bytes=1024 * 1024):
+    digest = hashlib.blake2b(digest_size=32)
+    with open(file_path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(chunk_bytes), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+CONTENT_DIGESTS = {}
+CONTENT_DIGESTS_LOCK = threading.Lock()
+
+def content_digest(file_path, max_entries=256):
+    # file_digest remembered by path, size and mtime, so an upload is
+    # hashed at most once per process.
+    st = os.stat(file_path)
+    key = (os.path.abspath(file_path), st.st_size, st.st_mtime_ns)
+    with CONTENT_DIGESTS_LOCK:
+        digest = CONTENT_DIGESTS.get(key)
+    if digest is None:
+        digest = file_digest(file_path)
+        remember_digest(key, digest, max_entries)
+    return digest
+
+def remember_digest(key, digest, max_entries=256):
+    with CONTENT_DIGESTS_LOCK:
+        if len(CONTENT_DIGESTS) >= max_entries:
+            CONTENT_DIGESTS.pop(next(iter(CONTENT_DIGESTS)))
+        CONTENT_DIGESTS[key] = digest
+
+def save_with_digest(stream, file_path, chunk_bytes=1024 * 1024):
+    # Writes an upload to file_path and returns its file_digest, hashed
+    # while it is copied so the content is never read a second time.
+    digest = hashlib.blake2b(digest_size=32)
+    with open(file_path, "wb") as fh:
+        for chunk in iter(lambda: stream.read(chunk_bytes), b""):
+            digest.update(chunk)
+            fh.write(chunk)
+    st = os.stat(file_path)
+    remember_digest((os.path.abspath(file_path), st.st_size, st.st_mtime_ns), digest.hexdigest())
+    return digest.hexdigest()
+
+def replay_cache_key(file_path, scenario, batch_size, timestamp_mode="synthetic"):
+    # batch_size decides how entries are grouped into pushes and the
+    # timestamp mode what their offsets mean, so both are part of the cached
+    # output just like the file content and parser.
+    key = hashlib.sha256()
+    for part in (content_digest(file_path), scenario, schema_fingerprint(), CACHE_FORMAT_VERSION, batch_size, timestamp_mode):
+        key.update(f"{part}\0".encode())
+    return key.hexdigest()
+
+class ParseCacheWriter:
+    # Records every push of a replay as it happens: the stream (tag and
+    # sector labels only, run/user/filename are filled in again on replay),
+    # the timestamp offsets from start_ns (0 for absolute timestamps) as an
+    # int64 column and the JSON
+    # lines in a gzip stream. Written to a temp dir and renamed on commit.
+    def __init__(self, cache_dir, key):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.key = key
+        self.tmp_dir = os.path.join(cache_dir, f"{TMP_PREFIX}{key}-{os.getpid()}-{time.monotonic_ns()}")
+        os.makedirs(self.tmp_dir)
+        self.payloads = gzip.open(os.path.join(self.tmp_dir, "payloads.jsonl.gz"), "wb", compresslevel=1)
+        self.streams = {}
+        self.push_streams = array("i")
+        self.push_lengths = array("i")
+        self.offsets = array("q")
+
+    def add_push(self, stream_labels, values, start_ns):
+        stream = (stream_labels["tag"], stream_labels["sector_id"])
+        stream_id = self.streams.setdefault(stream, len(self.streams))
+        self.push_streams.append(stream_id)
+        self.push_lengths.append(len(values))
+        for ts, line in values:
+            self.offsets.append(int(ts) - start_ns)
+            self.payloads.write(line.encode("utf-8"))
+            self.payloads.write(b"\n")
+
+    def commit(self, metadata_dict, metric_totals):
+        self.payloads.close()
+        np.save(os.path.join(self.tmp_dir, "pushes.npy"), np.array([self.push_streams, self.push_lengths], dtype=np.int32))
+        np.save(os.path.join(self.tmp_dir, "offsets.npy"), np.frombuffer(self.offsets, dtype=np.int64))
+        meta = {
+            "streams": [list(stream) for stream in sorted(self.streams, key=self.streams.get)],
+            "metadata": [[tag, sector, ue_id, flag] for (tag, sector, ue_id), flag in metadata_dict.items()],
+            "metrics": metric_totals,
+        }
+        with open(os.path.join(self.tmp_dir, "meta.json"), "w") as fh:
+            json.dump(meta, fh)
+        try:
+            os.rename(self.tmp_dir, os.path.join(self.cache_dir, self.key))
+        except OSError:
+            # Another replay of the same content committed first.
+            shutil.rmtree(self.tmp_dir, ignore_errors=True)
+            return False
+        return True
+
+    def abort(self):
+        self.payloads.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+class ParseCacheEntry:
+    def __init__(self, entry_dir):
+        self.entry_dir = entry_dir
+        with open(os.path.join(entry_dir, "meta.json")) as fh:
+            self.meta = json.load(fh)
+        self.pushes = np.load(os.path.join(entry_dir, "pushes.npy"))
+        self.offsets = np.load(os.path.join(entry_dir, "offsets.npy"), mmap_mode="r")
+        self.payloads = gzip.open(os.path.join(entry_dir, "payloads.jsonl.gz"), "rb")
+
+    def metadata_dict(self):
+        return {(tag, sector, ue_id) : flag for tag, sector, ue_id, flag in self.meta["metadata"]}
+
+    def metric_totals(self):
+        return self.meta["metrics"]
+
+    def iter_pushes(self, start_ns):
+        # Yields (tag label, sector label, values) in the original push order.
+        streams = self.meta["streams"]
+        position = 0
+        try:
+            for stream_id, length in zip(self.pushes[0].tolist(), self.pushes[1].tolist()):
+                tag, sector_id = streams[stream_id]
+                offsets = self.offsets[position:position + length].tolist()
+                values = [[str(start_ns + offset), self.payloads.readline()[:-1].decode("utf-8")] for offset in offsets]
+                position += length
+                yield tag, sector_id, values
+        finally:
+            self.close()
+
+    def close(self):
+        self.payloads.close()
+
+def open_cache_entry(cache_dir, key):
+    entry_dir = os.path.join(cache_dir, key)
+    if not os.path.isdir(entry_dir):
+        return None
+    try:
+        entry = ParseCacheEntry(entry_dir)
+        # meta.json's mtime is the entry's last use for LRU eviction.
+        os.utime(os.path.join(entry_dir, "meta.json"))
+    except (OSError, ValueError) as e:
+        logger.warning(f"Discarding unreadable replay cache entry {key}: {e}")
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        return None
+    return entry
+
+def directory_size(path):
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+def evict_to_budget(cache_dir, max_bytes):
+    if not os.path.isdir(cache_dir):
+        return 0
+    now = time.time()
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.startswith(TMP_PREFIX):
+            # Left behind by a replay that died before commit/abort.
+            if now - os.path.getmtime(path) > STALE_TMP_SECONDS:
+                shutil.rmtree(path, ignore_errors=True)
+            continue
+        try:
+            last_used = os.path.getmtime(os.path.join(path, "meta.json"))
+        except OSError:
+            last_used = 0
+        entries.append((last_used, directory_size(path), path))
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    evicted = 0
+    for last_used, size, path in entries:
+        if total <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+        evicted += 1
+    if evicted:
+        logger.info(f"Evicted {evicted} replay cache entries, {total} bytes left")
+    return evicted
@@ -1,32 +1,20 @@
 # flaskr/parser.py
 import re
 import math
-from flaskr.scripts.metrics import LOGS_PROCESSED,DPP_BASIC_LOGS_PROCESSED,ULCA_PHR_PWR_AL_LOGS_PROCESSED,UMRC_DP_LOGS_PROCESSED,URAC_RA_LOGS_PROCESSED,TOTAL_CRC_FAILS,SCELL_STATE_ULCA_LOGS_PROCESSED,PCELL_STATE_CHANGE_LOGS_PROCESSED,PCELL_STATE_ULCA_LOGS_PROCESSED,PCELL_STATE_ACT_LOGS_PROCESSED
-
-def process_label(v):
-    if v is None:
-        return "unknown"
-    s = str(v)
-    return s.replace('"', '\\"').replace("\n", " ")
-
-DPP_BASIC_4G_LINE_RE = re.compile(
+import json
+import hashlib
+import datetime
+from collections import namedtuple
+from flaskr.scripts.metrics import process_label,LOGS_PROCESSED,DPP_BASIC_LOGS_PROCESSED,ULCA_PHR_PWR_AL_LOGS_PROCESSED,UMRC_DP_LOGS_PROCESSED,URAC_RA_LOGS_PROCESSED,TOTAL_CRC_FAILS,SCELL_STATE_ULCA_LOGS_PROCESSED,PCELL_STATE_CHANGE_LOGS_PROCESSED,PCELL_STATE_ULCA_LOGS_PROCESSED,PCELL_STATE_ACT_LOGS_PROCESSED
+
+# One header matcher shared by every tag; the tag itself is captured and
+# dispatched through SCENARIO_TAG_HANDLERS at the bottom of this module.
+LOG_LINE_RE = re.compile(
     r"""
     ^\s*
     (?P<date>\d{6})\|(?P<time>\d{2}:\d{2}:\d{2}\.\d+)\s+
     @(?P<slot>\d{1,3})\|(?P<id1>[0-9A-Fa-f]+)\|(?P<id2>\d+)\s+
-    [^\>]*>\s*DPP_BASIC,
-    (?P<csv_payload>.*?)
-    (?:\s+\(|$)
-    """,
-    re.VERBOSE,
-)
-
-PB_BASIC_4G_LINE_RE = re.compile(
-    r"""
-    ^\s*
-    (?P<date>\d{6})\|(?P<time>\d{2}:\d{2}:\d{2}\.\d+)\s+
-    @(?P<slot>\d{1,3})\|(?P<id1>[0-9A-Fa-f]+)\|(?P<id2>\d+)\s+
-    [^\>]*>\s*PB_BASIC,
+    [^\>]*>\s*(?P<tag>\w+),
     (?P<csv_payload>.*?)
     (?:\s+\(|$)
     """,
@@ -61,625 +49,715 @@ def safe_log10(value):
 def parse_timestamp_str(date_str, time_str):
     return f"{date_str}|{time_str}"
 
-def parse_4G_log_line(username, filename, raw_line, line_index, metadata_dict):
-    LOGS_PROCESSED.labels(user = username, filename= filename).inc()
-    dpp_basic = DPP_BASIC_4G_LINE_RE.match(raw_line)
-    if dpp_basic:
-        return process_dpp_basic_log(username, filename, dpp_basic, line_index , 0, metadata_dict)
-    pb_basic = PB_BASIC_4G_LINE_RE.match(raw_line)
-    if pb_basic:
-        return process_pb_basic_log(username, filename, pb_basic, line_index , 1, metadata_dict)
-    return None
+EPOCH_DAYS = {}
 
+def timestamp_str_to_ns(timestamp_str):
+    # "YYMMDD|HH:MM:SS.ffff" as nanoseconds since the epoch, reading the
+    # header clock as UTC; None for stubs and malformed headers.
+    try:
+        date_str, time_str = timestamp_str.split("|")
+        days = EPOCH_DAYS.get(date_str)
+        if days is None:
+            days = EPOCH_DAYS[date_str] = (datetime.date(2000 + int(date_str[:2]), int(date_str[2:4]), int(date_str[4:6])) - datetime.date(1970, 1, 1)).days
+        hms, _, fraction = time_str.partition(".")
+        hours, minutes, seconds = hms.split(":")
+        ns = int(fraction.ljust(9, "0")[:9]) if fraction else 0
+    except (ValueError, AttributeError):
+        return None
+    return ((days * 24 + int(hours)) * 60 + int(minutes)) * 60_000_000_000 + int(seconds) * 1_000_000_000 + ns
 
-URAC_RA_5G_LINE_RE = re.compile(
-    r"""
-    ^\s*
-    (?P<date>\d{6})\|(?P<time>\d{2}:\d{2}:\d{2}\.\d+)\s+
-    @(?P<slot>\d{1,3})\|(?P<id1>[0-9A-Fa-f]+)\|(?P<id2>\d+)\s+
-    [^\>]*>\s*URAC_RA,
-    (?P<csv_payload>.*?)
-    (?:\s+\(|$)
-    """,
-    re.VERBOSE,
-)
+# A column spec says where one output key of a parsed record comes from:
+# a 1-based CSV column (optionally transformed), a constant, the per-tag
+# line index or the header timestamp.
+ColumnSpec = namedtuple("ColumnSpec", ["name", "kind", "value", "transform"])
 
-UMRC_DP_5G_LINE_RE = re.compile(
-    r"""
-    ^\s*
-    (?P<date>\d{6})\|(?P<time>\d{2}:\d{2}:\d{2}\.\d+)\s+
-    @(?P<slot>\d{1,3})\|(?P<id1>[0-9A-Fa-f]+)\|(?P<id2>\d+)\s+
-    [^\>]*>\s*UMRC_DP,
-    (?P<csv_payload>.*?)
-    (?:\s+\(|$)
-    """,
-    re.VERBOSE,
-)
+INDEX_COLUMN = ColumnSpec("index", "index", None, None)
+TIMESTAMP_COLUMN = ColumnSpec("timestamp_str", "timestamp", None, None)
 
-ULCA_PHR_PWR_AL_5G_LINE_RE = re.compile(
-    r"""
-    ^\s*
-    (?P<date>\d{6})\|(?P<time>\d{2}:\d{2}:\d{2}\.\d+)\s+
-    @(?P<slot>\d{1,3})\|(?P<id1>[0-9A-Fa-f]+)\|(?P<id2>\d+)\s+
-    [^\>]*>\s*ULCA_PHR_PWR_AL,
-    (?P<csv_payload>.*?)
-    (?:\s+\(|$)
-    """,
-    re.VERBOSE,
-)
+def column(name, position, transform=None):
+    return ColumnSpec(name, "column", position, transform)
 
-def parse_5G_log_line(username, filename, raw_line, line_index, metadata_dict):
-    LOGS_PROCESSED.labels(user = username, filename= filename).inc()
-    urac_ac = URAC_RA_5G_LINE_RE.match(raw_line)
-    if urac_ac:
-        return process_urac_log(username, filename, urac_ac, line_index, 0, metadata_dict)
-    umrc_dp = UMRC_DP_5G_LINE_RE.match(raw_line)
-    if umrc_dp:
-        return process_umrc_dp_log(username, filename, umrc_dp, line_index, 1, metadata_dict)
-    ulca_dp = ULCA_PHR_PWR_AL_5G_LINE_RE.match(raw_line)
-    if ulca_dp:
-        return process_ulca_phr_pwr_al_log(username , filename , ulca_dp, line_index, 2, metadata_dict)
-    return None
-
-SCELL_STATE_ULCA_RE = re.compile(
-    r"""
-    ^\s*
-    (?P<date>\d{6})\|(?P<time>\d{2}:\d{2}:\d{2}\.\d+)\s+
-    @(?P<slot>\d{1,3})\|(?P<id1>[0-9A-Fa-f]+)\|(?P<id2>\d+)\s+
-    [^\>]*>\s*SCELL_STATE_ULCA,
-    (?P<csv_payload>.*?)
-    (?:\s+\(|$)
-    """,
-    re.VERBOSE,
-)
+def const(name, value):
+    return ColumnSpec(name, "const", value, None)
 
-PCELL_STATE_ULCA_RE = re.compile(
-    r"""
-    ^\s*
-    (?P<date>\d{6})\|(?P<time>\d{2}:\d{2}:\d{2}\.\d+)\s+
-    @(?P<slot>\d{1,3})\|(?P<id1>[0-9A-Fa-f]+)\|(?P<id2>\d+)\s+
-    [^\>]*>\s*PCELL_STATE_ULCA,
-    (?P<csv_payload>.*?)
-    (?:\s+\(|$)
-    """,
-    re.VERBOSE,
-)
+class PackedPart:
+    # Pulls one sub-field out of a packed integer column as
+    # (value // divisor) % modulus; the leading part keeps every higher digit.
+    def __init__(self, divisor, modulus=None):
+        self.divisor = divisor
+        self.modulus = modulus
 
-PCELL_STATE_ACT_RE = re.compile(
-    r"""
-    ^\s*
-    (?P<date>\d{6})\|(?P<time>\d{2}:\d{2}:\d{2}\.\d+)\s+
-    @(?P<slot>\d{1,3})\|(?P<id1>[0-9A-Fa-f]+)\|(?P<id2>\d+)\s+
-    [^\>]*>\s*PCELL_STATE_ACT,
-    (?P<csv_payload>.*?)
-    (?:\s+\(|$)
-    """,
-    re.VERBOSE,
-)
+    def __call__(self, value):
+        if value is None:
+            return None
+        part = value // self.divisor
+        return part if self.modulus is None else part % self.modulus
+
+    def __repr__(self):
+        return f"PackedPart({self.divisor}, {self.modulus})"
+
+# PARSER_KEEP_PACKED_FIELDS: whether packed columns declared without an
+# explicit keep_packed are kept next to their sub-fields. Applied to every
+# schema with set_keep_packed_fields().
+KEEP_PACKED_FIELDS = True
+
+def packed_columns(name, position, parts, keep_packed):
+    # parts are (sub-field name, weight), most significant first. With
+    # keep_packed None the packed column follows KEEP_PACKED_FIELDS.
+    if keep_packed is None:
+        specs = [ColumnSpec(name, "packed", position, None)]
+    else:
+        specs = [column(name, position)] if keep_packed else []
+    previous_weight = None
+    for sub_name, weight in parts:
+        modulus = None if previous_weight is None else previous_weight // weight
+        specs.append(column(sub_name, position, PackedPart(weight, modulus)))
+        previous_weight = weight
+    return specs
+
+def decimal_packed(name, position, parts, keep_packed=None):
+    # e.g. "a*1000+b*10+c" -> [("a", 1000), ("b", 10), ("c", 1)]
+    return packed_columns(name, position, parts, keep_packed)
+
+def bit_packed(name, position, parts, keep_packed=None):
+    # e.g. "a<<8+b" -> [("a", 8), ("b", 0)]
+    return packed_columns(name, position, [(sub_name, 1 << shift) for sub_name, shift in parts], keep_packed)
+
+def mod_1000_or_zero(value):
+    return value % 1000 if value is not None else 0
+
+def div_1000_or_zero(value):
+    return value / 1000 if value is not None else 0
+
+def convert_fields(csv_fields, width):
+    csv_fields = csv_fields[:width]
+    # int() already tolerates the surrounding whitespace, only fall back to
+    # the per-field safe_int when some column is blank or not an integer.
+    try:
+        values = list(map(int, csv_fields))
+    except ValueError:
+        values = [safe_int(f) for f in csv_fields]
+    if len(values) < width:
+        values.extend([None] * (width - len(values)))
+    return values
+
+class LogRecord:
+    # Parsed lines are held as a flat value list; the column-name table is
+    # shared per tag on the generated subclass instead of living in a dict
+    # on every record. Records are only turned into dicts/JSON at the sink.
+    __slots__ = ("values",)
+    schema_tag = None
+    fields = ()
+    positions = {}
+
+    def __init__(self, values):
+        self.values = values
+
+    def __getitem__(self, key):
+        return self.values[self.positions[key]]
+
+    def __setitem__(self, key, value):
+        self.values[self.positions[key]] = value
+
+    def __contains__(self, key):
+        return key in self.positions
+
+    def get(self, key, default=None):
+        position = self.positions.get(key)
+        return default if position is None else self.values[position]
+
+    def keys(self):
+        return self.fields
+
+    def to_dict(self):
+        return dict(zip(self.fields, self.values))
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+    def __reduce__(self):
+        # The generated subclasses are not module attributes, so pickle them
+        # by schema tag (used when records cross process boundaries).
+        return (restore_record, (self.schema_tag, self.values))
+
+RECORD_TYPES = {}
+
+def restore_record(schema_tag, values):
+    return RECORD_TYPES[schema_tag](values)
+
+def make_record_type(tag, columns):
+    fields = tuple(spec.name for spec in columns)
+    record_type = type(f"{tag}_Record", (LogRecord,), {
+        "__slots__": (),
+        "schema_tag": tag,
+        "fields": fields,
+        "positions": {name: i for i, name in enumerate(fields)},
+    })
+    RECORD_TYPES[tag] = record_type
+    return record_type
+
+def serialize_record(record):
+    if isinstance(record, LogRecord):
+        record = record.to_dict()
+    return json.dumps(record, ensure_ascii=False)
+
+def compile_decoder(columns, width, record_type):
+    namespace = {"convert_fields": convert_fields, "record_type": record_type}
+    items = []
+    for i, spec in enumerate(columns):
+        if spec.kind == "index":
+            expr = "index"
+        elif spec.kind == "timestamp":
+            expr = "timestamp_str"
+        elif spec.kind == "const":
+            namespace[f"const_{i}"] = spec.value
+            expr = f"const_{i}"
+        else:
+            expr = f"values[{spec.value - 1}]"
+            if spec.transform is not None:
+                namespace[f"transform_{i}"] = spec.transform
+                expr = f"transform_{i}({expr})"
+        items.append(f"        {expr},")
+    source = (
+        "def decode(csv_payload, index, timestamp_str):\n"
+        f"    values = convert_fields(csv_payload.split(','), {width})\n"
+        "    return record_type([\n" + "\n".join(items) + "\n    ])\n"
+    )
+    exec(source, namespace)
+    return namespace["decode"]
+
+def never_malperforming(parsed):
+    return False
+
+def dpp_crc_failed(parsed):
+    return parsed.get("crc") == 1
+
+def umrc_crc_failed(parsed):
+    return parsed.get("crc") == 0
+
+def cell_state_regressed(parsed):
+    if parsed["prev_state"] is not None and parsed["u_state"] is not None :
+        return parsed["prev_state"] > parsed["u_state"] or parsed["u_state"] == 8
+    return False
+
+class LogSchema:
+    def __init__(self, tag, columns, counter, ue_field="ue_id", malperforming=None, counts_crc_fails=False):
+        self.tag = tag
+        self.columns = columns
+        self.counter = counter
+        self.ue_field = ue_field
+        self.malperforming = malperforming or never_malperforming
+        self.counts_crc_fails = counts_crc_fails
+        names = [spec.name for spec in columns]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Duplicate column names in {tag} schema")
+        self.declared_columns = columns
+        self.packed_fields = {spec.name for spec in columns if spec.kind == "packed"}
+        self.build()
+
+    def build(self):
+        # (Re)compiles the record type and decoder for KEEP_PACKED_FIELDS.
+        self.columns = [spec for spec in self.declared_columns if spec.kind != "packed" or KEEP_PACKED_FIELDS]
+        self.width = max((spec.value for spec in self.columns if spec.kind in ("column", "packed")), default=0)
+        self.record_type = make_record_type(self.tag, self.columns)
+        self.decode = compile_decoder(self.columns, self.width, self.record_type)
+
+def decode_schema_log(schema, log_match, index):
+    timestamp_str = parse_timestamp_str(log_match.group("date"), log_match.group("time"))
+    return schema.decode(log_match.group("csv_payload"), index, timestamp_str)
+
+def account_schema_log(schema, username, filename, parsed, line_index, column_index, metadata_dict, metrics=None):
+    is_malperforming = schema.malperforming(parsed)
+    metadata_dict[(parsed["tag"], parsed["sector_id"], parsed[schema.ue_field])] = is_malperforming
+    crc_failed = schema.counts_crc_fails and is_malperforming
+    if metrics is not None:
+        metrics.count(schema.counter, parsed["sector_id"])
+        if crc_failed:
+            metrics.count(TOTAL_CRC_FAILS, parsed["sector_id"])
+    else:
+        sector_label = process_label(parsed.get("sector_id"))
+        schema.counter.labels(user = username, filename= filename, sector_id=sector_label).inc()
+        if crc_failed:
+            TOTAL_CRC_FAILS.labels(user = username, filename= filename, sector_id=sector_label).inc()
+    line_index[column_index] += 1
+
+def process_schema_log(schema, username, filename, log_match, line_index, column_index, metadata_dict, metrics=None):
+    parsed = decode_schema_log(schema, log_match, line_index[column_index])
+    account_schema_log(schema, username, filename, parsed, line_index, column_index, metadata_dict, metrics)
+    return parsed
 
-PCELL_STATE_CHANGE_RE = re.compile(
-    r"""
-    ^\s*
-    (?P<date>\d{6})\|(?P<time>\d{2}:\d{2}:\d{2}\.\d+)\s+
-    @(?P<slot>\d{1,3})\|(?P<id1>[0-9A-Fa-f]+)\|(?P<id2>\d+)\s+
-    [^\>]*>\s*PCELL_STATE_CHANGE,
-    (?P<csv_payload>.*?)
-    (?:\s+\(|$)
-    """,
-    re.VERBOSE,
+DPP_BASIC_SCHEMA = LogSchema(
+    tag = "DPP_BASIC",
+    counter = DPP_BASIC_LOGS_PROCESSED,
+    malperforming = dpp_crc_failed,
+    counts_crc_fails = True,
+    columns = [
+        const("tag", "DPP_BASIC"),
+        const("secondary_tag", "UNMATCHED"),
+        INDEX_COLUMN,
+        const("pb_matching_index", -1),
+        TIMESTAMP_COLUMN,
+        column("macgps_time", 1),
+        column("sector_id", 2),
+        column("ue_id", 3),
+        column("call_id", 4),
+        column("crc", 5),
+        column("retx_cnt", 6),
+        column("process_id", 7),
+        column("rnti", 8),
+        column("mcs_level", 9),
+        column("service_type", 10),
+        column("u_size", 11),
+        column("n_power_ratio", 12),
+        *decimal_packed("cqiRequest*1000+ReportHeadroom", 13, [("cqiRequest", 1000), ("ReportHeadroom", 1)]),
+        column("SIR_before_SIC_0", 14),
+        column("nInstDmrsSinrdB", 15),
+        *decimal_packed("uPuschIndex*100000+uPuschOffsetAntNum*100+mimo_en", 16, [("uPuschIndex", 100000), ("uPuschOffsetAntNum", 100), ("mimo_en", 1)]),
+        column("rb_cnt", 17),
+        column("pdecode_n_timeoffset", 18),
+        column("n_time_offset_0", 19),
+        column("n_time_offset_1", 20),
+        column("snr_0+snr_1", 21),
+        column("snr_2+snr_3", 22),
+        column("a_air_time", 23),
+        column("pdecode_packet", 24),
+        *decimal_packed("bSpsEnable*1000+isUlCompnOn*10+bBundlingPDU", 25, [("bSpsEnable", 1000), ("isUlCompnOn", 10), ("bBundlingPDU", 1)]),
+        column("push_dtx_threshold", 26),
+        column("PreRlfStayCount+isPreRlfFlagOn", 27),
+        *decimal_packed("uCompJRAntNumFromModem*1000+uCompSearchIndex*100+uLlrCombStat*10+bHarqEnable", 28,
+                        [("uCompJRAntNumFromModem", 1000), ("uCompSearchIndex", 100), ("uLlrCombStat", 10), ("bHarqEnable", 1)]),
+        column("handover_reconfig_status", 29),
+        column("ul_tx_skip_qci_flags", 30),
+        *decimal_packed("dlca_isPCellCaUeOn*1000+dlca_isSCellCaUeOn*100+ulca_isPCellCaUeOn*10+ulca_isSCellCaUeOn", 31,
+                        [("dlca_isPCellCaUeOn", 1000), ("dlca_isSCellCaUeOn", 100), ("ulca_isPCellCaUeOn", 10), ("ulca_isSCellCaUeOn", 1)]),
+    ],
 )
 
-def parse_4G_state_log_line(username, filename, raw_line, line_index, metadata_dict):
-    LOGS_PROCESSED.labels(user = username, filename= filename).inc()
-    scell_state = SCELL_STATE_ULCA_RE.match(raw_line)
-    if scell_state:
-        return process_scell_state_log(username, filename, scell_state, line_index, 0, metadata_dict)
-    pcell_ulca_state = PCELL_STATE_ULCA_RE.match(raw_line)
-    if pcell_ulca_state:
-        return process_pcell_state_ulca_log(username, filename, pcell_ulca_state, line_index, 1, metadata_dict)
-    pcell_change_state = PCELL_STATE_CHANGE_RE.match(raw_line)
-    if pcell_change_state:
-        return process_pcell_state_change_log(username, filename, pcell_change_state, line_index, 1, metadata_dict)
-    pcell_act_state = PCELL_STATE_ACT_RE.match(raw_line)
-    if pcell_act_state:
-        return process_pcell_state_act_log(username, filename, pcell_act_state, line_index, 1, metadata_dict)
-    return None
-    
-def process_dpp_basic_log(username, filename, dpp_basic, line_index, dpp_column_index, metadata_dict):
-    date = dpp_basic.group("date")
-    time = dpp_basic.group("time")
-    timestamp_str = parse_timestamp_str(date, time)
-    csv_payload = dpp_basic.group("csv_payload").strip()
-    csv_fields = [f.strip() for f in csv_payload.split(",")]
-
-    def cf(i):
-        return csv_fields[i - 1] if len(csv_fields) >= i else None
-    
-    parsed = {
-        "tag" : "DPP_BASIC",
-        "secondary_tag" : "UNMATCHED",
-        "index" : line_index[dpp_column_index],
-        "pb_matching_index" : -1,
-        "timestamp_str": timestamp_str,
-        "macgps_time": safe_int(cf(1)),
-        "sector_id": safe_int(cf(2)),
-        "ue_id": safe_int(cf(3)),
-        "call_id": safe_int(cf(4)),
-        "crc":safe_int(cf(5)),
-        "retx_cnt": safe_int(cf(6)),
-        "process_id": safe_int(cf(7)),
-        "rnti" : safe_int(cf(8)),
-        "mcs_level": safe_int(cf(9)),
-        "service_type": safe_int(cf(10)),
-        "u_size": safe_int(cf(11)),
-        "n_power_ratio": safe_int(cf(12)),
-        "cqiRequest*1000+ReportHeadroom" : safe_int(cf(13)),
-        "SIR_before_SIC_0" : safe_int(cf(14)),
-        "nInstDmrsSinrdB" : safe_int(cf(15)),
-        "uPuschIndex*100000+uPuschOffsetAntNum*100+mimo_en" : safe_int(cf(16)),
-        "rb_cnt": safe_int(cf(17)),
-        "pdecode_n_timeoffset": safe_int(cf(18)),
-        "n_time_offset_0": safe_int(cf(19)),
-        "n_time_offset_1": safe_int(cf(20)),
-        "snr_0+snr_1": safe_int(cf(21)),
-        "snr_2+snr_3": safe_int(cf(22)),
-        "a_air_time": safe_int(cf(23)),
-        "pdecode_packet": safe_int(cf(24)),
-        "bSpsEnable*1000+isUlCompnOn*10+bBundlingPDU": safe_int(cf(25)),
-        "push_dtx_threshold": safe_int(cf(26)),
-        "PreRlfStayCount+isPreRlfFlagOn": safe_int(cf(27)),
-        "uCompJRAntNumFromModem*1000+uCompSearchIndex*100+uLlrCombStat*10+bHarqEnable": safe_int(cf(28)),
-        "handover_reconfig_status": safe_int(cf(29)),
-        "ul_tx_skip_qci_flags": safe_int(cf(30)),
-        "dlca_isPCellCaUeOn*1000+dlca_isSCellCaUeOn*100+ulca_isPCellCaUeOn*10+ulca_isSCellCaUeOn": safe_int(cf(31)),
-    }
-    DPP_BASIC_LOGS_PROCESSED.labels(user = username, filename= filename, sector_id=process_label(parsed.get("sector_id"))).inc()
-    metadata_key = (parsed["tag"] , parsed["sector_id"], parsed["ue_id"])
-    metadata_dict[metadata_key] = True if parsed.get("crc") == 1 else False
-    if parsed.get("crc") == 1:
-        TOTAL_CRC_FAILS.labels(user = username, filename= filename, sector_id=process_label(parsed.get("sector_id"))).inc()
-    line_index[dpp_column_index] += 1
-    return parsed
+PB_BASIC_SCHEMA = LogSchema(
+    tag = "PB_BASIC",
+    counter = DPP_BASIC_LOGS_PROCESSED,
+    columns = [
+        const("tag", "PB_BASIC"),
+        INDEX_COLUMN,
+        TIMESTAMP_COLUMN,
+        column("macgps_time", 1),
+        column("sector_id", 2),
+        column("ue_id", 3),
+        column("call_id", 4),
+        *decimal_packed("handoverStartInd*100+isReconfigDisable*10+ReconfigStatus", 5, [("handoverStartInd", 100), ("isReconfigDisable", 10), ("ReconfigStatus", 1)]),
+        *decimal_packed("isUplink256QamEnable*10000u+isBundlingEnable*1000u+NoResourceRestrictionForTTIBundling*100u+isEharqPatternFddOn*10u+isQciOneEnable", 6,
+                        [("isUplink256QamEnable", 10000), ("isBundlingEnable", 1000), ("NoResourceRestrictionForTTIBundling", 100), ("isEharqPatternFddOn", 10), ("isQciOneEnable", 1)]),
+        # The same flag names appear twice in this word, so the sub-fields carry their bit.
+        *bit_packed("isPCellCaUeOn<<3+isSCellCaUeOn<<2+isPCellCaUeOn<<1+isSCellCaUeOn", 7,
+                    [("isPCellCaUeOn_bit3", 3), ("isSCellCaUeOn_bit2", 2), ("isPCellCaUeOn_bit1", 1), ("isSCellCaUeOn_bit0", 0)]),
+        column("u_service_type", 8),
+        column("u_mcs_level", 9),
+        *decimal_packed("bPduBuildFail*1000u+bRetxPdu", 10, [("bPduBuildFail", 1000), ("bRetxPdu", 1)]),
+        column("u_retx_cnt", 11),
+        column("u_size", 12),
+        column("process_id", 13),
+        column("u_prb_offset", 14),
+        column("u_rb_cnt", 15),
+        column("u_rnti", 16),
+        column("u_tpc_cmd", 17),
+        *decimal_packed("uAggregateLevel*10000000+uDciGain", 18, [("uAggregateLevel", 10000000), ("uDciGain", 1)]),
+        *decimal_packed("uLid*10000u+uRid*100+uMirroringEnable*10+bHoppingEnable", 19, [("uLid", 10000), ("uRid", 100), ("uMirroringEnable", 10), ("bHoppingEnable", 1)]),
+        column("u_cqi_request_cnt", 20),
+        column("u_cqi_request[0]", 21),
+        column("u_cqi_request[1]", 22),
+        *decimal_packed("bPrachRbInSf*100+bDummyGrantFlag", 23, [("bPrachRbInSf", 100), ("bDummyGrantFlag", 1)]),
+        *decimal_packed("bAdaptiveRetxReq*100u+bNonAdaptiveRetx*10u+bAdaptiveRetx", 24, [("bAdaptiveRetxReq", 100), ("bNonAdaptiveRetx", 10), ("bAdaptiveRetx", 1)]),
+        column("u_link_index", 25),
+        column("b_multi_cluster_pusch_support", 26),
+        column("u_vrb_offset_cL1", 27),
+        *bit_packed("=uRbCntCL0<<8+uRbCntCL1", 28, [("uRbCntCL0", 8), ("uRbCntCL1", 0)]),
+        column("DownlinkChannelRcd.Cqi", 29),
+        column("UlPowerControlUePm.ReportHeadroom", 30),
+        column("uplink_drx_prepare_active_period_check", 31),
+        *decimal_packed("uCompSearchIndex*100u+uInterTtiRsCType*10u+bPuschDmrsCombining", 32, [("uCompSearchIndex", 100), ("uInterTtiRsCType", 10), ("bPuschDmrsCombining", 1)]),
+        *decimal_packed("isHpaUe*10000u+bUplink256QamEnable*1000u+Ul256QamReconfigState", 33, [("isHpaUe", 10000), ("bUplink256QamEnable", 1000), ("Ul256QamReconfigState", 1)]),
+    ],
+)
 
-def process_pb_basic_log(username, filename, pb_basic, line_index, pb_column_index, metadata_dict) :
-    date = pb_basic.group("date")
-    time = pb_basic.group("time")
-    timestamp_str = parse_timestamp_str(date, time)
-    csv_payload = pb_basic.group("csv_payload").strip()
-    csv_fields = [f.strip() for f in csv_payload.split(",")]
-
-    def cf(i):
-        return csv_fields[i - 1] if len(csv_fields) >= i else None
-    
-    parsed = {
-        "tag" : "PB_BASIC",
-        "index" : line_index[pb_column_index],  
-        "timestamp_str": timestamp_str,
-        "macgps_time": safe_int(cf(1)),
-        "sector_id": safe_int(cf(2)),
-        "ue_id": safe_int(cf(3)),
-        "call_id": safe_int(cf(4)),
-        "handoverStartInd*100+isReconfigDisable*10+ReconfigStatus":safe_int(cf(5)),
-        "isUplink256QamEnable*10000u+isBundlingEnable*1000u+NoResourceRestrictionForTTIBundling*100u+isEharqPatternFddOn*10u+isQciOneEnable": safe_int(cf(6)),
-        "isPCellCaUeOn<<3+isSCellCaUeOn<<2+isPCellCaUeOn<<1+isSCellCaUeOn": safe_int(cf(7)),
-        "u_service_type" : safe_int(cf(8)),
-        "u_mcs_level": safe_int(cf(9)),
-        "bPduBuildFail*1000u+bRetxPdu": safe_int(cf(10)),
-        "u_retx_cnt": safe_int(cf(11)),
-        "u_size": safe_int(cf(12)),
-        "process_id" : safe_int(cf(13)),
-        "u_prb_offset" : safe_int(cf(14)),
-        "u_rb_cnt" : safe_int(cf(15)),
-        "u_rnti" : safe_int(cf(16)),
-        "u_tpc_cmd": safe_int(cf(17)),
-        "uAggregateLevel*10000000+uDciGain": safe_int(cf(18)),
-        "uLid*10000u+uRid*100+uMirroringEnable*10+bHoppingEnable": safe_int(cf(19)),
-        "u_cqi_request_cnt": safe_int(cf(20)),
-        "u_cqi_request[0]": safe_int(cf(21)),
-        "u_cqi_request[1]": safe_int(cf(22)),
-        "bPrachRbInSf*100+bDummyGrantFlag": safe_int(cf(23)),
-        "bAdaptiveRetxReq*100u+bNonAdaptiveRetx*10u+bAdaptiveRetx": safe_int(cf(24)),
-        "u_link_index": safe_int(cf(25)),
-        "b_multi_cluster_pusch_support": safe_int(cf(26)),
-        "u_vrb_offset_cL1": safe_int(cf(27)),
-        "=uRbCntCL0<<8+uRbCntCL1" : safe_int(cf(28)),
-        "DownlinkChannelRcd.Cqi": safe_int(cf(29)),
-        "UlPowerControlUePm.ReportHeadroom": safe_int(cf(30)),
-        "uplink_drx_prepare_active_period_check": safe_int(cf(31)),
-        "uCompSearchIndex*100u+uInterTtiRsCType*10u+bPuschDmrsCombining": safe_int(cf(32)),
-        "isHpaUe*10000u+bUplink256QamEnable*1000u+Ul256QamReconfigState": safe_int(cf(33)),
-    }
-    DPP_BASIC_LOGS_PROCESSED.labels(user = username, filename= filename, sector_id=process_label(parsed.get("sector_id"))).inc()
-    metadata_key = (parsed["tag"] , parsed["sector_id"], parsed["ue_id"])
-    metadata_dict[metadata_key] = False
-    line_index[pb_column_index] +=1
-    return parsed
-    
-
-def process_urac_log(username , filename , urac_log, line_index , urac_column_index, metadata_dict):
-    date = urac_log.group("date")
-    time = urac_log.group("time")
-    timestamp_str = parse_timestamp_str(date, time)
-    csv_payload = urac_log.group("csv_payload").strip()
-    csv_fields = [f.strip() for f in csv_payload.split(",")]
-
-    def cf(i):
-        return csv_fields[i - 1] if len(csv_fields) >= i else None
-
-    parsed = {
-        "tag": "URAC_RA",
-        "index": line_index[urac_column_index],
-        "timestamp_str": timestamp_str,
-        "macgps_time": safe_int(cf(1)),
-        "sector_id": safe_int(cf(2)),
-        "U_id": safe_int(cf(3)),
-        "rnti": safe_int(cf(4)),                   
-        "service_type": safe_int(cf(5)),          
-        "vo_nr_info": safe_int(cf(6)),                  
-        "bUl_mu_candidate*10000+u_mimo_mode*100+u_layer_cnt": safe_int(cf(7)),
-        "dci_format_indicator": safe_int(cf(8)),      
-        "cce_offset": safe_int(cf(9)),                 
-        "coreset_id": safe_int(cf(10)),                
-        "aggregate_level": safe_int(cf(11)),            
-        "bForcedMrcOffFlag*100+bMrcOnOff*10+ulBfMode-or-0": safe_int(cf(12)),
-        "mcs_level": safe_int(cf(13)),                  
-        "dci_mcs_level": safe_int(cf(14)),             
-        "size": safe_int(cf(15)),                      
-        "qam_info": safe_int(cf(16)),                   
-        "start_symbol": safe_int(cf(17)),               
-        "length_symbol": safe_int(cf(18)),              
-        "k2": safe_int(cf(19)),                         
-        "ul_waveform_dmrs_fdm_info": safe_int(cf(20)),
-        "process_id": safe_int(cf(21)),                
-        "retx_cnt": safe_int(cf(22)),                  
-        "dtx_cnt": safe_int(cf(23)),                    
-        "crb_offset": safe_int(cf(24)),              
-        "rb_cnt": safe_int(cf(25)),                     
-        "rbg_bitmap": safe_int(cf(26)),                
-        "uci_mux_type": safe_int(cf(27)),               
-        "rda_info": safe_int(cf(28)),                  
-        "bwp_info": safe_int(cf(29)),                  
-        "ul_ca_act_info": safe_int(cf(30)),            
-        "allocation_list_pdu_cnt": safe_int(cf(31)),   
-        "allocation_list_pdcch_airtime": safe_int(cf(32)), 
-        "allocation_list_pusch_airtime": safe_int(cf(33)), 
-    }
-    metadata_key = (parsed["tag"] , parsed["sector_id"], parsed["U_id"])
-    metadata_dict[metadata_key] = False
-    line_index[urac_column_index] +=1
-    URAC_RA_LOGS_PROCESSED.labels(user = username, filename= filename, sector_id=process_label(parsed.get("sector_id"))).inc()
-    return parsed
+URAC_RA_SCHEMA = LogSchema(
+    tag = "URAC_RA",
+    counter = URAC_RA_LOGS_PROCESSED,
+    ue_field = "U_id",
+    columns = [
+        const("tag", "URAC_RA"),
+        INDEX_COLUMN,
+        TIMESTAMP_COLUMN,
+        column("macgps_time", 1),
+        column("sector_id", 2),
+        column("U_id", 3),
+        column("rnti", 4),
+        column("service_type", 5),
+        column("vo_nr_info", 6),
+        *decimal_packed("bUl_mu_candidate*10000+u_mimo_mode*100+u_layer_cnt", 7, [("bUl_mu_candidate", 10000), ("u_mimo_mode", 100), ("u_layer_cnt", 1)]),
+        column("dci_format_indicator", 8),
+        column("cce_offset", 9),
+        column("coreset_id", 10),
+        column("aggregate_level", 11),
+        *decimal_packed("bForcedMrcOffFlag*100+bMrcOnOff*10+ulBfMode-or-0", 12, [("bForcedMrcOffFlag", 100), ("bMrcOnOff", 10), ("ulBfMode", 1)]),
+        column("mcs_level", 13),
+        column("dci_mcs_level", 14),
+        column("size", 15),
+        column("qam_info", 16),
+        column("start_symbol", 17),
+        column("length_symbol", 18),
+        column("k2", 19),
+        column("ul_waveform_dmrs_fdm_info", 20),
+        column("process_id", 21),
+        column("retx_cnt", 22),
+        column("dtx_cnt", 23),
+        column("crb_offset", 24),
+        column("rb_cnt", 25),
+        column("rbg_bitmap", 26),
+        column("uci_mux_type", 27),
+        column("rda_info", 28),
+        column("bwp_info", 29),
+        column("ul_ca_act_info", 30),
+        column("allocation_list_pdu_cnt", 31),
+        column("allocation_list_pdcch_airtime", 32),
+        column("allocation_list_pusch_airtime", 33),
+    ],
+)
 
+UMRC_DP_SCHEMA = LogSchema(
+    tag = "UMRC_DP",
+    counter = UMRC_DP_LOGS_PROCESSED,
+    ue_field = "U_id",
+    malperforming = umrc_crc_failed,
+    counts_crc_fails = True,
+    columns = [
+        const("tag", "UMRC_DP"),
+        INDEX_COLUMN,
+        TIMESTAMP_COLUMN,
+        column("macgps_time", 1),
+        column("sector_id", 2),
+        column("U_id", 3),
+        column("air_time", 4),
+        column("pdu_cnt", 5),
+        column("crc", 6),
+        column("rnti", 7),
+        *decimal_packed("mimo_mode*100+selected_rx_mode", 8, [("mimo_mode", 100), ("selected_rx_mode", 1)]),
+        column("retx_pdu", 9),
+        column("retx_cnt", 10),
+        column("process_id", 11),
+        column("mcs_level", 12),
+        column("rb_index", 13),
+        column("rb_cnt", 14),
+        column("rbg_bit_map", 15),
+        column("physical_ant_bit_map", 16),
+        column("size", 17),
+        column("packet_offset", 18),
+        column("time_offset", 19),
+        column("valid_time_info", 20),
+        column("new_tx_air_time", 21),
+        column("additional_harq_info", 22),
+        column("service_type", 23),
+        column("uci_mux_info", 24),
+        *decimal_packed("forced_mrcOff_flag*100+mrc_on_off*10+ulbfMode", 25, [("forced_mrcOff_flag", 100), ("mrc_on_off", 10), ("ulbfMode", 1)]),
+        column("harq_buffer_overflow", 26),
+        column("SINR[0]", 27, safe_log10),
+        column("SINR[1]", 28, safe_log10),
+        column("preSINR[0]", 29, safe_log10),
+        column("preSINR[1]", 30, safe_log10),
+        column("preamble_index", 31),
+        column("slot_agg_pdu_index", 32),
+        column("ul_ca_act_info", 33),
+    ],
+)
 
-def process_umrc_dp_log(username, filename, umrc_dp_log, line_index, umrc_dp_column_index, metadata_dict):
-    date = umrc_dp_log.group("date")
-    time = umrc_dp_log.group("time")
-    timestamp_str = parse_timestamp_str(date, time)
-    csv_payload = umrc_dp_log.group("csv_payload").strip()
-    csv_fields = [f.strip() for f in csv_payload.split(",")]
-
-    def cf(i):
-        return csv_fields[i - 1] if len(csv_fields) >= i else None
-
-    parsed = {
-        "tag" : "UMRC_DP",
-        "index" : line_index[umrc_dp_column_index],
-        "timestamp_str": timestamp_str,
-        "macgps_time": safe_int(cf(1)),
-        "sector_id": safe_int(cf(2)),
-        "U_id": safe_int(cf(3)),
-        "air_time": safe_int(cf(4)),
-        "pdu_cnt": safe_int(cf(5)),
-        "crc": safe_int(cf(6)),
-        "rnti": safe_int(cf(7)),
-        "mimo_mode*100+selected_rx_mode": safe_int(cf(8)),
-        "retx_pdu": safe_int(cf(9)),
-        "retx_cnt": safe_int(cf(10)),
-        "process_id": safe_int(cf(11)),
-        "mcs_level": safe_int(cf(12)),
-        "rb_index": safe_int(cf(13)),
-        "rb_cnt": safe_int(cf(14)),
-        "rbg_bit_map": safe_int(cf(15)),
-        "physical_ant_bit_map": safe_int(cf(16)),
-        "size": safe_int(cf(17)),
-        "packet_offset": safe_int(cf(18)),
-        "time_offset": safe_int(cf(19)),
-        "valid_time_info": safe_int(cf(20)),
-        "new_tx_air_time": safe_int(cf(21)),
-        "additional_harq_info": safe_int(cf(22)),
-        "service_type": safe_int(cf(23)),
-        "uci_mux_info": safe_int(cf(24)),
-        "forced_mrcOff_flag*100+mrc_on_off*10+ulbfMode": safe_int(cf(25)),
-        "harq_buffer_overflow": safe_int(cf(26)),
-        "SINR[0]": safe_log10(safe_int(cf(27))),
-        "SINR[1]": safe_log10(safe_int(cf(28))),
-        "preSINR[0]": safe_log10(safe_int(cf(29))),
-        "preSINR[1]": safe_log10(safe_int(cf(30))),
-        "preamble_index": safe_int(cf(31)),
-        "slot_agg_pdu_index": safe_int(cf(32)),
-        "ul_ca_act_info": safe_int(cf(33)),
-    }
-    metadata_key = (parsed["tag"] , parsed["sector_id"], parsed["U_id"])
-    line_index[umrc_dp_column_index] += 1
-    UMRC_DP_LOGS_PROCESSED.labels(user = username, filename= filename, sector_id=process_label(parsed.get("sector_id"))).inc()
-    if parsed.get("crc") == 0:
-        TOTAL_CRC_FAILS.labels(user = username, filename= filename, sector_id=process_label(parsed.get("sector_id"))).inc()
-        metadata_dict[metadata_key] = True
-    else :
-        metadata_dict[metadata_key] = False
-    return parsed
+ULCA_PHR_PWR_AL_SCHEMA = LogSchema(
+    tag = "ULCA_PHR_PWR_AL",
+    counter = ULCA_PHR_PWR_AL_LOGS_PROCESSED,
+    ue_field = "U_id",
+    columns = [
+        const("tag", "ULCA_PHR_PWR_AL"),
+        INDEX_COLUMN,
+        TIMESTAMP_COLUMN,
+        column("macgps_time", 1),
+        column("sector_id", 2),
+        column("U_id", 3),
+        column("ca_cc_id", 4),
+        column("equal_power_sharing_result", 5),
+        column("ul_ca_power_split_mode", 6),
+        column("pcmax_dbm", 7),
+        column("pcmax_linear", 8),
+        column("pcmaxc_dbm", 9),
+        column("pcmaxc_linear", 10),
+        column("sum_pcmaxc_linear", 11),
+        column("req_tx_power_per_rb_dbm", 12),
+        column("req_tx_power_full_rb_linear", 13),
+        column("scell_scheduling_disable_flag", 14),
+        column("ul_ca_allocated_power_linear", 15),
+        column("ul_ca_allocated_power_dbm", 16),
+        column("ul_ca_power_alloc_flag", 17),
+    ],
+)
 
+SCELL_STATE_ULCA_SCHEMA = LogSchema(
+    tag = "SCELL_STATE_ULCA",
+    counter = SCELL_STATE_ULCA_LOGS_PROCESSED,
+    malperforming = cell_state_regressed,
+    columns = [
+        const("tag", "SCELL_STATE_ULCA"),
+        INDEX_COLUMN,
+        TIMESTAMP_COLUMN,
+        column("macgps_time", 1),
+        column("sector_id", 3),
+        column("ue_id", 4),
+        column("pcell_Uid", 5),
+        column("prev_state", 6),
+        column("u_state", 7),
+        column("pcell_index", 8),
+        column("activation_bitmap", 9),
+        column("uid_bitmap", 10),
+        column("ul_activation_trigger", 11),
+        column("pdcch_order_tx_cnt", 12),
+        column("ul_repreparing_timer", 13),
+        column("pdcch_order_ack_flag", 14),
+        column("push_rx_flag", 15),
+        column("ul_deactivation_times", 16),
+        column("link_state", 17),
+        column("link_timer", 18),
+        column("scell_ta_link_state", 19),
+    ],
+)
 
-def process_ulca_phr_pwr_al_log(username, filename, ulca_phr_pwr_al_log, line_index, ulca_phr_pwr_al_column_index, metadata_dict):
-    date = ulca_phr_pwr_al_log.group("date")
-    time = ulca_phr_pwr_al_log.group("time")
-    timestamp_str = parse_timestamp_str(date, time)
-    csv_payload = ulca_phr_pwr_al_log.group("csv_payload").strip()
-    csv_fields = [f.strip() for f in csv_payload.split(",")]
-
-    def cf(i):
-        return csv_fields[i - 1] if len(csv_fields) >= i else None
-    
-    parsed = {
-        "tag": "ULCA_PHR_PWR_AL",
-        "index": line_index[ulca_phr_pwr_al_column_index],
-        "timestamp_str": timestamp_str,
-        "macgps_time": safe_int(cf(1)),   
-        "sector_id": safe_int(cf(2)),   
-        "U_id": safe_int(cf(3)),          
-        "ca_cc_id": safe_int(cf(4)),      
-        "equal_power_sharing_result": safe_int(cf(5)),   
-        "ul_ca_power_split_mode": safe_int(cf(6)),     
-        "pcmax_dbm": safe_int(cf(7)),     
-        "pcmax_linear": safe_int(cf(8)),   
-        "pcmaxc_dbm": safe_int(cf(9)),  
-        "pcmaxc_linear": safe_int(cf(10)), 
-        "sum_pcmaxc_linear": safe_int(cf(11)),          
-        "req_tx_power_per_rb_dbm": safe_int(cf(12)),    
-        "req_tx_power_full_rb_linear": safe_int(cf(13)),
-        "scell_scheduling_disable_flag": safe_int(cf(14)),
-        "ul_ca_allocated_power_linear": safe_int(cf(15)),
-        "ul_ca_allocated_power_dbm": safe_int(cf(16)),   
-        "ul_ca_power_alloc_flag": safe_int(cf(17)),     
-    }
-    metadata_key = (parsed["tag"] , parsed["sector_id"], parsed["U_id"])
-    metadata_dict[metadata_key] = False
-    line_index[ulca_phr_pwr_al_column_index] += 1
-    ULCA_PHR_PWR_AL_LOGS_PROCESSED.labels(user = username, filename= filename, sector_id=process_label(parsed.get("sector_id"))).inc()
-    return parsed
-    
-def process_scell_state_log(username, filename, scell_state_log, line_index, scell_state_column_index, metadata_dict):
-    date = scell_state_log.group("date")
-    time = scell_state_log.group("time")
-    timestamp_str = parse_timestamp_str(date, time)
-    csv_payload = scell_state_log.group("csv_payload").strip()
-    csv_fields = [f.strip() for f in csv_payload.split(",")]
-
-    def cf(i):
-        return csv_fields[i - 1] if len(csv_fields) >= i else None
-    
-    parsed = {
-        "tag": "SCELL_STATE_ULCA",
-        "index": line_index[scell_state_column_index],
-        "timestamp_str": timestamp_str,
-        "macgps_time": safe_int(cf(1)),   
-        "sector_id": safe_int(cf(3)),   
-        "ue_id": safe_int(cf(4)),          
-        "pcell_Uid": safe_int(cf(5)),      
-        "prev_state": safe_int(cf(6)),   
-        "u_state": safe_int(cf(7)),     
-        "pcell_index": safe_int(cf(8)),     
-        "activation_bitmap": safe_int(cf(9)),   
-        "uid_bitmap": safe_int(cf(10)),  
-        "ul_activation_trigger": safe_int(cf(11)), 
-        "pdcch_order_tx_cnt": safe_int(cf(12)),          
-        "ul_repreparing_timer": safe_int(cf(13)),    
-        "pdcch_order_ack_flag": safe_int(cf(14)),
-        "push_rx_flag": safe_int(cf(15)),
-        "ul_deactivation_times": safe_int(cf(16)),
-        "link_state": safe_int(cf(17)),   
-        "link_timer": safe_int(cf(18)),     
-        "scell_ta_link_state": safe_int(cf(19)),
-    }
-    metadata_key = (parsed["tag"] , parsed["sector_id"], parsed["ue_id"])
-    is_malperforming = False 
-    if parsed["prev_state"]is not None and parsed["u_state"] is not None :
-        is_malperforming = parsed["prev_state"] > parsed["u_state"] or parsed["u_state"] == 8
-    if metadata_key in metadata_dict and is_malperforming :
-        metadata_dict[metadata_key] = True 
-    else :
-        metadata_dict[metadata_key] = is_malperforming
-    line_index[scell_state_column_index] += 1
-    SCELL_STATE_ULCA_LOGS_PROCESSED.labels(user = username, filename= filename, sector_id=process_label(parsed.get("sector_id"))).inc()
-    return parsed
+PCELL_STATE_ULCA_SCHEMA = LogSchema(
+    tag = "PCELL_STATE_ULCA",
+    counter = PCELL_STATE_ULCA_LOGS_PROCESSED,
+    malperforming = cell_state_regressed,
+    columns = [
+        const("tag", "PCELL_STATE_TAG"),
+        const("tag_raw", "PCELL_STATE_ULCA"),
+        INDEX_COLUMN,
+        TIMESTAMP_COLUMN,
+        column("macgps_time", 1),
+        column("sector_id", 3),
+        column("ue_id", 4),
+        const("uemng_p2su", None),
+        column("prev_state", 5),
+        column("u_state", 6),
+        const("u_cell_num", None),
+        const("logical_cell_id", None),
+        column("pCaStat_bActMacCeExist", 7),
+        column("sCell_act_bitmap", 8),
+        column("deactivation_timer", 10),
+        column("is_deact_infinite_on", 111),
+        column("num_of_continuous_err", 12),
+        column("pdsh_harq_acked", 13),
+        column("deact_mac_ce_exist", 14),
+        column("max_deactivation_timer", 15),
+        column("act_mac_ce_ack_flag", 16),
+        column("act_mac_ce_retx_cnt", 17),
+        column("cqi_zero_count", 18),
+        column("common_ca_ud_pm_be_bitmap", 19),
+        column("dl_ca_ue_pm_scell_num", 20),
+        const("activation_req_bitmap", None),
+        const("scell_activation_bitmap", None),
+        const("ul_activation_trigger", None),
+        const("ul_deactivation_timer", None),
+        const("is_inter_site_ca_config_on", None),
+        const("backhaul_outage", None),
+        const("uhead*1000_utail", None),
+        const("uid_cnt", None),
+        const("max_transit_enqueu_per_tti", None),
+        const("pre_commit", None),
+        const("is_ue_massive_mimo_enable", None),
+        const("is_scell_srs_support_on", None),
+        const("scell_index*1000_scell_element", None),
+        const("cell_load_high_for_scell", None),
+    ],
+)
 
+PCELL_STATE_CHANGE_SCHEMA = LogSchema(
+    tag = "PCELL_STATE_CHANGE",
+    counter = PCELL_STATE_CHANGE_LOGS_PROCESSED,
+    malperforming = cell_state_regressed,
+    columns = [
+        const("tag", "PCELL_STATE_TAG"),
+        const("tag_raw", "PCELL_STATE_CHANGE"),
+        INDEX_COLUMN,
+        TIMESTAMP_COLUMN,
+        column("macgps_time", 1),
+        column("sector_id", 3),
+        column("ue_id", 4),
+        column("uemng_p2su", 5),
+        column("prev_state", 6),
+        column("u_state", 7),
+        column("u_cell_num", 8),
+        column("logical_cell_id", 8),
+        column("pCaStat_bActMacCeExist", 9),
+        column("sCell_act_bitmap", 10),
+        column("deactivation_timer", 11),
+        column("is_deact_infinite_on", 12),
+        column("num_of_continuous_err", 13),
+        column("pdsh_harq_acked", 14),
+        column("deact_mac_ce_exist", 15),
+        column("max_deactivation_timer", 16),
+        column("act_mac_ce_ack_flag", 17),
+        column("act_mac_ce_retx_cnt", 18),
+        column("cqi_zero_count", 19),
+        column("common_ca_ud_pm_be_bitmap", 20),
+        column("dl_ca_ue_pm_scell_num", 21),
+        column("activation_req_bitmap", 22),
+        const("scell_activation_bitmap", None),
+        column("ul_activation_trigger", 23),
+        column("ul_deactivation_timer", 24),
+        column("is_inter_site_ca_config_on", 25, mod_1000_or_zero),
+        column("backhaul_outage", 25, div_1000_or_zero),
+        column("uhead*1000_utail", 26),
+        column("uid_cnt", 27),
+        column("max_transit_enqueu_per_tti", 28),
+        column("pre_commit", 29),
+        column("is_ue_massive_mimo_enable", 30),
+        column("is_scell_srs_support_on", 31),
+        column("scell_index*1000_scell_element", 32),
+        column("cell_load_high_for_scell", 33),
+    ],
+)
 
-def process_pcell_state_ulca_log(username, filename, pcell_state_log, line_index, pcell_state_column_index, metadata_dict):
-    date = pcell_state_log.group("date")
-    time = pcell_state_log.group("time")
-    timestamp_str = parse_timestamp_str(date, time)
-    csv_payload = pcell_state_log.group("csv_payload").strip()
-    csv_fields = [f.strip() for f in csv_payload.split(",")]
-
-    def cf(i):
-        return csv_fields[i - 1] if len(csv_fields) >= i else None
-    
-    parsed = {
-        "tag": "PCELL_STATE_TAG",
-        "tag_raw" : "PCELL_STATE_ULCA", 
-        "index": line_index[pcell_state_column_index],
-        "timestamp_str": timestamp_str,
-        "macgps_time": safe_int(cf(1)),   
-        "sector_id": safe_int(cf(3)),   
-        "ue_id": safe_int(cf(4)),          
-        "uemng_p2su": None,      
-        "prev_state": safe_int(cf(5)),   
-        "u_state": safe_int(cf(6)),     
-        "u_cell_num": None,
-        "logical_cell_id" : None,         
-        "pCaStat_bActMacCeExist": safe_int(cf(7)),   
-        "sCell_act_bitmap": safe_int(cf(8)),  
-        "deactivation_timer": safe_int(cf(10)), 
-        "is_deact_infinite_on": safe_int(cf(111)),             
-        "num_of_continuous_err": safe_int(cf(12)),
-        "pdsh_harq_acked": safe_int(cf(13)),
-        "deact_mac_ce_exist": safe_int(cf(14)),   
-        "max_deactivation_timer": safe_int(cf(15)),     
-        "act_mac_ce_ack_flag": safe_int(cf(16)),
-        "act_mac_ce_retx_cnt": safe_int(cf(17)),
-        "cqi_zero_count": safe_int(cf(18)),
-        "common_ca_ud_pm_be_bitmap": safe_int(cf(19)),
-        "dl_ca_ue_pm_scell_num": safe_int(cf(20)),
-        "activation_req_bitmap": None,
-        "scell_activation_bitmap" : None,
-        "ul_activation_trigger": None,
-        "ul_deactivation_timer": None,
-        "is_inter_site_ca_config_on": None,
-        "backhaul_outage": None,
-        "uhead*1000_utail": None,
-        "uid_cnt": None,
-        "max_transit_enqueu_per_tti": None,
-        "pre_commit": None,
-        "is_ue_massive_mimo_enable": None,
-        "is_scell_srs_support_on": None,
-        "scell_index*1000_scell_element": None,
-        "cell_load_high_for_scell": None,
-    }
-    metadata_key = (parsed["tag"] , parsed["sector_id"], parsed["ue_id"])
-    is_malperforming = False 
-    if parsed["prev_state"]is not None and parsed["u_state"] is not None :
-        is_malperforming = parsed["prev_state"] > parsed["u_state"] or parsed["u_state"] == 8
-    if metadata_key in metadata_dict and is_malperforming :
-        metadata_dict[metadata_key] = True 
-    else :
-        metadata_dict[metadata_key] = is_malperforming
-    line_index[pcell_state_column_index] += 1
-    PCELL_STATE_ULCA_LOGS_PROCESSED.labels(user = username, filename= filename, sector_id=process_label(parsed.get("sector_id"))).inc()
-    return parsed
+PCELL_STATE_ACT_SCHEMA = LogSchema(
+    tag = "PCELL_STATE_ACT",
+    counter = PCELL_STATE_ACT_LOGS_PROCESSED,
+    malperforming = cell_state_regressed,
+    columns = [
+        const("tag", "PCELL_STATE_TAG"),
+        const("tag_raw", "PCELL_STATE_ACT"),
+        INDEX_COLUMN,
+        TIMESTAMP_COLUMN,
+        column("macgps_time", 1),
+        column("sector_id", 3),
+        column("ue_id", 4),
+        column("uemng_p2su", 5),
+        column("prev_state", 6),
+        column("u_state", 7),
+        const("u_cell_num", None),
+        column("logical_cell_id", 8),
+        column("pCaStat_bActMacCeExist", 9),
+        column("sCell_act_bitmap", 10),
+        column("deactivation_timer", 11),
+        column("is_deact_infinite_on", 12),
+        column("num_of_continuous_err", 13),
+        column("pdsh_harq_acked", 14),
+        column("deact_mac_ce_exist", 15),
+        column("max_deactivation_timer", 16),
+        column("act_mac_ce_ack_flag", 17),
+        column("act_mac_ce_retx_cnt", 18),
+        column("cqi_zero_count", 19),
+        column("common_ca_ud_pm_be_bitmap", 20),
+        column("dl_ca_ue_pm_scell_num", 21),
+        const("activation_req_bitmap", None),
+        column("scell_activation_bitmap", 22),
+        column("ul_activation_trigger", 23),
+        const("ul_deactivation_timer", None),
+        column("is_inter_site_ca_config_on", 25),
+        column("backhaul_outage", 26),
+        column("uhead*1000_utail", 27),
+        column("uid_cnt", 28),
+        const("max_transit_enqueu_per_tti", None),
+        const("pre_commit", None),
+        const("is_ue_massive_mimo_enable", None),
+        const("is_scell_srs_support_on", None),
+        column("scell_index*1000_scell_element", 29),
+        column("cell_load_high_for_scell", 30),
+    ],
+)
+# tag -> (schema, line_index column) for each replay scenario
+SCENARIO_TAG_HANDLERS = {
+    "4G_BASIC" : {
+        "DPP_BASIC" : (DPP_BASIC_SCHEMA, 0),
+        "PB_BASIC" : (PB_BASIC_SCHEMA, 1),
+    },
+    "5G" : {
+        "URAC_RA" : (URAC_RA_SCHEMA, 0),
+        "UMRC_DP" : (UMRC_DP_SCHEMA, 1),
+        "ULCA_PHR_PWR_AL" : (ULCA_PHR_PWR_AL_SCHEMA, 2),
+    },
+    "4G_STATE_CHANGE" : {
+        "SCELL_STATE_ULCA" : (SCELL_STATE_ULCA_SCHEMA, 0),
+        "PCELL_STATE_ULCA" : (PCELL_STATE_ULCA_SCHEMA, 1),
+        "PCELL_STATE_CHANGE" : (PCELL_STATE_CHANGE_SCHEMA, 1),
+        "PCELL_STATE_ACT" : (PCELL_STATE_ACT_SCHEMA, 1),
+    },
+}
+
+# Substrings that every line carrying one of the scenario's tags must contain.
+SCENARIO_TAG_PREFILTERS = {
+    "4G_BASIC" : ("_BASIC,",),
+    "5G" : ("URAC_RA,", "UMRC_DP,", "ULCA_PHR_PWR_AL,"),
+    "4G_STATE_CHANGE" : ("CELL_STATE_",),
+}
+
+# Bump when parsing logic changes in a way the schema definitions below do
+# not capture; either one invalidates cached replays.
+PARSER_VERSION = 1
+
+def transform_name(transform):
+    if transform is None:
+        return None
+    if isinstance(transform, PackedPart):
+        return repr(transform)
+    return getattr(transform, "__qualname__", repr(transform))
+
+def set_keep_packed_fields(keep):
+    # Called at startup (and in parse pool processes) before any parsing.
+    global KEEP_PACKED_FIELDS
+    keep = bool(keep)
+    if keep == KEEP_PACKED_FIELDS:
+        return
+    KEEP_PACKED_FIELDS = keep
+    schemas = {schema.tag : schema for handlers in SCENARIO_TAG_HANDLERS.values() for schema, _ in handlers.values()}
+    for schema in schemas.values():
+        schema.build()
+
+def schema_fingerprint():
+    digest = hashlib.sha256(f"parser-{PARSER_VERSION}-keep-packed-{KEEP_PACKED_FIELDS}".encode())
+    for scenario in sorted(SCENARIO_TAG_HANDLERS):
+        digest.update(repr((scenario, SCENARIO_TAG_PREFILTERS.get(scenario))).encode())
+        for tag, (schema, column_index) in sorted(SCENARIO_TAG_HANDLERS[scenario].items()):
+            digest.update(repr((tag, column_index, schema.tag, schema.ue_field, schema.malperforming.__name__,
+                                schema.counts_crc_fails, schema.counter.describe()[0].name)).encode())
+            for spec in schema.columns:
+                digest.update(repr((spec.name, spec.kind, spec.value, transform_name(spec.transform))).encode())
+    return digest.hexdigest()
+
+def match_tagged_log_line(raw_line, scenario):
+    # Most lines in a dump carry none of the scenario's tags, reject them
+    # with plain substring checks before the header regex ever runs.
+    for marker in SCENARIO_TAG_PREFILTERS[scenario]:
+        if marker in raw_line:
+            break
+    else:
+        return None
+    log_match = LOG_LINE_RE.match(raw_line)
+    if log_match is None:
+        return None
+    handler = SCENARIO_TAG_HANDLERS[scenario].get(log_match.group("tag"))
+    if handler is None:
+        return None
+    schema, column_index = handler
+    return schema, column_index, log_match
+
+def parse_tagged_log_line(username, filename, raw_line, line_index, metadata_dict, scenario, metrics=None):
+    if metrics is not None:
+        metrics.count_lines()
+    else:
+        LOGS_PROCESSED.labels(user = username, filename= filename).inc()
+    matched = match_tagged_log_line(raw_line, scenario)
+    if matched is None:
+        return None
+    schema, column_index, log_match = matched
+    return process_schema_log(schema, username, filename, log_match, line_index, column_index, metadata_dict, metrics)
 
+def parse_4G_log_line(username, filename, raw_line, line_index, metadata_dict, metrics=None):
+    return parse_tagged_log_line(username, filename, raw_line, line_index, metadata_dict, "4G_BASIC", metrics)
 
-def process_pcell_state_change_log(username, filename, pcell_state_log, line_index, pcell_state_column_index, metadata_dict):
-    date = pcell_state_log.group("date")
-    time = pcell_state_log.group("time")
-    timestamp_str = parse_timestamp_str(date, time)
-    csv_payload = pcell_state_log.group("csv_payload").strip()
-    csv_fields = [f.strip() for f in csv_payload.split(",")]
-
-    def cf(i):
-        return csv_fields[i - 1] if len(csv_fields) >= i else None
-    
-    parsed = {
-        "tag": "PCELL_STATE_TAG",
-        "tag_raw" : "PCELL_STATE_CHANGE", 
-        "index": line_index[pcell_state_column_index],
-        "timestamp_str": timestamp_str,
-        "macgps_time": safe_int(cf(1)),   
-        "sector_id": safe_int(cf(3)),   
-        "ue_id": safe_int(cf(4)),          
-        "uemng_p2su": safe_int(cf(5)),      
-        "prev_state": safe_int(cf(6)),   
-        "u_state": safe_int(cf(7)),     
-        "u_cell_num": safe_int(cf(8)),
-        "logical_cell_id" : safe_int(cf(8)),         
-        "pCaStat_bActMacCeExist": safe_int(cf(9)),   
-        "sCell_act_bitmap": safe_int(cf(10)),  
-        "deactivation_timer": safe_int(cf(11)), 
-        "is_deact_infinite_on": safe_int(cf(12)),             
-        "num_of_continuous_err": safe_int(cf(13)),
-        "pdsh_harq_acked": safe_int(cf(14)),
-        "deact_mac_ce_exist": safe_int(cf(15)),   
-        "max_deactivation_timer": safe_int(cf(16)),     
-        "act_mac_ce_ack_flag": safe_int(cf(17)),
-        "act_mac_ce_retx_cnt": safe_int(cf(18)),
-        "cqi_zero_count": safe_int(cf(19)),
-        "common_ca_ud_pm_be_bitmap": safe_int(cf(20)),
-        "dl_ca_ue_pm_scell_num": safe_int(cf(21)),
-        "activation_req_bitmap": safe_int(cf(22)),
-        "scell_activation_bitmap" : None,
-        "ul_activation_trigger": safe_int(cf(23)),
-        "ul_deactivation_timer": safe_int(cf(24)),
-        "is_inter_site_ca_config_on": safe_int(cf(25))%1000 if safe_int(cf(25)) is not None else 0,
-        "backhaul_outage": safe_int(cf(25))/1000 if safe_int(cf(25)) is not None else 0,
-        "uhead*1000_utail": safe_int(cf(26)),
-        "uid_cnt": safe_int(cf(27)),
-        "max_transit_enqueu_per_tti": safe_int(cf(28)),
-        "pre_commit": safe_int(cf(29)),
-        "is_ue_massive_mimo_enable": safe_int(cf(30)),
-        "is_scell_srs_support_on": safe_int(cf(31)),
-        "scell_index*1000_scell_element": safe_int(cf(32)),
-        "cell_load_high_for_scell": safe_int(cf(33)),
-    }
-    metadata_key = (parsed["tag"] , parsed["sector_id"], parsed["ue_id"])
-    is_malperforming = False 
-    if parsed["prev_state"]is not None and parsed["u_state"] is not None :
-        is_malperforming = parsed["prev_state"] > parsed["u_state"] or parsed["u_state"] == 8
-    if metadata_key in metadata_dict and is_malperforming :
-        metadata_dict[metadata_key] = True 
-    else :
-        metadata_dict[metadata_key] = is_malperforming
-    line_index[pcell_state_column_index] += 1
-    PCELL_STATE_CHANGE_LOGS_PROCESSED.labels(user = username, filename= filename, sector_id=process_label(parsed.get("sector_id"))).inc()
-    return parsed
+def parse_5G_log_line(username, filename, raw_line, line_index, metadata_dict, metrics=None):
+    return parse_tagged_log_line(username, filename, raw_line, line_index, metadata_dict, "5G", metrics)
 
-def process_pcell_state_act_log(username, filename, pcell_state_log, line_index, pcell_state_column_index, metadata_dict):
-    date = pcell_state_log.group("date")
-    time = pcell_state_log.group("time")
-    timestamp_str = parse_timestamp_str(date, time)
-    csv_payload = pcell_state_log.group("csv_payload").strip()
-    csv_fields = [f.strip() for f in csv_payload.split(",")]
-
-    def cf(i):
-        return csv_fields[i - 1] if len(csv_fields) >= i else None
-    
-    parsed = {
-        "tag": "PCELL_STATE_TAG",
-        "tag_raw" : "PCELL_STATE_ACT", 
-        "index": line_index[pcell_state_column_index],
-        "timestamp_str": timestamp_str,
-        "macgps_time": safe_int(cf(1)),   
-        "sector_id": safe_int(cf(3)),   
-        "ue_id": safe_int(cf(4)),          
-        "uemng_p2su": safe_int(cf(5)),      
-        "prev_state": safe_int(cf(6)),   
-        "u_state": safe_int(cf(7)),     
-        "u_cell_num": None, 
-        "logical_cell_id" : safe_int(cf(8)),    
-        "pCaStat_bActMacCeExist": safe_int(cf(9)),   
-        "sCell_act_bitmap": safe_int(cf(10)),  
-        "deactivation_timer": safe_int(cf(11)), 
-        "is_deact_infinite_on": safe_int(cf(12)),             
-        "num_of_continuous_err": safe_int(cf(13)),
-        "pdsh_harq_acked": safe_int(cf(14)),
-        "deact_mac_ce_exist": safe_int(cf(15)),   
-        "max_deactivation_timer": safe_int(cf(16)),     
-        "act_mac_ce_ack_flag": safe_int(cf(17)),
-        "act_mac_ce_retx_cnt": safe_int(cf(18)),
-        "cqi_zero_count": safe_int(cf(19)),
-        "common_ca_ud_pm_be_bitmap": safe_int(cf(20)),
-        "dl_ca_ue_pm_scell_num": safe_int(cf(21)),
-        "activation_req_bitmap": None,
-        "scell_activation_bitmap" : safe_int(cf(22)),
-        "ul_activation_trigger": safe_int(cf(23)),
-        "ul_deactivation_timer": None,
-        "is_inter_site_ca_config_on": safe_int(cf(25)),
-        "backhaul_outage": safe_int(cf(26)),
-        "uhead*1000_utail": safe_int(cf(27)),
-        "uid_cnt": safe_int(cf(28)),
-        "max_transit_enqueu_per_tti": None,
-        "pre_commit": None,
-        "is_ue_massive_mimo_enable": None,
-        "is_scell_srs_support_on": None,
-        "scell_index*1000_scell_element": safe_int(cf(29)),
-        "cell_load_high_for_scell": safe_int(cf(30)),
-    }
-    metadata_key = (parsed["tag"] , parsed["sector_id"], parsed["ue_id"])
-    is_malperforming = False 
-    if parsed["prev_state"]is not None and parsed["u_state"] is not None :
-        is_malperforming = parsed["prev_state"] > parsed["u_state"] or parsed["u_state"] == 8
-    if metadata_key in metadata_dict and is_malperforming :
-        metadata_dict[metadata_key] = True 
-    else :
-        metadata_dict[metadata_key] = is_malperforming
-    line_index[pcell_state_column_index] += 1
-    PCELL_STATE_ACT_LOGS_PROCESSED.labels(user = username, filename= filename, sector_id=process_label(parsed.get("sector_id"))).inc()
-    return parsed
+def parse_4G_state_log_line(username, filename, raw_line, line_index, metadata_dict, metrics=None):
+    return parse_tagged_log_line(username, filename, raw_line, line_index, metadata_dict, "4G_STATE_CHANGE", metrics)
@@ -1,61 +1,71 @@
 import threading
 import time
-import json
 import requests
-from flaskr.scripts.parser import parse_4G_log_line,parse_5G_log_line,parse_4G_state_log_line
+import os
+import gzip
+import json
+from flaskr.scripts.parser import parse_4G_log_line,parse_5G_log_line,parse_4G_state_log_line,serialize_record,SCENARIO_TAG_PREFILTERS,SCENARIO_TAG_HANDLERS,DPP_BASIC_SCHEMA
+from flaskr.scripts.log_reader import TextLogReader, FollowLogReader, compressed_opener, open_marked_reader
+from flaskr.scripts.parallel_parse import iter_parallel_records
+from flaskr.scripts.batch_parser import parse_block_records
+from flaskr.scripts.parse_cache import replay_cache_key, open_cache_entry, ParseCacheWriter, evict_to_budget
+from flaskr.scripts.checkpoint import ReplayCheckpointer, load_checkpoint, restore_worker_state
+from flaskr.scripts.loki_push import PushPipeline, RateLimitClient, loki_session, loki_rate_limiter
+from flaskr.scripts.loki_spool import loki_spool
+from flaskr.scripts.loki_shards import loki_shard_set, shard_key
+from flaskr.scripts.pacing import ReplayPacer
+from flaskr.scripts.timestamps import EntryClock
+from flaskr.scripts.metrics import process_label, LOGS_PROCESSED, MetricsAccumulator, RUN_SERIES, ReplayStageMetrics, LOKI_PUSH_SECONDS, LOKI_PUSH_BYTES, REPLAY_BATCH_ENTRIES
 import logging
-from flaskr.db.database_functions import save_metadata_to_db
+from flaskr.db.database_functions import save_metadata_to_db, save_run_summary
+import datetime
 
 logger = logging.getLogger(__name__)
 
-class RateLimiter:
-    def __init__(self, requests_per_second):
-        self.requests_per_second = requests_per_second
-        self.last_request_time = 0
-        self.min_interval = 1.0 / requests_per_second if requests_per_second > 0 else 0
-
-    def wait_if_needed(self):
-        if self.requests_per_second <= 0:
-            return
-            
-        current_time = time.time()
-        time_since_last_request = current_time - self.last_request_time
-        sleep_time = self.min_interval - time_since_last_request
-        
-        if sleep_time > 0:
-            time.sleep(sleep_time)
-            self.last_request_time = time.time()
-        else:
-            self.last_request_time = current_time
-            
-global_rate_limiter = None
+def push_to_loki(loki_url, stream_labels, values, tenant=None, timeout=10, max_retries=3, session=None, rate_limiter=None):
+    return push_streams_to_loki(loki_url, [(stream_labels, values)], tenant=tenant, timeout=timeout, max_retries=max_retries,
+                                session=session, rate_limiter=rate_limiter)
 
-def initialize_rate_limiter(requests_per_second):
-    global global_rate_limiter
-    global_rate_limiter = RateLimiter(requests_per_second)
+def push_streams_to_loki(loki_url, streams, tenant=None, timeout=10, max_retries=3, session=None, rate_limiter=None, compress=False, stages=None):
+    return post_to_loki(loki_url, encode_loki_push(streams, compress), tenant=tenant, compressed=compress, timeout=timeout,
+                        max_retries=max_retries, session=session, rate_limiter=rate_limiter, stages=stages)
 
-def process_label(v):
-    if v is None:
-        return "unknown"
-    s = str(v)
-    return s.replace('"', '\\"').replace("\n", " ")
+def encode_loki_push(streams, compress=False):
+    payload = {"streams": [{"stream": stream_labels, "values": values} for stream_labels, values in streams]}
+    body = json.dumps(payload).encode("utf-8")
+    if compress:
+        body = gzip.compress(body, compresslevel=1)
+    return body
 
-def push_to_loki(loki_url, stream_labels, values, tenant=None, timeout=10, max_retries=3):
-    payload = {"streams": [{"stream": stream_labels, "values": values}]}
+def post_to_loki(loki_url, body, tenant=None, compressed=False, timeout=10, max_retries=3, session=None, rate_limiter=None, stages=None):
     headers = {"Content-Type": "application/json"}
     if tenant:
         headers["X-Scope-OrgID"] = str(tenant)
-    
-    if global_rate_limiter:
-        global_rate_limiter.wait_if_needed()
+    if compressed:
+        headers["Content-Encoding"] = "gzip"
+    LOKI_PUSH_BYTES.observe(len(body))
     
     url = loki_url.rstrip("/") + "/loki/api/v1/push"
     
     for attempt in range(max_retries + 1):
         try:
-            resp = requests.post(url, headers=headers, json=payload, timeout=timeout)
+            if rate_limiter:
+                waited_at = time.monotonic()
+                rate_limiter.wait_if_needed()
+                if stages is not None:
+                    stages.add("rate_limit", time.monotonic() - waited_at)
+            sent_at = time.monotonic()
+            resp = (session or requests).post(url, headers=headers, data=body, timeout=timeout)
+            latency = time.monotonic() - sent_at
+            LOKI_PUSH_SECONDS.observe(latency)
+            if stages is not None:
+                stages.add("push", latency)
+            if rate_limiter:
+                rate_limiter.record(latency, throttled=resp.status_code == 429)
             if resp.status_code == 429:
                 if attempt < max_retries:
+                    if stages is not None:
+                        stages.retry("429")
                     wait_time = 2 ** attempt
                     logger.warning(f"429 Too Many Requests. Retrying in {wait_time}s (attempt {attempt + 1}/{max_retries + 1})")
                     time.sleep(wait_time)
@@ -70,6 +80,8 @@ def push_to_loki(loki_url, stream_labels, values, tenant=None, timeout=10, max_r
             # if hasattr(e , 'response') and e.response is not None:
             #     logger.error(f"Loki error text : {e.response.text}")
             if attempt < max_retries and "429" not in str(e):
+                if stages is not None:
+                    stages.retry("error")
                 wait_time = 2 ** attempt
                 logger.warning(f"Request failed. Retrying in {wait_time}s (attempt {attempt + 1}/{max_retries + 1}): {e}")
                 time.sleep(wait_time)
@@ -77,6 +89,319 @@ def push_to_loki(loki_url, stream_labels, values, tenant=None, timeout=10, max_r
             else:
                 raise e
 
+def serialize_values(values) :
+    return [[ts, serialize_record(record)] for ts, record in values]
+
+def open_log_reader(file_path, scenario, reader_mode) :
+    markers = SCENARIO_TAG_PREFILTERS.get(scenario)
+    if reader_mode == "mmap" and markers is not None :
+        return open_marked_reader(file_path, markers)
+    return TextLogReader(file_path, compressed_opener(file_path))
+
+def iter_serial_records(username, filename, file_path, scenario, line_index, metadata_dict, reader_mode, metrics=None) :
+    reader = open_log_reader(file_path, scenario, reader_mode)
+    return iter_reader_records(username, filename, reader, scenario, line_index, metadata_dict, metrics)
+
+def iter_reader_records(username, filename, reader, scenario, line_index, metadata_dict, metrics=None, stages=None) :
+    # With stages, one line in stages.sample_every has its read (the time
+    # the reader takes to hand it over) and its parse timed.
+    sample_every = stages.sample_every if stages is not None else 0
+    n = 0
+    read_from = None
+    for byte_offset, raw_line in reader:
+        n += 1
+        if n != sample_every :
+            parsed = parse_scenario(username , filename , raw_line, line_index, scenario, metadata_dict, metrics)
+        else :
+            n = 0
+            parse_from = time.perf_counter()
+            if read_from is not None :
+                stages.add_sampled("read", parse_from - read_from)
+            parsed = parse_scenario(username , filename , raw_line, line_index, scenario, metadata_dict, metrics)
+            stages.add_sampled("parse", time.perf_counter() - parse_from)
+        if parsed is not None:
+            yield parsed
+        if n == sample_every - 1 :
+            read_from = time.perf_counter()
+    count_skipped_lines(username, filename, reader, metrics)
+
+def iter_batch_records(username, filename, reader, scenario, line_index, metadata_dict, block_lines, metrics=None) :
+    # REPLAY_PARSE_MODE="batch": lines are gathered into blocks of
+    # block_lines and each block is parsed into per-tag columns at once.
+    block = []
+    for byte_offset, raw_line in reader:
+        block.append(raw_line)
+        if len(block) >= block_lines :
+            count_block_lines(username, filename, len(block), metrics)
+            yield from parse_block_records(username, filename, block, scenario, line_index, metadata_dict, metrics)
+            block = []
+    if block :
+        count_block_lines(username, filename, len(block), metrics)
+        yield from parse_block_records(username, filename, block, scenario, line_index, metadata_dict, metrics)
+    count_skipped_lines(username, filename, reader, metrics)
+
+def count_block_lines(username, filename, n, metrics=None) :
+    if metrics is not None :
+        metrics.count_lines(n)
+    else :
+        LOGS_PROCESSED.labels(user = username, filename= filename).inc(n)
+
+def use_batch_parse(app, scenario) :
+    return app.config.get("REPLAY_PARSE_MODE", "line") == "batch" and scenario in SCENARIO_TAG_HANDLERS
+
+def count_skipped_lines(username, filename, reader, metrics=None) :
+    # Lines the reader passed over without parsing are processed too. They
+    # are taken off reader.lines_skipped as they are counted, so the worker
+    # can count them as it goes and a run that stops early still has them.
+    skipped, reader.lines_skipped = reader.lines_skipped, 0
+    if skipped :
+        if metrics is not None :
+            metrics.count_lines(skipped)
+        else :
+            LOGS_PROCESSED.labels(user = username, filename= filename).inc(skipped)
+
+FOLLOW_IDLE = object()
+
+def iter_follow_records(app, username, filename, follow_path, scenario, line_index, metadata_dict, stop_event, metrics=None) :
+    # Yields parsed records as the followed file grows and FOLLOW_IDLE each
+    # time the reader has caught up, until stop_event is set.
+    reader = FollowLogReader(follow_path, stop_event,
+                             poll_interval=float(app.config.get("FOLLOW_POLL_INTERVAL", 0.5)),
+                             from_start=bool(app.config.get("FOLLOW_FROM_START", True)))
+    for byte_offset, raw_line in reader:
+        if raw_line is None :
+            yield FOLLOW_IDLE
+            continue
+        parsed = parse_scenario(username , filename , raw_line, line_index, scenario, metadata_dict, metrics)
+        if parsed is not None:
+            yield parsed
+
+def use_parallel_parse(app, file_path, scenario) :
+    parse_workers = int(app.config.get("REPLAY_PARSE_WORKERS", 1))
+    chunk_bytes = int(app.config.get("REPLAY_PARSE_CHUNK_BYTES", 64 * 1024 * 1024))
+    # Compressed uploads can only be read front to back, they are never split.
+    return (parse_workers > 1 and scenario in SCENARIO_TAG_HANDLERS and os.path.getsize(file_path) > chunk_bytes
+            and compressed_opener(file_path) is None)
+
+def iter_replay_records(app, username, filename, file_path, scenario, line_index, metadata_dict, metrics=None) :
+    reader_mode = app.config.get("REPLAY_READER", "text")
+    if use_parallel_parse(app, file_path, scenario) :
+        parse_workers = int(app.config.get("REPLAY_PARSE_WORKERS", 1))
+        chunk_bytes = int(app.config.get("REPLAY_PARSE_CHUNK_BYTES", 64 * 1024 * 1024))
+        return iter_parallel_records(username, filename, file_path, scenario, line_index, metadata_dict, parse_workers, chunk_bytes, metrics)
+    if use_batch_parse(app, scenario) :
+        reader = open_log_reader(file_path, scenario, reader_mode)
+        block_lines = int(app.config.get("REPLAY_PARSE_BLOCK_LINES", 65536))
+        return iter_batch_records(username, filename, reader, scenario, line_index, metadata_dict, block_lines, metrics)
+    return iter_serial_records(username, filename, file_path, scenario, line_index, metadata_dict, reader_mode, metrics)
+
+def open_replay_cache(app, file_path, scenario, batch_size, timestamp_mode="synthetic", write=True) :
+    # Returns (cached entry, None) on a hit and (None, writer) on a miss;
+    # without write there is no writer.
+    if not app.config.get("REPLAY_CACHE_ENABLED", False) or scenario not in SCENARIO_TAG_HANDLERS :
+        return None, None
+    cache_dir = app.config.get("REPLAY_CACHE_DIR", "replay_cache")
+    try :
+        key = replay_cache_key(file_path, scenario, batch_size, timestamp_mode)
+        cached = open_cache_entry(cache_dir, key)
+        if cached is not None :
+            return cached, None
+        return None, ParseCacheWriter(cache_dir, key) if write else None
+    except OSError as e :
+        logger.warning(f"Replay cache unavailable for {file_path}: {e}")
+        return None, None
+
+def commit_replay_cache(app, cache_writer, metadata_dict, metrics) :
+    try :
+        cache_writer.commit(metadata_dict, metrics.export_totals())
+        evict_to_budget(app.config.get("REPLAY_CACHE_DIR", "replay_cache"), int(app.config.get("REPLAY_CACHE_MAX_BYTES", 2 * 1024 ** 3)))
+    except OSError as e :
+        logger.warning(f"Could not store replay cache entry: {e}")
+        cache_writer.abort()
+
+def open_replay_checkpoint(app, username, filename, scenario, file_path, run_id, start_ns, resume) :
+    # Checkpoints need byte offsets from the serial mmap reader, line by
+    # line, so parallel and batch parses are not checkpointed. Returns
+    # (checkpointer, saved state or None).
+    if not app.config.get("REPLAY_CHECKPOINT_ENABLED", False) or scenario not in SCENARIO_TAG_PREFILTERS :
+        return None, None
+    if use_parallel_parse(app, file_path, scenario) or use_batch_parse(app, scenario) :
+        return None, None
+    checkpoint_dir = app.config.get("REPLAY_CHECKPOINT_DIR", "replay_checkpoints")
+    state = load_checkpoint(checkpoint_dir, username, filename, scenario, file_path, run_id) if resume else None
+    if state is not None :
+        run_id, start_ns = state["run_id"], state["start_ns"]
+    checkpointer = ReplayCheckpointer(checkpoint_dir, username, filename, scenario, file_path, run_id, start_ns,
+                                      interval=app.config.get("REPLAY_CHECKPOINT_INTERVAL", 30), state=state)
+    return checkpointer, state
+
+def open_rate_limiter(app, loki_url, requests_per_second, run_id) :
+    if requests_per_second <= 0 :
+        return None
+    limiter = loki_rate_limiter(loki_url, requests_per_second,
+                                min_rate=app.config.get("LOKI_RATE_MIN", 1),
+                                max_rate=app.config.get("LOKI_RATE_MAX", 200),
+                                latency_target=app.config.get("LOKI_LATENCY_TARGET_MS", 2000) / 1000,
+                                increase=app.config.get("LOKI_RATE_INCREASE", 1),
+                                adaptive=app.config.get("LOKI_RATE_ADAPTIVE", True))
+    return RateLimitClient(limiter, run_id)
+
+def open_loki_shards(app, loki_url, tenant) :
+    # None unless LOKI_SHARDS lists the endpoints/tenants to spread
+    # streams over.
+    specs = app.config.get("LOKI_SHARDS") or []
+    if not specs :
+        return None
+    return loki_shard_set(specs, loki_url, tenant,
+                          failure_threshold=app.config.get("LOKI_SHARD_FAILURE_THRESHOLD", 3),
+                          cooldown=app.config.get("LOKI_SHARD_COOLDOWN_SECONDS", 5),
+                          max_cooldown=app.config.get("LOKI_SHARD_MAX_COOLDOWN_SECONDS", 300))
+
+def post_to_shard(app, shard, body, compressed, last, rate_limiter=None, stages=None) :
+    # A shard with others to fail over to gets few retries, the last
+    # candidate the usual three.
+    post_to_loki(shard.url, body, tenant=shard.tenant, compressed=compressed,
+                 max_retries=3 if last else app.config.get("LOKI_SHARD_RETRIES", 1),
+                 session=loki_session(shard.url, app.config.get("LOKI_CONNECTION_POOL_SIZE", 16)),
+                 rate_limiter=rate_limiter, stages=stages)
+
+def open_loki_spool(app) :
+    # Process-wide write-ahead spool for pushes, None when disabled.
+    if not app.config.get("LOKI_SPOOL_ENABLED", True) :
+        return None
+    requests_per_second = float(app.config.get("LOKI_REQUESTS_PER_SECOND", 10))
+    def resend(url, tenant, body, compressed) :
+        shards = open_loki_shards(app, app.config.get("LOKI_PUSH_URL", "http://127.0.0.1:3100"), app.config.get("LOKI_TENANT"))
+        if shards is None :
+            post_to_loki(url, body, tenant=tenant, compressed=compressed,
+                         session=loki_session(url, app.config.get("LOKI_CONNECTION_POOL_SIZE", 16)),
+                         rate_limiter=open_rate_limiter(app, url, requests_per_second, "spool"))
+            return
+        shards.post(shards.route_from(url, tenant), lambda shard, last : post_to_shard(
+            app, shard, body, compressed, last, open_rate_limiter(app, shard.url, requests_per_second, "spool")))
+    return loki_spool(app.config.get("LOKI_SPOOL_DIR", "loki_spool"), resend,
+                      segment_bytes=app.config.get("LOKI_SPOOL_SEGMENT_BYTES", 64 * 1024 * 1024),
+                      max_bytes=app.config.get("LOKI_SPOOL_MAX_BYTES", 2 * 1024 ** 3),
+                      fsync=app.config.get("LOKI_SPOOL_FSYNC", False),
+                      max_retry_interval=app.config.get("LOKI_SPOOL_MAX_RETRY_SECONDS", 30))
+
+def open_push_pipeline(app, loki_url, tenant, rate_limiter=None, stages=None, spool=None, shards=None, shard_limiters=None) :
+    # With a spool, send() returns once Loki accepted the payload or it was
+    # spooled for the drainer, so on_sent acknowledgements (checkpoints)
+    # count spooled payloads as delivered. With shards, each payload is
+    # split by the streams' home shard and every part fails over on its
+    # own; shard_limiters holds the run's rate limiter per shard URL.
+    session = loki_session(loki_url, app.config.get("LOKI_CONNECTION_POOL_SIZE", 16))
+    compress = bool(app.config.get("LOKI_PUSH_GZIP", True))
+    def push(url, push_tenant, body, post) :
+        if spool is None :
+            post()
+        else :
+            spool.push(url, push_tenant, body, compress, post)
+    def send(streams) :
+        if shards is None :
+            body = encode_loki_push(streams, compress)
+            push(loki_url, tenant, body, lambda : post_to_loki(loki_url, body, tenant=tenant, compressed=compress, session=session,
+                                                               rate_limiter=rate_limiter, stages=stages))
+            return
+        groups = {}
+        for stream_labels, values in streams :
+            route = shards.route(shard_key(stream_labels))
+            groups.setdefault(route[0].name, (route, []))[1].append((stream_labels, values))
+        for route, group in groups.values() :
+            body = encode_loki_push(group, compress)
+            attempt = lambda shard, last, body=body : post_to_shard(app, shard, body, compress, last, shard_limiters.get(shard.url), stages)
+            push(route[0].url, route[0].tenant, body, lambda route=route, attempt=attempt : shards.post(route, attempt))
+    return PushPipeline(send,
+                        workers=app.config.get("LOKI_PUSH_WORKERS", 4),
+                        queue_size=app.config.get("LOKI_PUSH_QUEUE_SIZE", 16),
+                        max_bytes=app.config.get("LOKI_PUSH_MAX_BYTES", 1024 * 1024),
+                        max_age=app.config.get("LOKI_PUSH_MAX_AGE_MS", 2000) / 1000)
+
+def checkpoint_acknowledger(checkpointer, stream_labels, count) :
+    batch = checkpointer.submitted(stream_labels, count)
+    return lambda : checkpointer.acknowledge(stream_labels, count, batch)
+
+def send_batch(pipeline, stream_labels, entries, cache_base, cache_writer=None, checkpointer=None, stages=None) :
+    if checkpointer is not None :
+        entries = checkpointer.drop_acked(stream_labels, entries)
+        if not entries :
+            return 0
+    started = time.perf_counter()
+    values = serialize_values(entries)
+    serialized = time.perf_counter()
+    REPLAY_BATCH_ENTRIES.observe(len(values))
+    on_sent = None
+    if checkpointer is not None :
+        on_sent = checkpoint_acknowledger(checkpointer, stream_labels, len(values))
+    pipeline.submit(stream_labels, values, on_sent)
+    if stages is not None :
+        # push_wait is the parser blocked on full pusher queues.
+        stages.add("serialize", serialized - started)
+        stages.add("push_wait", time.perf_counter() - serialized)
+    if cache_writer is not None :
+        cache_writer.add_push(stream_labels, values, cache_base)
+    return len(values)
+
+def flush_aged_batches(pipeline, label_batches, max_age, cache_base, cache_writer=None, checkpointer=None, stages=None) :
+    # Sparse streams (rare sectors, stub DPPs) would otherwise wait for
+    # batch_size entries or the end of the file.
+    sent = 0
+    oldest = time.monotonic() - max_age
+    for batch_info in label_batches.values():
+        if batch_info["values"] and batch_info.get("since", 0) <= oldest:
+            sent += send_batch(pipeline, batch_info["labels"], batch_info["values"], cache_base, cache_writer, checkpointer, stages)
+            batch_info["values"] = []
+    pipeline.flush(max_age)
+    return sent
+
+def open_replay_pacer(app, pacing_mode, pacing_rate, replay_delay, cancel_event=None, on_wait=None, stages=None) :
+    # A legacy per-line replay_delay becomes a cap of 1/replay_delay lines/s.
+    # Returns None when the run is not paced.
+    mode = pacing_mode or app.config.get("REPLAY_PACING_MODE", "fast")
+    rate = pacing_rate or app.config.get("REPLAY_PACING_RATE", 1)
+    if mode == "fast" and replay_delay > 0 :
+        mode, rate = "lines", 1 / replay_delay
+    if mode == "fast" :
+        return None
+    return ReplayPacer(mode, rate, slice_seconds=app.config.get("REPLAY_PACING_SLICE_MS", 100) / 1000,
+                       wait=cancel_event.wait if cancel_event is not None else None, on_wait=on_wait,
+                       max_wait=app.config.get("LOKI_PUSH_MAX_AGE_MS", 2000) / 2000, stages=stages)
+
+class ReplayCancelled(Exception):
+    pass
+
+def report_progress(job, metrics, reader) :
+    # job is the scheduler's handle on this run, the fields are read by its
+    # heartbeat.
+    if job is not None :
+        job.lines = metrics.total_lines + metrics.lines
+        job.position = getattr(reader, "position", None)
+
+def push_cached_replay(cached, pipeline, cache_base, username, filename, run_id, cancel_event=None, checkpointer=None) :
+    # With a checkpointer, entries a previous attempt got acknowledged are
+    # dropped and the pushes are acknowledged like parsed batches.
+    total_sent = 0
+    for tag, sector_id, values in cached.iter_pushes(cache_base) :
+        if cancel_event is not None and cancel_event.is_set() :
+            raise ReplayCancelled()
+        stream_labels = {
+            "run_id": process_label(run_id),
+            "user": process_label(username),
+            "filename": process_label(filename),
+            "tag" : tag,
+            "sector_id": sector_id
+        }
+        on_sent = None
+        if checkpointer is not None :
+            values = checkpointer.drop_acked(stream_labels, values)
+            if not values :
+                continue
+            on_sent = checkpoint_acknowledger(checkpointer, stream_labels, len(values))
+        pipeline.submit(stream_labels, values, on_sent)
+        total_sent += len(values)
+    return total_sent
+
 def initialize_line_index(scenario) :
     if scenario == "4G_BASIC" :
         return [0 , 0]
@@ -87,49 +412,89 @@ def initialize_line_index(scenario) :
     else :
         return [0]
 
-def parse_scenario(username, filename, raw_line, line_index, scenario, metadata_dict) :
+def parse_scenario(username, filename, raw_line, line_index, scenario, metadata_dict, metrics=None) :
     if scenario == "4G_BASIC" :
-        return parse_4G_log_line(username=username,filename=filename,raw_line=raw_line,line_index=line_index, metadata_dict = metadata_dict)
+        return parse_4G_log_line(username=username,filename=filename,raw_line=raw_line,line_index=line_index, metadata_dict = metadata_dict, metrics = metrics)
     elif scenario == "5G" :
-        return parse_5G_log_line(username=username,filename=filename,raw_line=raw_line,line_index=line_index, metadata_dict = metadata_dict)
+        return parse_5G_log_line(username=username,filename=filename,raw_line=raw_line,line_index=line_index, metadata_dict = metadata_dict, metrics = metrics)
     elif scenario == "4G_STATE_CHANGE" :
-        return parse_4G_state_log_line(username=username,filename=filename,raw_line=raw_line,line_index=line_index, metadata_dict = metadata_dict)
+        return parse_4G_state_log_line(username=username,filename=filename,raw_line=raw_line,line_index=line_index, metadata_dict = metadata_dict, metrics = metrics)
     else :
         return None
 
+class PendingPBQueue :
+    # The PB_BASIC entries waiting for their DPP, keyed like a dict by
+    # (ue_id, sector_id, process_id, macgps_time) and in insertion order,
+    # with the keys also bucketed by macgps_time. An entry expires once it
+    # is more than PB_TIMEOUT behind the current time on the 40960 wheel,
+    # so after each expire() only the buckets inside that window survive and
+    # the next one looks at a handful of buckets plus what it expires,
+    # however many entries are pending.
+    def __init__(self, items=()) :
+        self.entries = {}
+        self.buckets = {}
+        self.next_seq = 0
+        for key, log_entry in items :
+            self[key] = log_entry
+
+    def __len__(self) :
+        return len(self.entries)
+
+    def __contains__(self, key) :
+        return key in self.entries
+
+    def __getitem__(self, key) :
+        return self.entries[key]
+
+    def __setitem__(self, key, log_entry) :
+        if key not in self.entries :
+            self.buckets.setdefault(key[3], {})[key] = self.next_seq
+            self.next_seq += 1
+        self.entries[key] = log_entry
+
+    def __delitem__(self, key) :
+        del self.entries[key]
+        bucket = self.buckets[key[3]]
+        del bucket[key]
+        if not bucket :
+            del self.buckets[key[3]]
+
+    def items(self) :
+        return self.entries.items()
+
+    def expire(self, curr_time, timeout) :
+        # Returns the expired (key, entry) pairs in insertion order.
+        expired = []
+        for macgps_time in [t for t in self.buckets if calculate_time_diff(t, curr_time) > timeout] :
+            expired.extend(self.buckets.pop(macgps_time).items())
+        expired.sort(key=lambda item : item[1])
+        return [(key, self.entries.pop(key)) for key, seq in expired]
+
+PB_TIMEOUT = 8
+
 def add_to_queue(pending_queue, log_entry) :
     key = (log_entry["ue_id"] , log_entry["sector_id"] , log_entry["process_id"] , log_entry["macgps_time"])
     pending_queue[key] = log_entry
     
-def check_and_process_timeout(pending_queue, curr_time, label_batches, line_index, start_ns, username, filename, run_id, tenant) :
-    timed_out_keys = []
-    stubb_dpp = []
-    for key, log_entry in pending_queue.items() :
-        time_diff = calculate_time_diff(log_entry["macgps_time"], curr_time)
-        if time_diff > 8 : 
-            timed_out_keys.append(key)
-            stub_dpp = create_stubb_dpp(log_entry)
-            stubb_dpp.append(stub_dpp)
-            line_str = json.dumps(stub_dpp, ensure_ascii=False)
-            stream_labels = {
-                "run_id": process_label(run_id),
-                "user": process_label(username),
-                "filename": process_label(filename),
-                "tag" : process_label(stub_dpp.get("tag")),
-                "sector_id": process_label(stub_dpp.get("sector_id"))
-            }
-            curr_time_str = str(start_ns + sum(line_index) * 100000) 
-            labels_key = tuple(sorted(stream_labels.items()))
-            if labels_key not in label_batches:
-                label_batches[labels_key] = {
-                    "labels": stream_labels,
-                    "values": []
-                }   
-            label_batches[labels_key]["values"].append([curr_time_str, line_str])
-    
-    for key in timed_out_keys :
-        #print(f"Removing key {key} from queue")
-        del pending_queue[key]
+def check_and_process_timeout(pending_queue, curr_time, label_batches, clock, username, filename, run_id, tenant) :
+    for key, log_entry in pending_queue.expire(curr_time, PB_TIMEOUT) :
+        stub_dpp = create_stubb_dpp(log_entry)
+        stream_labels = {
+            "run_id": process_label(run_id),
+            "user": process_label(username),
+            "filename": process_label(filename),
+            "tag" : process_label(stub_dpp.get("tag")),
+            "sector_id": process_label(stub_dpp.get("sector_id"))
+        }
+        labels_key = tuple(sorted(stream_labels.items()))
+        if labels_key not in label_batches:
+            label_batches[labels_key] = {
+                "labels": stream_labels,
+                "values": []
+            }   
+        if not label_batches[labels_key]["values"]:
+            label_batches[labels_key]["since"] = time.monotonic()
+        label_batches[labels_key]["values"].append([clock.stamp(labels_key), stub_dpp])
 
 def match_dpp_with_pb(pending_queue, dpp_entry) :
     key = (dpp_entry["ue_id"], dpp_entry["sector_id"], dpp_entry["process_id"], dpp_entry["macgps_time"] - 6) if dpp_entry["macgps_time"] >= 6 else (dpp_entry["ue_id"], dpp_entry["sector_id"], dpp_entry["process_id"], 40960 - 6 + dpp_entry["macgps_time"])
@@ -146,9 +511,6 @@ def match_dpp_with_pb(pending_queue, dpp_entry) :
         dpp_entry["pb_matching_index"] = matching_log["index"]
         dpp_entry["secondary_tag"] = "MATCHED"
         del pending_queue[matching_key]
-        # if dpp_entry["sector_id"] == 1 and dpp_entry["ue_id"] == 21 :
-        #     print(f"-------------------- index : matched {matching_log['index']} index for dpp_index {dpp_entry['index']} for time dpp : {dpp_entry['macgps_time']} and pb : {matching_log['macgps_time']}-------------------------------------")
-        # return matching_log
     return None
 
 def create_stubb_dpp(log_entry) :
@@ -171,9 +533,14 @@ def create_stubb_dpp(log_entry) :
         "u_size": log_entry["u_size"],
         "n_power_ratio": 0,
         "cqiRequest*1000+ReportHeadroom" : 0,
+        "cqiRequest": 0,
+        "ReportHeadroom": 0,
         "SIR_before_SIC_0" : 0,
         "nInstDmrsSinrdB" : 0,
         "uPuschIndex*100000+uPuschOffsetAntNum*100+mimo_en" : 0,
+        "uPuschIndex": 0,
+        "uPuschOffsetAntNum": 0,
+        "mimo_en": 0,
         "rb_cnt": log_entry["u_rb_cnt"],
         "pdecode_n_timeoffset": 0,
         "n_time_offset_0": 0,
@@ -183,14 +550,28 @@ def create_stubb_dpp(log_entry) :
         "a_air_time": 0,
         "pdecode_packet": 0,
         "bSpsEnable*1000+isUlCompnOn*10+bBundlingPDU": 0,
+        "bSpsEnable": 0,
+        "isUlCompnOn": 0,
+        "bBundlingPDU": 0,
         "push_dtx_threshold": 0,
         "PreRlfStayCount+isPreRlfFlagOn": 0,
         "uCompJRAntNumFromModem*1000+uCompSearchIndex*100+uLlrCombStat*10+bHarqEnable": 0,
+        "uCompJRAntNumFromModem": 0,
+        "uCompSearchIndex": 0,
+        "uLlrCombStat": 0,
+        "bHarqEnable": 0,
         "handover_reconfig_status": 0,
         "ul_tx_skip_qci_flags": 0,
         "dlca_isPCellCaUeOn*1000+dlca_isSCellCaUeOn*100+ulca_isPCellCaUeOn*10+ulca_isSCellCaUeOn": 0,
+        "dlca_isPCellCaUeOn": 0,
+        "dlca_isSCellCaUeOn": 0,
+        "ulca_isPCellCaUeOn": 0,
+        "ulca_isSCellCaUeOn": 0,
         "is_stub": True
     }
+    # Same keys as a parsed DPP_BASIC, packed columns included or not.
+    for name in DPP_BASIC_SCHEMA.packed_fields.difference(DPP_BASIC_SCHEMA.record_type.fields) :
+        del parsed[name]
     return parsed
 
 def calculate_time_diff(older_time, newer_time) :
@@ -200,73 +581,194 @@ def calculate_time_diff(older_time, newer_time) :
         return 40960- older_time + newer_time  
 
 def replay_file_worker(app, log_sno, username, file_path, filename,
-                       loki_url=None, batch_size=None, replay_delay=None, start_ns=None, scenario = None,run_id = None, tenant=None, requests_per_second=None):
+                       loki_url=None, batch_size=None, replay_delay=None, start_ns=None, scenario = None,run_id = None, tenant=None, requests_per_second=None,
+                       stop_event=None, resume=False, job=None, pacing_mode=None, pacing_rate=None, timestamp_mode=None):
+    # With a stop_event the worker follows file_path (a file or a directory)
+    # as it grows instead of replaying it once, until the event is set.
+    # resume picks an interrupted run up from its last checkpoint. job is
+    # set when the run comes from the scheduler: progress is reported to it
+    # and its cancel_event aborts the replay. Returns "done", "failed" or
+    # "cancelled". pacing_mode/pacing_rate select a ReplayPacer, see
+    # open_replay_pacer, and timestamp_mode an EntryClock mode.
+    # start_ns anchors the synthetic and rebased timelines.
+    follow = stop_event is not None
+    cancel_event = job.cancel_event if job is not None and not follow else None
+    outcome = "done"
     loki_url = loki_url or app.config.get("LOKI_PUSH_URL", "http://127.0.0.1:3100")
     batch_size = int(batch_size or app.config.get("REPLAY_BATCH_SIZE", 2000))
     replay_delay = float(replay_delay if replay_delay is not None else app.config.get("REPLAY_DELAY", 0))
     tenant = tenant or app.config.get("LOKI_TENANT")
-    requests_per_second = requests_per_second or app.config.get("LOKI_REQUESTS_PER_SECOND", 10) 
+    requests_per_second = float(requests_per_second or app.config.get("LOKI_REQUESTS_PER_SECOND", 10))
+    timestamp_mode = timestamp_mode or app.config.get("REPLAY_TIMESTAMP_MODE", "synthetic")
     
-    initialize_rate_limiter(requests_per_second)
+    bounded_metrics = app.config.get("METRICS_MODE", "per_file") == "bounded"
+    metrics = MetricsAccumulator(username, filename,
+                                 flush_lines=app.config.get("METRICS_FLUSH_LINES", 10000),
+                                 flush_interval=app.config.get("METRICS_FLUSH_INTERVAL_MS", 1000) / 1000,
+                                 registry=RUN_SERIES if bounded_metrics else None,
+                                 retention=app.config.get("METRICS_RUN_RETENTION_SECONDS", 3600))
+    stages = ReplayStageMetrics(run_id, sample_every=app.config.get("REPLAY_STAGE_SAMPLE_EVERY", 16), registry=RUN_SERIES,
+                                retention=app.config.get("METRICS_RUN_RETENTION_SECONDS", 3600))
+    started_at = datetime.datetime.now()
     
     label_batches = {}
     metadata_dict = {}
-    pb_pending_queue = {}
+    pb_pending_queue = PendingPBQueue()
     total_sent = 0
+    cached = None
+    cache_writer = None
+    checkpointer = None
+    pipeline = None
+    reader = None
     
     try:
-        with open(file_path, "r", errors="replace") as fh:
-            if start_ns is None :
-                offset = 1200 * 1000000000  # 1200 seconds = 20 minutes = 1,200,000,000,000 nanoseconds
-                start_ns = int(time.time() * 1_000_000_000) - offset
-            line_index = initialize_line_index(scenario)
-            for raw_line in fh:
-                raw_line = raw_line.rstrip("\n")
-                parsed = parse_scenario(username , filename , raw_line, line_index, scenario, metadata_dict)
-                if parsed is None:
-                    continue
-                
-                if parsed["tag"] == "PB_BASIC" :
-                    add_to_queue(pb_pending_queue, parsed)
-                    check_and_process_timeout(pb_pending_queue, parsed["macgps_time"], label_batches, line_index, start_ns, username, filename, run_id, tenant)
+        if start_ns is None :
+            offset = 1200 * 1000000000  # 1200 seconds = 20 minutes = 1,200,000,000,000 nanoseconds
+            start_ns = int(time.time() * 1_000_000_000) - offset
+        line_index = initialize_line_index(scenario)
+        clock_state = None
+        checkpoint_state = None
+        if not follow :
+            checkpointer, checkpoint_state = open_replay_checkpoint(app, username, filename, scenario, file_path, run_id, start_ns, resume)
+        if checkpoint_state is not None :
+            # Resume under the same run_id and timeline; whatever the old run
+            # got acknowledged after its checkpoint is dropped in send_batch.
+            run_id, start_ns = checkpoint_state["run_id"], checkpoint_state["start_ns"]
+            line_index, pending_items, metadata_dict, label_batches = restore_worker_state(checkpoint_state)
+            pb_pending_queue = PendingPBQueue(pending_items.items())
+            total_sent = checkpoint_state["total_sent"]
+            timestamp_mode = checkpoint_state.get("timestamp_mode", "synthetic")
+            clock_state = checkpoint_state.get("clock")
+            if checkpoint_state.get("cached") :
+                # Interrupted while streaming from the parse cache. If the
+                # entry was evicted since, the file is parsed from the start.
+                cached, _ = open_replay_cache(app, file_path, scenario, batch_size, timestamp_mode, write=False)
+            app.logger.info(f"Resuming replay {run_id} for {username}/{filename} at byte {checkpoint_state['offset']}")
+        else :
+            cached, cache_writer = (None, None) if follow else open_replay_cache(app, file_path, scenario, batch_size, timestamp_mode)
+        clock = EntryClock(timestamp_mode, start_ns, clock_state)
+        cache_base = clock.cache_base()
+        max_batch_age = app.config.get("LOKI_PUSH_MAX_AGE_MS", 2000) / 1000
+        next_age_check = time.monotonic() + max_batch_age / 2
+        spool = open_loki_spool(app)
+        shards = open_loki_shards(app, loki_url, tenant)
+        shard_limiters = None
+        if shards is not None :
+            shard_limiters = {shard.url : open_rate_limiter(app, shard.url, requests_per_second, run_id) for shard in shards.shards}
+        pipeline = open_push_pipeline(app, loki_url, tenant, open_rate_limiter(app, loki_url, requests_per_second, run_id), stages,
+                                      spool, shards, shard_limiters)
+
+        def flush_and_report() :
+            # Every max_batch_age / 2 seconds, also while the pacer sleeps.
+            nonlocal total_sent
+            total_sent += flush_aged_batches(pipeline, label_batches, max_batch_age, cache_base, cache_writer, checkpointer, stages)
+            if reader is not None :
+                count_skipped_lines(username, filename, reader, metrics)
+            if checkpointer is not None :
+                checkpointer.flush()
+            stages.flush(metrics.total_lines + metrics.lines, len(pb_pending_queue), pipeline.backlog())
+            report_progress(job, metrics, reader)
+            if cancel_event is not None and cancel_event.is_set() :
+                raise ReplayCancelled()
+
+        pacer = None if follow else open_replay_pacer(app, pacing_mode, pacing_rate, replay_delay, cancel_event, flush_and_report, stages)
+        if cached is not None and pacer is not None :
+            # Cached pushes carry no per-line timing, a paced run parses.
+            cached.close()
+            cached = None
+        if follow :
+            records = iter_follow_records(app, username, filename, file_path, scenario, line_index, metadata_dict, stop_event, metrics)
+        elif cached is not None :
+            # Same content, scenario and parser as an earlier replay: stream
+            # its pushes, metadata and metric totals back without parsing.
+            if checkpointer is not None and checkpoint_state is None :
+                # Keeps run_id and start_ns, so a requeued run streams the
+                # rest under the same timestamps instead of starting over.
+                checkpointer.save(0, line_index, pb_pending_queue, metadata_dict, label_batches, total_sent, clock, cached=True)
+            metadata_dict.update(cached.metadata_dict())
+            metrics.import_totals(cached.metric_totals())
+            total_sent += push_cached_replay(cached, pipeline, cache_base, username, filename, run_id, cancel_event, checkpointer)
+            records = ()
+        elif checkpointer is not None :
+            reader = open_marked_reader(file_path, SCENARIO_TAG_PREFILTERS[scenario],
+                                        start=checkpoint_state["offset"] if checkpoint_state else 0)
+            records = iter_reader_records(username, filename, reader, scenario, line_index, metadata_dict, metrics, stages)
+        elif use_parallel_parse(app, file_path, scenario) or use_batch_parse(app, scenario) :
+            records = iter_replay_records(app, username, filename, file_path, scenario, line_index, metadata_dict, metrics)
+        else :
+            reader = open_log_reader(file_path, scenario, app.config.get("REPLAY_READER", "text"))
+            records = iter_reader_records(username, filename, reader, scenario, line_index, metadata_dict, metrics, stages)
+        match_n = 0
+        for parsed in records:
+            if parsed is FOLLOW_IDLE :
+                # Caught up with the writer: send partial batches now for low latency.
+                for batch_info in label_batches.values():
+                    if batch_info["values"]:
+                        total_sent += send_batch(pipeline, batch_info["labels"], batch_info["values"], cache_base, stages=stages)
+                        batch_info["values"] = []
+                metrics.flush()
+                pipeline.flush()
+                stages.flush(metrics.total_lines, len(pb_pending_queue), pipeline.backlog())
+                report_progress(job, metrics, reader)
+                continue
+            if pacer is not None :
+                pacer.tick(parsed)
+            clock.advance(parsed, line_index)
+            match_n += 1
+            if match_n == stages.sample_every :
+                match_n = 0
+                match_from = time.perf_counter()
+            if parsed["tag"] == "PB_BASIC" :
+                add_to_queue(pb_pending_queue, parsed)
+                check_and_process_timeout(pb_pending_queue, parsed["macgps_time"], label_batches, clock, username, filename, run_id, tenant)
+            
+            if parsed["tag"] == "DPP_BASIC" :
+                check_and_process_timeout(pb_pending_queue, parsed["macgps_time"], label_batches, clock, username, filename, run_id, tenant)
                 
-                if parsed["tag"] == "DPP_BASIC" :
-                    check_and_process_timeout(pb_pending_queue, parsed["macgps_time"], label_batches, line_index, start_ns, username, filename, run_id, tenant)
+                match_dpp_with_pb(pb_pending_queue, parsed)
+
+            if match_n == 0 :
+                stages.add_sampled("match", time.perf_counter() - match_from)
                     
-                    matched_pb = match_dpp_with_pb(pb_pending_queue, parsed)
-                        
-                line_str = json.dumps(parsed, ensure_ascii=False)
-                stream_labels = {
-                    "run_id": process_label(run_id),
-                    "user": process_label(username),
-                    "filename": process_label(filename),
-                    "tag" : process_label(parsed.get("tag")),
-                    "sector_id": process_label(parsed.get("sector_id"))
+            stream_labels = {
+                "run_id": process_label(run_id),
+                "user": process_label(username),
+                "filename": process_label(filename),
+                "tag" : process_label(parsed.get("tag")),
+                "sector_id": process_label(parsed.get("sector_id"))
+            }
+            labels_key = tuple(sorted(stream_labels.items()))
+        
+            if labels_key not in label_batches:
+                label_batches[labels_key] = {
+                    "labels": stream_labels,
+                    "values": []
                 }
-                curr_time = str(start_ns + sum(line_index) * 100000)
-                labels_key = tuple(sorted(stream_labels.items()))
-            
-                if labels_key not in label_batches:
-                    label_batches[labels_key] = {
-                        "labels": stream_labels,
-                        "values": []
-                    }
-                label_batches[labels_key]["values"].append([curr_time, line_str])
-                if len(label_batches[labels_key]["values"]) >= batch_size:
-                    # first_time = label_batches[labels_key]["values"][0][0]
-                    # last_time = label_batches[labels_key]["values"][-1][0]
-                    # print(f"Sending bactch : start time {first_time} end time : {last_time} current sys time {time.time_ns()}")
-                    push_to_loki(loki_url, stream_labels, label_batches[labels_key]["values"], tenant=tenant)
-                    total_sent += len(label_batches[labels_key]["values"])
-                    label_batches[labels_key]["values"] = []
-                    
-                if replay_delay and replay_delay > 0:
-                    time.sleep(replay_delay)
+            if not label_batches[labels_key]["values"]:
+                label_batches[labels_key]["since"] = time.monotonic()
+            label_batches[labels_key]["values"].append([clock.stamp(labels_key), parsed])
+            if len(label_batches[labels_key]["values"]) >= batch_size:
+                total_sent += send_batch(pipeline, stream_labels, label_batches[labels_key]["values"], cache_base, cache_writer, checkpointer, stages)
+                label_batches[labels_key]["values"] = []
+
+            if time.monotonic() >= next_age_check :
+                flush_and_report()
+                next_age_check = time.monotonic() + max_batch_age / 2
+
+            if checkpointer is not None and checkpointer.due():
+                checkpointer.save(reader.position, line_index, pb_pending_queue, metadata_dict, label_batches, total_sent, clock)
+                
 
         for batch_info in label_batches.values():
             if batch_info["values"]:
-                push_to_loki(loki_url, batch_info["labels"], batch_info["values"], tenant=tenant)
-                total_sent += len(batch_info["values"])   
+                total_sent += send_batch(pipeline, batch_info["labels"], batch_info["values"], cache_base, cache_writer, checkpointer, stages)
+        pipeline.close()
+        pipeline = None
+        if spool is not None and spool.pending() :
+            app.logger.warning(f"Loki is unreachable, {spool.pending()} payloads are spooled and will be sent when it recovers")
+        if cache_writer is not None :
+            commit_replay_cache(app, cache_writer, metadata_dict, metrics)
+            cache_writer = None
         try:
             with app.app_context():
                 save_result = save_metadata_to_db(username, filename, metadata_dict)
@@ -276,17 +778,90 @@ def replay_file_worker(app, log_sno, username, file_path, filename,
                     app.logger.error(f"Failed to save metadata for {username}/{filename}")
         except Exception as e:
             app.logger.error(f"Error saving metadata for {username}/{filename}: {e}")
+        if checkpointer is not None :
+            checkpointer.complete()
+            checkpointer = None
 
+    except ReplayCancelled:
+        outcome = "cancelled"
+        logger.info(f"Replay {run_id} for {username}/{filename} cancelled")
     except Exception as e:
+        outcome = "failed"
+        if job is not None :
+            job.error = str(e)
         logger.error(f"Error while replaying {username}/{filename}: {e}")
+    finally:
+        if pipeline is not None:
+            pipeline.close(cancel=True)
+        if cached is not None:
+            cached.close()
+        if cache_writer is not None:
+            cache_writer.abort()
+        if checkpointer is not None:
+            checkpointer.close()
+        finish_replay(run_id)
+        if follow:
+            finish_follow_job(run_id)
+        if reader is not None :
+            count_skipped_lines(username, filename, reader, metrics)
+        summary = metrics.close()
+        stages.close()
+        report_progress(job, metrics, reader)
+        try:
+            with app.app_context():
+                save_run_summary(run_id, username, filename, scenario, summary, started_at=started_at)
+        except Exception as e:
+            app.logger.error(f"Error saving run summary for {username}/{filename}: {e}")
+    return outcome
+
+FOLLOW_JOBS = {}
+FOLLOW_JOBS_LOCK = threading.Lock()
+RUNNING_REPLAYS = set()
+
+def is_replay_running(run_id) :
+    with FOLLOW_JOBS_LOCK:
+        return run_id in RUNNING_REPLAYS
+
+def finish_replay(run_id) :
+    with FOLLOW_JOBS_LOCK:
+        RUNNING_REPLAYS.discard(run_id)
+
+def active_follow_jobs(username) :
+    with FOLLOW_JOBS_LOCK:
+        return {job["filename"] : run_id for run_id, job in FOLLOW_JOBS.items() if job["username"] == username}
+
+def stop_follow_job(run_id, username) :
+    with FOLLOW_JOBS_LOCK:
+        job = FOLLOW_JOBS.get(run_id)
+        if job is None or job["username"] != username :
+            return False
+        job["stop_event"].set()
+        return True
+
+def finish_follow_job(run_id) :
+    with FOLLOW_JOBS_LOCK:
+        FOLLOW_JOBS.pop(run_id, None)
+
+def register_replay(run_id, username, filename, follow=False) :
+    # Marks run_id as running in this process; a follow run gets the
+    # stop_event that ends it.
+    stop_event = None
+    with FOLLOW_JOBS_LOCK:
+        RUNNING_REPLAYS.add(run_id)
+        if follow :
+            stop_event = threading.Event()
+            FOLLOW_JOBS[run_id] = {"username": username, "filename": filename, "stop_event": stop_event}
+    return stop_event
 
 def start_replay_thread(app, log_sno, username, file_path, filename,
-                        loki_url=None, batch_size=None, replay_delay=None,start_ns=None, scenario=None,run_id= None, tenant=None, requests_per_second=None):
+                        loki_url=None, batch_size=None, replay_delay=None,start_ns=None, scenario=None,run_id= None, tenant=None, requests_per_second=None,
+                        follow=False, resume=False, pacing_mode=None, pacing_rate=None):
+    stop_event = register_replay(run_id, username, filename, follow)
     t = threading.Thread(
         target=replay_file_worker,
-        args=(app, log_sno, username, file_path, filename, loki_url, batch_size, replay_delay,start_ns,scenario,run_id, tenant, requests_per_second),
+        args=(app, log_sno, username, file_path, filename, loki_url, batch_size, replay_delay,start_ns,scenario,run_id, tenant, requests_per_second, stop_event, resume, None, pacing_mode, pacing_rate),
         daemon=True,
     )
-    logger.info(f"Replay worker started by user {username} for file : {filename}")
+    logger.info(f"Replay worker started by user {username} for file : {filename}" + (" (follow mode)" if follow else ""))
     t.start()
     return t
@@ -0,0 +1,63 @@
+# flaskr/scripts/timestamps.py
+from flaskr.scripts.parser import timestamp_str_to_ns
+
+TIMESTAMP_MODES = ("synthetic", "log", "rebased")
+
+class EntryClock:
+    # Loki timestamps for a replay's entries. "synthetic" spaces the lines
+    # 100 us apart from start_ns by their line_index, as replays always did.
+    # "log" uses the date|time header of each line and "rebased" keeps the
+    # header spacing but moves the first line to start_ns, for captures older
+    # than Loki accepts. Lines without a usable header (stub DPPs) take the
+    # time of the line that produced them. In the header modes every stream
+    # is kept strictly increasing: an entry not later than the previous one
+    # on its stream gets that entry's time + 1 ns, so equal header times and
+    # slightly out-of-order lines still sort deterministically.
+    def __init__(self, mode, start_ns, state=None):
+        if mode not in TIMESTAMP_MODES:
+            raise ValueError(f"Unknown timestamp mode {mode!r}")
+        self.mode = mode
+        self.start_ns = start_ns
+        self.log_start = None
+        self.current = start_ns
+        self.last = {}
+        if state:
+            self.log_start = state["log_start"]
+            self.current = state["current"]
+            self.last = {tuple(tuple(pair) for pair in labels_key) : ns for labels_key, ns in state["last"]}
+
+    def advance(self, parsed, line_index):
+        # Moves the clock to the line just parsed and returns its time.
+        if self.mode == "synthetic":
+            self.current = self.start_ns + sum(line_index) * 100000
+            return self.current
+        ns = timestamp_str_to_ns(parsed.get("timestamp_str"))
+        if ns is not None:
+            if self.mode == "rebased":
+                if self.log_start is None:
+                    self.log_start = ns
+                ns = self.start_ns + ns - self.log_start
+            self.current = ns
+        return self.current
+
+    def stamp(self, labels_key):
+        # Timestamp string for an entry at the current time on a stream.
+        ns = self.current
+        if self.mode != "synthetic":
+            last = self.last.get(labels_key)
+            if last is not None and ns <= last:
+                ns = last + 1
+            self.last[labels_key] = ns
+        return str(ns)
+
+    def cache_base(self):
+        # Cached pushes store offsets from this base: absolute header times
+        # must not move with the run's start_ns.
+        return 0 if self.mode == "log" else self.start_ns
+
+    def state(self):
+        return {
+            "log_start": self.log_start,
+            "current": self.current,
+            "last": [[list(labels_key), ns] for labels_key, ns in self.last.items()],
+        }
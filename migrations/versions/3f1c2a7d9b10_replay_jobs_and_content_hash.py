@@ -0,0 +1,94 @@
+"""replay jobs, run summaries and upload content hashes
+
+Revision ID: 3f1c2a7d9b10
+Revises: 
+Create Date: 2026-10-18 10:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a7d9b10'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# Databases made before this revision were built by db.create_all(), which
+# also creates the new tables on startup but never alters existing ones, so
+# every step checks what is already there.
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    tables = inspector.get_table_names()
+
+    if 'run_summary' not in tables:
+        op.create_table('run_summary',
+            sa.Column('sno', sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column('run_id', sa.String(length=100), nullable=True),
+            sa.Column('username', sa.String(length=250), nullable=False),
+            sa.Column('filename', sa.String(length=50), server_default='default_value', nullable=False),
+            sa.Column('scenario', sa.String(length=50), nullable=True),
+            sa.Column('lines_processed', sa.Integer(), nullable=False),
+            sa.Column('crc_fails', sa.Integer(), nullable=False),
+            sa.Column('tag_counts', sa.Text(), nullable=True),
+            sa.Column('started_at', sa.DateTime(), nullable=True),
+            sa.Column('finished_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('sno')
+        )
+        with op.batch_alter_table('run_summary', schema=None) as batch_op:
+            batch_op.create_index(batch_op.f('ix_run_summary_run_id'), ['run_id'], unique=False)
+            batch_op.create_index(batch_op.f('ix_run_summary_username'), ['username'], unique=False)
+            batch_op.create_index(batch_op.f('ix_run_summary_filename'), ['filename'], unique=False)
+
+    if 'replay_job' not in tables:
+        op.create_table('replay_job',
+            sa.Column('sno', sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column('run_id', sa.Integer(), nullable=False),
+            sa.Column('username', sa.String(length=250), nullable=False),
+            sa.Column('log_sno', sa.Integer(), nullable=True),
+            sa.Column('filename', sa.String(length=50), server_default='default_value', nullable=False),
+            sa.Column('file_path', sa.String(length=500), nullable=False),
+            sa.Column('file_size', sa.BigInteger(), nullable=False),
+            sa.Column('scenario', sa.String(length=50), nullable=True),
+            sa.Column('follow', sa.Boolean(), nullable=False),
+            sa.Column('resume', sa.Boolean(), nullable=False),
+            sa.Column('replay_delay', sa.Float(), nullable=True),
+            sa.Column('pacing_mode', sa.String(length=20), nullable=True),
+            sa.Column('pacing_rate', sa.Float(), nullable=True),
+            sa.Column('content_hash', sa.String(length=64), nullable=True),
+            sa.Column('attached_to', sa.Integer(), nullable=True),
+            sa.Column('status', sa.String(length=20), nullable=False),
+            sa.Column('cancel_requested', sa.Boolean(), nullable=False),
+            sa.Column('worker', sa.String(length=100), nullable=True),
+            sa.Column('progress', sa.Float(), nullable=True),
+            sa.Column('lines_processed', sa.Integer(), nullable=False),
+            sa.Column('lines_per_second', sa.Float(), nullable=True),
+            sa.Column('error', sa.Text(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('started_at', sa.DateTime(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.Column('finished_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('sno')
+        )
+        with op.batch_alter_table('replay_job', schema=None) as batch_op:
+            batch_op.create_index(batch_op.f('ix_replay_job_run_id'), ['run_id'], unique=False)
+            batch_op.create_index(batch_op.f('ix_replay_job_username'), ['username'], unique=False)
+            batch_op.create_index(batch_op.f('ix_replay_job_content_hash'), ['content_hash'], unique=False)
+            batch_op.create_index(batch_op.f('ix_replay_job_attached_to'), ['attached_to'], unique=False)
+            batch_op.create_index(batch_op.f('ix_replay_job_status'), ['status'], unique=False)
+
+    if 'content_hash' not in [column['name'] for column in inspector.get_columns('logs')]:
+        with op.batch_alter_table('logs', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('content_hash', sa.String(length=64), nullable=True))
+            batch_op.create_index(batch_op.f('ix_logs_content_hash'), ['content_hash'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('logs', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_logs_content_hash'))
+        batch_op.drop_column('content_hash')
+
+    op.drop_table('replay_job')
+    op.drop_table('run_summary')
@@ -0,0 +1,45 @@
+import random
+import pytest
+from flaskr.scripts import replay_worker
+from flaskr.scripts.metrics import MetricsAccumulator
+from flaskr.scripts.parser import SCENARIO_TAG_HANDLERS, serialize_record
+from tests.test_parallel_parse import FakeApp, generate_log, header, replay_output
+
+def parse_all(app, path, scenario, filename):
+    # Serialized records (so 0 and 0.0 differ), the pushes with synthetic
+    # timestamps (read off line_index as records come out), and the totals.
+    line_index = replay_worker.initialize_line_index(scenario)
+    metadata = {}
+    metrics = MetricsAccumulator("u", filename)
+    records = []
+    def seen(parsed):
+        for record in parsed:
+            records.append(serialize_record(record))
+            yield record
+    pushes = replay_output(seen(replay_worker.iter_replay_records(app, "u", filename, path, scenario, line_index, metadata, metrics)),
+                           line_index, "synthetic")
+    totals = metrics.export_totals()
+    return records, pushes, line_index, metadata, totals["lines"], sorted(totals["counts"])
+
+@pytest.mark.parametrize("scenario", sorted(SCENARIO_TAG_HANDLERS))
+@pytest.mark.parametrize("reader", ["text", "mmap"])
+def test_batch_parse_matches_per_line(tmp_path, scenario, reader):
+    path = str(tmp_path / "replay.log")
+    generate_log(path, scenario, 6000)
+    line = parse_all(FakeApp({"REPLAY_READER": reader}), path, scenario, "line")
+    batch = parse_all(FakeApp({"REPLAY_READER": reader, "REPLAY_PARSE_MODE": "batch", "REPLAY_PARSE_BLOCK_LINES": 700}),
+                      path, scenario, "batch")
+    assert len(line[0]) > 0
+    assert batch == line
+
+def test_batch_parse_falls_back_beyond_int64(tmp_path):
+    path = str(tmp_path / "replay.log")
+    generate_log(path, "5G", 500)
+    r = random.Random(3)
+    with open(path, "a") as fh:
+        for tag in SCENARIO_TAG_HANDLERS["5G"]:
+            fh.write(header(r) + f"{tag},1,2,{2 ** 70},4,5, 6 ,,x,1.5\n")
+    line = parse_all(FakeApp({}), path, "5G", "line")
+    batch = parse_all(FakeApp({"REPLAY_PARSE_MODE": "batch", "REPLAY_PARSE_BLOCK_LINES": 128}), path, "5G", "batch")
+    assert any(str(2 ** 70) in record for record in line[0])
+    assert batch == line
@@ -0,0 +1,68 @@
+import os
+import gzip
+import json
+import logging
+import contextlib
+import pytest
+from flaskr.scripts import replay_worker
+from tests.test_parallel_parse import FakeApp, generate_log
+
+class WorkerApp(FakeApp):
+    logger = logging.getLogger("tests")
+
+    def app_context(self):
+        return contextlib.nullcontext()
+
+def run_replay(monkeypatch, config, path, scenario, fail_after=None, resume=False):
+    # Runs replay_file_worker with Loki and the DB patched out. Posts fail
+    # once fail_after pushes went through. Returns (outcome, pushes, metadata).
+    pushes = []
+    def post(url, body, tenant=None, compressed=False, **kwargs):
+        if fail_after is not None and len(pushes) >= fail_after:
+            raise RuntimeError("loki down")
+        if compressed:
+            body = gzip.decompress(body)
+        for stream in json.loads(body)["streams"]:
+            pushes.append((json.dumps(stream["stream"], sort_keys=True), stream["values"]))
+    metadata = {}
+    monkeypatch.setattr(replay_worker, "post_to_loki", post)
+    monkeypatch.setattr(replay_worker, "save_metadata_to_db", lambda username, filename, m: metadata.update(m) or True)
+    monkeypatch.setattr(replay_worker, "save_run_summary", lambda *args, **kwargs: None)
+    outcome = replay_worker.replay_file_worker(WorkerApp(dict(config)), 1, "u", path, "f.log", "http://loki", 50, 0,
+                                               None if resume else 1_000_000_000_000, scenario, 123, resume=resume)
+    return outcome, pushes, metadata
+
+def streams(pushes):
+    out = {}
+    for labels, values in pushes:
+        out.setdefault(labels, []).extend(values)
+    return out
+
+def entry_count(pushes):
+    return sum(len(values) for _, values in pushes)
+
+@pytest.mark.parametrize("scenario", ["4G_BASIC", "5G"])
+@pytest.mark.parametrize("timestamp_mode", ["synthetic", "log"])
+@pytest.mark.parametrize("fail_after", [3, 25])
+def test_resume_drops_acknowledged_entries(tmp_path, monkeypatch, scenario, timestamp_mode, fail_after):
+    path = str(tmp_path / "replay.log")
+    generate_log(path, scenario, 6000)
+    checkpoint_dir = str(tmp_path / "checkpoints")
+    config = {"REPLAY_READER": "mmap", "REPLAY_CHECKPOINT_ENABLED": True, "REPLAY_CHECKPOINT_DIR": checkpoint_dir,
+              "REPLAY_CHECKPOINT_INTERVAL": 1e9, "REPLAY_TIMESTAMP_MODE": timestamp_mode, "LOKI_SPOOL_ENABLED": False}
+    outcome, full, full_metadata = run_replay(monkeypatch, config, path, scenario)
+    assert outcome == "done"
+    assert not os.listdir(checkpoint_dir)
+
+    config["REPLAY_CHECKPOINT_INTERVAL"] = 0.001
+    outcome, first, _ = run_replay(monkeypatch, config, path, scenario, fail_after=fail_after)
+    assert outcome == "failed"
+    assert os.listdir(checkpoint_dir)
+    outcome, rest, metadata = run_replay(monkeypatch, config, path, scenario, resume=True)
+    assert outcome == "done"
+    assert not os.listdir(checkpoint_dir)
+    # Everything acknowledged before the failure is sent exactly once.
+    assert entry_count(first) > 0
+    assert entry_count(rest) < entry_count(full)
+    assert streams(first + rest) == streams(full)
+    assert metadata == full_metadata
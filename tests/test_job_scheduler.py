@@ -0,0 +1,43 @@
+import pytest
+from flask import Flask
+from flaskr.db.database import db
+from flaskr.db.database_functions import create_replay_job, claim_next_replay_job, update_replay_job
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp_path / 'jobs.db'}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+
+def queue(username, n, follow=False):
+    return [create_replay_job(run_id, username, 1, f"{username}-{run_id}.log", f"/missing/{username}-{run_id}.log", "4G_BASIC",
+                              follow=follow).sno for run_id in range(n)]
+
+def claim(follow=False, per_user_limit=1):
+    job = claim_next_replay_job("w", follow, per_user_limit, 300)
+    return None if job is None else job.sno
+
+@pytest.mark.parametrize("per_user_limit", [1, 2])
+def test_claim_respects_per_user_limit(app, per_user_limit):
+    alice = queue("alice", 4)
+    bob = queue("bob", 1)
+    # Equal sizes, so oldest first, but never more than the limit per user.
+    assert [claim(per_user_limit=per_user_limit) for _ in range(per_user_limit)] == alice[:per_user_limit]
+    assert claim(per_user_limit=per_user_limit) == bob[0]
+    assert claim(per_user_limit=per_user_limit) is None
+    update_replay_job(alice[0], status="done")
+    assert claim(per_user_limit=per_user_limit) == alice[per_user_limit]
+    assert claim(per_user_limit=per_user_limit) is None
+
+def test_follow_jobs_are_not_limited(app):
+    replays = queue("alice", 2)
+    follows = queue("alice", 2, follow=True)
+    assert claim() == replays[0]
+    assert claim(follow=True) == follows[0]
+    assert claim(follow=True) == follows[1]
+    # Running follow jobs do not use up the user's replay slot either.
+    update_replay_job(replays[0], status="done")
+    assert claim() == replays[1]
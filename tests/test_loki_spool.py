@@ -0,0 +1,74 @@
+import time
+import threading
+import requests
+from flaskr.scripts.loki_spool import LokiSpool
+
+class FlakyLoki:
+    # Records accepted bodies; while down every post fails the way a dead
+    # Loki does.
+    def __init__(self):
+        self.down = threading.Event()
+        self.received = []
+        self.lock = threading.Lock()
+
+    def post(self, body):
+        if self.down.is_set():
+            raise requests.exceptions.ConnectionError("loki down")
+        with self.lock:
+            self.received.append(body)
+
+    def resend(self, url, tenant, body, compressed):
+        self.post(body)
+
+def open_spool(directory, loki):
+    return LokiSpool(str(directory), loki.resend, segment_bytes=512, retry_interval=0.01, max_retry_interval=0.05)
+
+def wait_drained(spool, timeout=10):
+    deadline = time.monotonic() + timeout
+    while spool.pending():
+        assert time.monotonic() < deadline, "spool did not drain"
+        time.sleep(0.01)
+
+def bodies(n):
+    return [f'{{"streams": [{{"stream": {{"n": "{i}"}}, "values": []}}]}}'.encode() for i in range(n)]
+
+def test_spool_resends_after_failed_post(tmp_path):
+    loki = FlakyLoki()
+    spool = open_spool(tmp_path, loki)
+    payloads = bodies(60)
+    try:
+        for i, body in enumerate(payloads):
+            if i == 15:
+                loki.down.set()
+            spool.push("http://loki", None, body, False, lambda body=body: loki.post(body))
+        assert spool.pending() == 45
+        loki.down.clear()
+        wait_drained(spool)
+        # Sent once each, in push order, and nothing is left on disk but the
+        # active segment.
+        assert loki.received == payloads
+        more = bodies(70)[60:]
+        for body in more:
+            spool.push("http://loki", None, body, False, lambda body=body: loki.post(body))
+        assert loki.received == payloads + more
+    finally:
+        spool.close()
+    assert len([name for name in tmp_path.iterdir() if name.suffix == ".seg"]) == 1
+
+def test_spool_resends_after_restart(tmp_path):
+    loki = FlakyLoki()
+    loki.down.set()
+    spool = open_spool(tmp_path, loki)
+    payloads = bodies(30)
+    for body in payloads:
+        spool.push("http://loki", None, body, False, lambda body=body: loki.post(body))
+    spool.close()
+    assert loki.received == []
+
+    loki.down.clear()
+    spool = open_spool(tmp_path, loki)
+    try:
+        wait_drained(spool)
+        assert loki.received == payloads
+    finally:
+        spool.close()
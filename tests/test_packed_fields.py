@@ -0,0 +1,43 @@
+import pytest
+from flaskr.scripts import replay_worker
+from flaskr.scripts.parser import SCENARIO_TAG_HANDLERS, DPP_BASIC_SCHEMA, schema_fingerprint, set_keep_packed_fields
+from tests.test_parallel_parse import FakeApp, generate_log, replay_output, CHUNK_BYTES
+
+@pytest.fixture
+def packed_dropped():
+    set_keep_packed_fields(False)
+    yield
+    set_keep_packed_fields(True)
+
+def parse(app, path, scenario):
+    line_index = replay_worker.initialize_line_index(scenario)
+    metadata = {}
+    pushes = replay_output(replay_worker.iter_replay_records(app, "u", "f.log", path, scenario, line_index, metadata),
+                           line_index, "synthetic")
+    return pushes, line_index, metadata
+
+def test_fingerprint_follows_keep_packed():
+    kept = schema_fingerprint()
+    set_keep_packed_fields(False)
+    try:
+        assert schema_fingerprint() != kept
+    finally:
+        set_keep_packed_fields(True)
+    assert schema_fingerprint() == kept
+
+@pytest.mark.parametrize("config", [{}, {"REPLAY_PARSE_MODE": "batch", "REPLAY_PARSE_BLOCK_LINES": 500},
+                                    {"REPLAY_PARSE_WORKERS": 2, "REPLAY_PARSE_CHUNK_BYTES": CHUNK_BYTES}])
+def test_packed_fields_dropped(tmp_path, packed_dropped, config):
+    path = str(tmp_path / "replay.log")
+    generate_log(path, "4G_BASIC", 3000)
+    pushes, line_index, metadata = parse(FakeApp(config), path, "4G_BASIC")
+    assert sum(line_index) > 0
+    packed = {spec.name for handlers in SCENARIO_TAG_HANDLERS.values() for schema, _ in handlers.values()
+              for spec in schema.declared_columns if spec.kind == "packed"}
+    entries = [entry for values in pushes[0].values() for _, entry in values]
+    assert {"MATCHED", "STUB"} <= {entry.get("secondary_tag") for entry in entries}
+    for entry in entries:
+        assert not packed & entry.keys()
+        if entry["tag"] == "DPP_BASIC":
+            assert "cqiRequest" in entry
+            assert set(entry) - {"is_stub"} == set(DPP_BASIC_SCHEMA.record_type.fields)
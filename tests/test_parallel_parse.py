@@ -0,0 +1,99 @@
+import random
+import pytest
+from flaskr.scripts import replay_worker
+from flaskr.scripts.parser import SCENARIO_TAG_HANDLERS
+from flaskr.scripts.timestamps import EntryClock
+
+CHUNK_BYTES = 16 * 1024
+
+class FakeApp:
+    def __init__(self, config):
+        self.config = config
+
+def header(r):
+    return f"261018|10:{r.randint(10, 59)}:{r.randint(10, 59)}.{r.randint(0, 999999)} @{r.randint(0, 999)}|ab|{r.randint(0, 9)} x> "
+
+def tagged_line(r, tag, macgps_time, sector_id, ue_id, process_id):
+    fields = [str(r.randint(0, 900)) for _ in range(34)]
+    fields[0], fields[1], fields[2] = str(macgps_time % 40960), str(sector_id), str(ue_id)
+    if tag == "DPP_BASIC":
+        fields[4], fields[6] = r.choice(["0", "1"]), str(process_id)
+    else:
+        fields[12] = str(process_id)
+    return header(r) + f"{tag},{','.join(fields)}"
+
+def noise_line(r, tags):
+    return r.choice([
+        "random noise line",
+        header(r) + "OTHER_TAG,1,2,3",
+        "",
+        header(r) + r.choice(tags) + "X,1,2,3",
+        header(r) + r.choice(tags) + "," + ",".join(str(r.randint(0, 50000)) for _ in range(r.randint(1, 40))),
+        "  >>> " + r.choice(tags),
+    ])
+
+def generate_log(path, scenario, lines, seed=1):
+    # PB_BASIC lines with their DPP_BASIC 6 or 8 ticks later (some never
+    # come, so they time out into stubs) mixed with other tags and noise.
+    r = random.Random(seed)
+    tags = list(SCENARIO_TAG_HANDLERS[scenario])
+    macgps_time = 0
+    pending = []
+    with open(path, "w") as fh:
+        for _ in range(lines):
+            macgps_time += r.randint(0, 2)
+            x = r.random()
+            if scenario == "4G_BASIC" and x < 0.15:
+                key = (r.randint(0, 3), r.randint(0, 5), r.randint(0, 7))
+                pending.append((macgps_time, key))
+                fh.write(tagged_line(r, "PB_BASIC", macgps_time, *key) + "\n")
+            elif scenario == "4G_BASIC" and x < 0.3 and pending:
+                pb_time, key = pending.pop(r.randrange(len(pending)))
+                fh.write(tagged_line(r, "DPP_BASIC", pb_time + r.choice([6, 7, 8]), *key) + "\n")
+                pending = [p for p in pending if macgps_time - p[0] < 6]
+            else:
+                fh.write(noise_line(r, tags) + "\n")
+
+def replay_output(records, line_index, timestamp_mode):
+    # What replay_file_worker hands to the push pipeline for these records,
+    # with matching and PB timeouts applied the same way.
+    clock = EntryClock(timestamp_mode, 1_000_000_000_000)
+    pending = replay_worker.PendingPBQueue()
+    label_batches = {}
+    for parsed in records:
+        clock.advance(parsed, line_index)
+        if parsed["tag"] == "PB_BASIC":
+            replay_worker.add_to_queue(pending, parsed)
+            replay_worker.check_and_process_timeout(pending, parsed["macgps_time"], label_batches, clock, "u", "f.log", 1, None)
+        if parsed["tag"] == "DPP_BASIC":
+            replay_worker.check_and_process_timeout(pending, parsed["macgps_time"], label_batches, clock, "u", "f.log", 1, None)
+            replay_worker.match_dpp_with_pb(pending, parsed)
+        labels_key = (parsed.get("tag"), parsed.get("sector_id"))
+        label_batches.setdefault(labels_key, {"values": []})["values"].append([clock.stamp(labels_key), dict(parsed)])
+    return {key: batch["values"] for key, batch in label_batches.items()}, sorted(pending.items())
+
+@pytest.mark.parametrize("scenario", sorted(SCENARIO_TAG_HANDLERS))
+@pytest.mark.parametrize("timestamp_mode", ["synthetic", "log"])
+def test_parallel_parse_matches_serial(tmp_path, scenario, timestamp_mode):
+    path = str(tmp_path / "replay.log")
+    generate_log(path, scenario, 6000)
+    app = FakeApp({"REPLAY_PARSE_WORKERS": 3, "REPLAY_PARSE_CHUNK_BYTES": CHUNK_BYTES})
+    assert replay_worker.use_parallel_parse(app, path, scenario)
+
+    serial_index = replay_worker.initialize_line_index(scenario)
+    serial_metadata = {}
+    serial = replay_output(replay_worker.iter_serial_records("u", "serial", path, scenario, serial_index, serial_metadata, "text"),
+                           serial_index, timestamp_mode)
+
+    parallel_index = replay_worker.initialize_line_index(scenario)
+    parallel_metadata = {}
+    parallel = replay_output(replay_worker.iter_replay_records(app, "u", "parallel", path, scenario, parallel_index, parallel_metadata),
+                             parallel_index, timestamp_mode)
+
+    assert sum(serial_index) > 0
+    assert parallel_index == serial_index
+    assert parallel_metadata == serial_metadata
+    assert parallel == serial
+    if scenario == "4G_BASIC":
+        tags = {entry.get("secondary_tag") for values in serial[0].values() for _, entry in values}
+        assert {"MATCHED", "STUB"} <= tags
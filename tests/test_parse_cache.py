@@ -0,0 +1,46 @@
+import os
+import pytest
+from flaskr.scripts import replay_worker
+from tests.test_parallel_parse import generate_log
+from tests.test_checkpoint import run_replay, streams, entry_count
+
+def no_parse(*args, **kwargs):
+    raise AssertionError("cached replay parsed the file")
+
+@pytest.mark.parametrize("scenario", ["4G_BASIC", "5G", "4G_STATE_CHANGE"])
+@pytest.mark.parametrize("timestamp_mode", ["synthetic", "log"])
+def test_cached_replay_reproduces_pushes(tmp_path, monkeypatch, scenario, timestamp_mode):
+    path = str(tmp_path / "replay.log")
+    generate_log(path, scenario, 6000)
+    cache_dir = str(tmp_path / "cache")
+    config = {"REPLAY_CACHE_ENABLED": True, "REPLAY_CACHE_DIR": cache_dir, "REPLAY_TIMESTAMP_MODE": timestamp_mode,
+              "LOKI_SPOOL_ENABLED": False}
+    outcome, parsed, parsed_metadata = run_replay(monkeypatch, config, path, scenario)
+    assert outcome == "done"
+    assert os.listdir(cache_dir)
+
+    monkeypatch.setattr(replay_worker, "parse_scenario", no_parse)
+    outcome, cached, cached_metadata = run_replay(monkeypatch, config, path, scenario)
+    assert outcome == "done"
+    assert entry_count(parsed) > 0
+    assert streams(cached) == streams(parsed)
+    assert cached_metadata == parsed_metadata
+
+def test_cached_replay_resumes_without_duplicates(tmp_path, monkeypatch):
+    path = str(tmp_path / "replay.log")
+    generate_log(path, "4G_BASIC", 6000)
+    checkpoint_dir = str(tmp_path / "checkpoints")
+    config = {"REPLAY_CACHE_ENABLED": True, "REPLAY_CACHE_DIR": str(tmp_path / "cache"), "REPLAY_READER": "mmap",
+              "REPLAY_CHECKPOINT_ENABLED": True, "REPLAY_CHECKPOINT_DIR": checkpoint_dir, "REPLAY_CHECKPOINT_INTERVAL": 1e9,
+              "LOKI_SPOOL_ENABLED": False}
+    outcome, full, _ = run_replay(monkeypatch, config, path, "4G_BASIC")
+    assert outcome == "done"
+
+    monkeypatch.setattr(replay_worker, "parse_scenario", no_parse)
+    outcome, first, _ = run_replay(monkeypatch, config, path, "4G_BASIC", fail_after=10)
+    assert outcome == "failed"
+    assert os.listdir(checkpoint_dir)
+    outcome, rest, _ = run_replay(monkeypatch, config, path, "4G_BASIC", resume=True)
+    assert outcome == "done"
+    assert not os.listdir(checkpoint_dir)
+    assert streams(first + rest) == streams(full)
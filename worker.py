@@ -0,0 +1,58 @@
+import argparse
+import logging
+import multiprocessing
+import signal
+import threading
+from flaskr import create_app
+
+logger = logging.getLogger("replay_worker")
+
+def run_worker(index, threads, metrics_port):
+    # One worker process: its own app, database sessions and scheduler,
+    # claiming jobs from the shared ReplayJob table.
+    app = create_app()
+    if threads:
+        app.config["REPLAY_WORKERS"] = threads
+    if metrics_port:
+        # Replay counters live in this process, Prometheus scrapes them here.
+        from prometheus_client import start_http_server
+        start_http_server(metrics_port + index)
+    from flaskr.scripts.job_scheduler import init_scheduler
+    scheduler = init_scheduler(app)
+    stopped = threading.Event()
+    def on_signal(signum, frame):
+        stopped.set()
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+    while not stopped.wait(1):
+        pass
+    logger.info(f"Replay worker {index} shutting down, requeueing running jobs")
+    scheduler.shutdown()
+
+def main():
+    app = create_app()
+    parser = argparse.ArgumentParser(description="Run replay jobs queued by the web app")
+    parser.add_argument("--processes", type=int, default=app.config.get("REPLAY_WORKER_PROCESSES", 1))
+    parser.add_argument("--threads", type=int, default=app.config.get("REPLAY_WORKERS", 1))
+    parser.add_argument("--metrics-port", type=int, default=app.config.get("REPLAY_WORKER_METRICS_PORT", 0),
+                        help="first port for the workers' /metrics endpoints, 0 to disable")
+    args = parser.parse_args()
+    if args.processes <= 1:
+        run_worker(0, args.threads, args.metrics_port)
+        return
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=run_worker, args=(i, args.threads, args.metrics_port), name=f"replay-worker-{i}")
+                 for i in range(args.processes)]
+    for process in processes:
+        process.start()
+    def on_signal(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for process in processes:
+        process.join()
+
+if __name__ == "__main__":
+    main()